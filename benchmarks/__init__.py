@@ -0,0 +1 @@
+"""Benchmarks for each stage of resolving undo commands, run with `python -m benchmarks`."""
@@ -0,0 +1,128 @@
+"""Run the benchmark suite, write the results as JSON, and compare them against a stored baseline.
+
+usage: python -m benchmarks [-k PATTERN] [-s SIZES] [-o FILE] [-b FILE] [--save-baseline] [-t THRESHOLD]
+
+The exit status is 1 if any benchmark is slower than its baseline by more than the threshold.
+"""
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+
+from benchmarks import cases
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# a single call taking longer than this many seconds is not repeated
+SLOW_CALL_SECONDS = 1.0
+
+
+def run_case(setup: cases.Setup, repeat: int) -> dict:
+    """Time a single benchmark case.
+
+    :param setup: the setup function of the case.
+    :param repeat: the amount of timings to take.
+    :return: the best and mean time per call in seconds, and the amount of calls per timing.
+    """
+    timer = timeit.Timer(setup())
+    number, elapsed = timer.autorange()
+
+    timings = [elapsed / number]
+
+    if timings[0] < SLOW_CALL_SECONDS:
+        timings += [i / number for i in timer.repeat(repeat - 1, number)]
+
+    return {"best": min(timings), "mean": statistics.mean(timings), "number": number, "repeat": len(timings)}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Print each result next to its baseline.
+
+    :return: the names of the benchmarks which regressed by more than threshold.
+    """
+    regressions = list()
+
+    print(f"{'benchmark':<40} {'baseline (us)':>14} {'current (us)':>14} {'change':>8}")
+
+    for name, result in results.items():
+        current = result["best"] * 1e6
+
+        if name not in baseline:
+            print(f"{name:<40} {'-':>14} {current:>14.1f} {'-':>8}")
+            continue
+
+        base = baseline[name]["best"] * 1e6
+        change = current / base - 1
+        flag = ""
+
+        if change > threshold:
+            regressions.append(name)
+            flag = " REGRESSION"
+
+        print(f"{name:<40} {base:>14.1f} {current:>14.1f} {change:>+7.0%}{flag}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[0])
+    parser.add_argument("-k", "--filter", metavar="PATTERN", default="*",
+                        help="only run the benchmarks whose name matches the glob PATTERN")
+    parser.add_argument("-s", "--sizes", default="10,1000,100000",
+                        help="comma separated amounts of entries in each synthetic registry")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="the amount of timings taken for each benchmark")
+    parser.add_argument("-o", "--output", metavar="FILE", help="write the results as JSON to FILE")
+    parser.add_argument("-b", "--baseline", metavar="FILE", default=BASELINE_PATH,
+                        help="the baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="replace the baseline results with the results of this run")
+    parser.add_argument("-t", "--threshold", type=float, default=0.25,
+                        help="the relative slowdown from the baseline reported as a regression")
+    namespace = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    sizes = [int(i) for i in namespace.sizes.split(",") if i]
+    results = dict()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, setup in cases.collect(sizes, workdir):
+            if fnmatch.fnmatch(name, namespace.filter):
+                print(f"running {name}", file=sys.stderr)
+                results[name] = run_case(setup, namespace.repeat)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    if namespace.output is not None:
+        with open(namespace.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    try:
+        with open(namespace.baseline) as file:
+            baseline = json.load(file)["results"]
+    except FileNotFoundError:
+        baseline = dict()
+
+    regressions = compare(results, baseline, namespace.threshold)
+
+    if namespace.save_baseline:
+        with open(namespace.baseline, "w") as file:
+            json.dump({**report, "results": {**baseline, **results}}, file, indent=2)
+
+    if regressions and not namespace.save_baseline:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {namespace.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
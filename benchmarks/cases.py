@@ -0,0 +1,346 @@
+"""The benchmark cases, each a setup function returning the function to time.
+
+Every stage of resolving an undo command is covered in isolation (tokenizer, expression and pattern parsers, matcher,
+expander, registry loading and resolution) and end to end, over the real coreutils undo files and synthetic registries
+and argument lists.
+"""
+import io
+import os
+import shlex
+import tempfile
+import typing
+
+import toml
+
+from undo import cache, expand, expression, pattern, resolve
+
+COREUTILS_UNDO_DIR = os.path.join(os.path.dirname(__file__), "..", "undos", "coreutils")
+
+COREUTILS_COMMANDS = [
+    "cp SRC DST",
+    "cp --no-clobber A B C DIR",
+    "mv -t DIR A B C",
+    "ln -s TARGET",
+    "install -d A B",
+    "mkdir -p A/B",
+    "unknown --flag",
+]
+
+# the amount of values in each long argument list
+LONG_ARGS = 10000
+
+# the amount of characters in each expression of the tokenizer scaling cases
+SCALING_CHARS = [100, 10_000, 1_000_000]
+
+Setup = typing.Callable[[], typing.Callable[[], typing.Any]]
+
+_tokenize = getattr(expression, "__tokenize")
+_separate = getattr(expand, "__separate")
+_parse_command_tokens = getattr(expression, "__parse_command_tokens")
+_UndoRegistry = getattr(resolve, "__UndoRegistry")
+
+
+def clear_parse_caches():
+    """Discard every parsed expression and pattern, so parsing and loading are measured without the parse caches."""
+    expression.PARSE_CACHE.clear()
+    pattern.ARGUMENT_PATTERN_CACHE.clear()
+    pattern.COMMAND_PATTERN_CACHE.clear()
+
+
+def uncached(f: typing.Callable[[], typing.Any]) -> typing.Callable[[], typing.Any]:
+    """Wrap a timed function so that every call starts without the parse caches."""
+    def timed():
+        clear_parse_caches()
+
+        return f()
+
+    return timed
+
+
+def load_coreutils() -> list[dict]:
+    """Load the raw data of every coreutils undo file."""
+    return [toml.load(os.path.join(COREUTILS_UNDO_DIR, path))
+            for path in sorted(os.listdir(COREUTILS_UNDO_DIR)) if path.endswith(".toml")]
+
+
+def coreutils_expressions() -> list[str]:
+    """Get every expression (without bounds) in the undo patterns of the coreutils undo files."""
+    return [segment[1:-1].strip() for data in load_coreutils() for entry in data["entry"]
+            for segment in _separate(entry["undo"], ("%", "%")) if segment.startswith("%")]
+
+
+def scaling_expression(chars: int) -> str:
+    """Generate an expression of roughly the given amount of characters, half of which are a single string expansion
+    and half a sequence of small tokens.
+    """
+    unit = "isdir($ARG) || "
+    expansion = "`$ARG`/" * (chars // 14)
+
+    return f'"{expansion}" || ' + unit * (chars // 2 // len(unit)) + "$ARG"
+
+
+def synthetic_registry(entries: int) -> str:
+    """Generate an undo file with the given amount of entries, spread over commands with 100 sub-commands each."""
+    return "".join(f"[[entry]]\n"
+                   f"cmd = 'tool{i // 100} sub{i % 100} [-f --force] [-t --target=DIR] <SRC...> <DST>'\n"
+                   f"undo = 'rm % isdir($DST) ? \"`$DST`/`basename($SRC)`\" : $DST %'\n"
+                   f"precise = true\n" for i in range(entries))
+
+
+def collect(sizes: list[int], workdir: str) -> typing.Iterator[tuple[str, Setup]]:
+    """Collect every benchmark case.
+
+    :param sizes: the amount of entries in each synthetic registry.
+    :param workdir: a directory which synthetic undo files may be written to.
+    :return: the name and setup function of each case.
+    """
+    yield "tokenizer/coreutils", setup_tokenize_coreutils
+    yield "tokenizer/long", setup_tokenize_long
+
+    for chars in SCALING_CHARS:
+        yield f"tokenizer/scaling-{chars}", lambda chars=chars: setup_tokenize_scaling(chars)
+
+    yield "expression-parser/coreutils", setup_parse_expression_coreutils
+    yield "expression-parser/nested-ternary", setup_parse_expression_nested_ternary
+    yield "expression-parser/long-chain", setup_parse_expression_long_chain
+    yield "expression-parser/long-arguments", setup_parse_expression_long_arguments
+    yield "expression-parser/coreutils-cached", setup_parse_expression_coreutils_cached
+    yield "expression-evaluate/coreutils", setup_evaluate_expression_coreutils
+    yield "expression-evaluate/long-args", setup_evaluate_expression_long_args
+    yield "expression-evaluate/broadcast", setup_evaluate_expression_broadcast
+    yield "pattern-parser/coreutils", setup_parse_pattern_coreutils
+    yield "pattern-parser/long", setup_parse_pattern_long
+    yield "pattern-parser/coreutils-cached", setup_parse_pattern_coreutils_cached
+    yield "matcher/coreutils", setup_match_coreutils
+    yield "matcher/long-args", setup_match_long_args
+    yield "separate/large", setup_separate_large
+    yield "separate/nested", setup_separate_nested
+    yield "expander/coreutils", setup_expand_coreutils
+    yield "expander/long-args", setup_expand_long_args
+    yield "expander/iter-long-args", setup_iter_expand_long_args
+    yield "registry-load/coreutils", setup_load_coreutils
+    yield "resolver/coreutils", setup_resolve_coreutils
+
+    for size in sizes:
+        yield f"registry-load/synthetic-{size}", lambda size=size: setup_load_synthetic(size)
+        yield f"resolver/synthetic-{size}", lambda size=size: setup_resolve_synthetic(size)
+
+    yield "end-to-end/coreutils-uncached", lambda: setup_end_to_end(None)
+    yield "end-to-end/coreutils-cached", lambda: setup_end_to_end(os.path.join(workdir, "cache"))
+    yield "end-to-end/coreutils-resolver", setup_end_to_end_resolver
+    yield "end-to-end/long-args", setup_end_to_end_long_args
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Stages                                                                      #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def setup_tokenize_coreutils():
+    expressions = coreutils_expressions()
+
+    return lambda: [_tokenize(i) for i in expressions]
+
+
+def setup_tokenize_long():
+    content = " || ".join(f"isdir($ARG{i})" for i in range(1000))
+
+    return lambda: _tokenize(content)
+
+
+def setup_tokenize_scaling(chars: int):
+    content = scaling_expression(chars)
+
+    return lambda: _tokenize(content)
+
+
+def setup_parse_expression_coreutils():
+    expressions = coreutils_expressions()
+
+    return uncached(lambda: [expression.parse(i) for i in expressions])
+
+
+def setup_parse_expression_coreutils_cached():
+    expressions = coreutils_expressions()
+
+    return lambda: [expression.parse(i) for i in expressions]
+
+
+def setup_parse_expression_nested_ternary():
+    # each level nests in both the if and else value, below the default recursion limit
+    content = "".join(f"A{i} ? isdir($B) ? $C : " for i in range(100)) + "$D" + " : $E" * 100
+
+    return uncached(lambda: expression.parse(content))
+
+
+def setup_parse_expression_long_chain():
+    content = " && ".join(f"!A{i} || isdir($B{i})" for i in range(500)) + " ? $C : join($D..., ' ')"
+
+    return uncached(lambda: expression.parse(content))
+
+
+def setup_parse_expression_long_arguments():
+    tokens = _tokenize("join(" + ", ".join(f"$ARG{i}" for i in range(LONG_ARGS)) + ")")
+
+    return lambda: _parse_command_tokens(tokens)
+
+
+def setup_evaluate_expression_coreutils():
+    compiled = [expression.parse(i).compile() for i in coreutils_expressions()]
+    env = {"SRC": ["a", "b"], "DEST": "dir", "DST": "dir", "TARGET": "target", "TARGET_DIRECTORY": "dir",
+           "DIRECTORY": ["c", "d"], "NAME": ["e", "f"], "FILE2": "file"}
+
+    return lambda: [f(env) for f in compiled]
+
+
+def setup_evaluate_expression_long_args():
+    compiled = expression.parse("isdir($DST) ? basename($SRC...) : dirname($SRC...)").compile()
+    env = {"SRC": [f"dir/file-{i}" for i in range(LONG_ARGS)], "DST": "dir"}
+
+    return lambda: compiled(env)
+
+
+def setup_evaluate_expression_broadcast():
+    compiled = expression.parse('"`$DST`/`basename($SRC)`"').compile()
+    env = {"SRC": [f"dir/file-{i}" for i in range(LONG_ARGS)], "DST": "dir"}
+
+    return lambda: compiled(env)
+
+
+def setup_parse_pattern_coreutils():
+    cmds = [entry["cmd"] for data in load_coreutils() for entry in data["entry"]]
+
+    return uncached(lambda: [pattern.parse_command_pattern(i) for i in cmds])
+
+
+def setup_parse_pattern_coreutils_cached():
+    cmds = [entry["cmd"] for data in load_coreutils() for entry in data["entry"]]
+
+    return lambda: [pattern.parse_command_pattern(i) for i in cmds]
+
+
+def setup_parse_pattern_long():
+    # digits are parsed as quantifiers, so each option is named by letters only
+    names = [f"{a}{b}" for a in "abcdefghij" for b in "abcdefghijklmnopqrst"]
+    cmd = "tool " + " ".join(f"[--{i}=VALUE_{i.upper()}]" for i in names) + " <SRC...> <DST>"
+
+    return uncached(lambda: pattern.parse_command_pattern(cmd))
+
+
+def setup_match_coreutils():
+    matchers = list()
+
+    for data in load_coreutils():
+        common = pattern.parse_argument_group_pattern(f"({data.get('common', '')})")[0].args
+
+        for entry in data["entry"]:
+            cmd_pattern = pattern.parse_command_pattern(entry["cmd"])
+            cmd_pattern = cmd_pattern.with_arguments(common)
+            matchers.append(pattern.pattern_to_matcher(cmd_pattern))
+
+    argvs = [shlex.split(i) for i in COREUTILS_COMMANDS]
+
+    return lambda: [m.match(argv[1:]) for argv in argvs for m in matchers if m.command == argv[0]]
+
+
+def setup_match_long_args():
+    matcher = pattern.pattern_to_matcher(pattern.parse_command_pattern("cp [-f --force] <SRC...> <DST>"))
+    argv = ["-f"] + [f"file-{i}" for i in range(LONG_ARGS)] + ["dir"]
+
+    return lambda: matcher.match(argv)
+
+
+def setup_separate_large():
+    # a template of roughly 64KB with 2,000 expressions
+    content = " ".join(f"--opt{i} % isdir($DST) ? \"`$DST`/`basename($SRC)`\" : $DST %" for i in range(2000))
+
+    return lambda: _separate(content, ("%", "%"))
+
+
+def setup_separate_nested():
+    content = " ".join("$(a $(b $(c) d) e)" for _ in range(2000))
+
+    return lambda: _separate(content, ("$(", ")"))
+
+
+def setup_expand_coreutils():
+    undo = expand.UndoTemplate('mv % isdir($DST) ? "`$DST`/`basename($SRC)`" : $DST % % $SRC %', ("%", "%"))
+    env = {"SRC": ["a", "b", "c"], "DST": "dir"}
+
+    return lambda: expand.expand(undo, env, ("%", "%"), "; ")
+
+
+def setup_expand_long_args():
+    undo = expand.UndoTemplate("rm % join(\"`$DST`/`basename($SRC)`\", ' ') %", ("%", "%"))
+    env = {"SRC": [f"file-{i}" for i in range(LONG_ARGS)], "DST": "dir"}
+
+    return lambda: expand.expand(undo, env, ("%", "%"), "; ")
+
+
+def setup_iter_expand_long_args():
+    undo = expand.UndoTemplate('mv % "`$DST`/`basename($SRC)`" % % $SRC %', ("%", "%"))
+    env = {"SRC": [f"file-{i}" for i in range(LONG_ARGS)], "DST": "dir"}
+
+    return lambda: sum(len(i) for i in undo.iter_render(env))
+
+
+def setup_load_coreutils():
+    paths = [os.path.join(COREUTILS_UNDO_DIR, i) for i in sorted(os.listdir(COREUTILS_UNDO_DIR)) if i.endswith(".toml")]
+
+    return uncached(lambda: [_UndoRegistry(i) for i in paths])
+
+
+def setup_resolve_coreutils():
+    registries = [_UndoRegistry(os.path.join(COREUTILS_UNDO_DIR, i))
+                  for i in sorted(os.listdir(COREUTILS_UNDO_DIR)) if i.endswith(".toml")]
+
+    return lambda: [registry.resolve(command, True) for command in COREUTILS_COMMANDS for registry in registries]
+
+
+def setup_load_synthetic(size: int):
+    content = synthetic_registry(size)
+
+    return uncached(lambda: _UndoRegistry(io.StringIO(content)))
+
+
+def setup_resolve_synthetic(size: int):
+    registry = _UndoRegistry(io.StringIO(synthetic_registry(size)))
+    last = size - 1
+    commands = [f"tool{last // 100} sub{last % 100} -f a b dir", "tool0 sub0 a b", "tool0 unknown a b"]
+
+    return lambda: [registry.resolve(command, True) for command in commands]
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# End to end                                                                  #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+def __end_to_end(command: str, include_dirs: list[str], registry_cache: typing.Optional[cache.Cache]) -> list[str]:
+    resolved = resolve.resolve(command, include_dirs, True, True, "bash", registry_cache)
+
+    return expand.expand_resolved(resolved, ("%", "%"), "; ")
+
+
+def setup_end_to_end(cache_dir: typing.Optional[str]):
+    registry_cache = None if cache_dir is None else cache.Cache(cache_dir)
+
+    # populate the cache so only cached runs are measured
+    __end_to_end(COREUTILS_COMMANDS[0], [COREUTILS_UNDO_DIR], registry_cache)
+
+    run = lambda: [__end_to_end(i, [COREUTILS_UNDO_DIR], registry_cache) for i in COREUTILS_COMMANDS]
+
+    # without a registry cache every run parses the undo files, as a new process would
+    return run if registry_cache is not None else uncached(run)
+
+
+def setup_end_to_end_resolver():
+    resolver = resolve.Resolver([COREUTILS_UNDO_DIR])
+
+    return lambda: [expand.expand_resolved(resolver.resolve(i, True, True, "bash"), ("%", "%"), "; ")
+                    for i in COREUTILS_COMMANDS]
+
+
+def setup_end_to_end_long_args():
+    resolver = resolve.Resolver([COREUTILS_UNDO_DIR])
+    command = shlex.join(["mv"] + [f"file-{i}" for i in range(LONG_ARGS)] + [tempfile.gettempdir()])
+
+    return lambda: expand.expand_resolved(resolver.resolve(command, True, True, "bash"), ("%", "%"), "; ")
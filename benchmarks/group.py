@@ -0,0 +1,77 @@
+"""Compare the per-command cost of trying every matcher for a command against selecting candidates with a
+MatcherGroup, for a generated CLI with many entries which differ only in a few options.
+
+usage: python benchmarks/group.py [-n NUMBER] [-e ENTRIES]
+"""
+import argparse
+import os
+import shlex
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from undo import pattern  # noqa: E402
+
+COMMON = "[-v --verbose] [-q --quiet] [--config=FILE] [--color[=WHEN]]"
+
+
+def generate_patterns(count: int) -> list[pattern.CommandPattern]:
+    """Generate entries which each require their own option, with a varying amount of positional arguments."""
+    common = pattern.parse_argument_group_pattern(f"({COMMON})")[0].args
+    patterns = list()
+
+    for i in range(count):
+        positionals = " ".join(f"<ARG{j}>" for j in range(i % 3 + 1))
+        cmd_pattern = pattern.parse_command_pattern(f"tool <--action{i}> [--option{i}=VALUE] {positionals}")
+        cmd_pattern = cmd_pattern.with_arguments(common)
+
+        patterns.append(cmd_pattern)
+
+    return patterns
+
+
+def match_linear(matchers: list[pattern.CommandMatcher], command: str):
+    cmd, *argv = shlex.split(command)
+
+    return [i for i, matcher in enumerate(matchers) if matcher.command == cmd and matcher.match(argv) is not None]
+
+
+def match_group(group: pattern.MatcherGroup, command: str):
+    cmd, *argv = shlex.split(command)
+
+    return [i for i, _ in group.match(argv)] if group.command == cmd else list()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=100, help="the amount of times to match each command")
+    parser.add_argument("-e", "--entries", type=int, default=500, help="the amount of generated entries")
+    namespace = parser.parse_args()
+
+    matchers = [pattern.pattern_to_matcher(p) for p in generate_patterns(namespace.entries)]
+    group = pattern.MatcherGroup(matchers)
+
+    last = namespace.entries - 1
+    commands = [
+        "tool --action0 A",
+        f"tool -v --action{last} --option{last}=X {' '.join(['A'] * (last % 3 + 1))}",
+        "tool --action1 A B C D",
+        "tool --unknown A",
+        "tool --verbose A",
+    ]
+
+    print(f"{'command':<48} {'linear (us)':>12} {'group (us)':>12} {'speedup':>8}")
+
+    for command in commands:
+        assert match_linear(matchers, command) == match_group(group, command)
+
+        before = timeit.timeit(lambda: match_linear(matchers, command), number=namespace.number)
+        after = timeit.timeit(lambda: match_group(group, command), number=namespace.number)
+
+        print(f"{command[:48]:<48} {before / namespace.number * 1e6:>12.1f} {after / namespace.number * 1e6:>12.1f} "
+              f"{before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare the per-command cost of matching argv against every coreutils command pattern with an ArgumentParser
+versus the purpose-built CommandMatcher, both built once ahead of time.
+
+usage: python benchmarks/matcher.py [-n NUMBER]
+"""
+import argparse
+import logging
+import os
+import shlex
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from undo import pattern  # noqa: E402
+
+COREUTILS_UNDO_DIR = os.path.join(os.path.dirname(__file__), "..", "undos", "coreutils")
+
+COMMANDS = [
+    "cp SRC DST",
+    "cp --no-clobber A B C DIR",
+    "mv -t DIR A B C",
+    "ln -s TARGET",
+    "install -d A B",
+    "mkdir -p A/B",
+    "mkdir --unknown A",
+]
+
+
+def load_patterns() -> list[pattern.CommandPattern]:
+    """Load the command pattern, including its common arguments, of every coreutils entry."""
+    import toml
+
+    patterns = list()
+
+    for path in sorted(os.listdir(COREUTILS_UNDO_DIR)):
+        if path.endswith(".toml"):
+            data = toml.load(os.path.join(COREUTILS_UNDO_DIR, path))
+            common = pattern.parse_argument_group_pattern(f"({data.get('common', '')})")[0].args
+
+            for entry in data.get("entry", list()):
+                cmd_pattern = pattern.parse_command_pattern(entry["cmd"])
+                cmd_pattern = cmd_pattern.with_arguments(common)
+                patterns.append(cmd_pattern)
+
+    return patterns
+
+
+def match_argparse(parsers: list[argparse.ArgumentParser], command: str):
+    cmd, *argv = shlex.split(command)
+
+    for parser in parsers:
+        if parser.prog == cmd:
+            try:
+                parser.parse_args(argv)
+            except argparse.ArgumentError:
+                pass
+
+
+def match_matcher(matchers: list[pattern.CommandMatcher], command: str):
+    cmd, *argv = shlex.split(command)
+
+    for matcher in matchers:
+        if matcher.command == cmd:
+            matcher.match(argv)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=1000, help="the amount of times to match each command")
+    namespace = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    patterns = load_patterns()
+    parsers = [pattern.pattern_to_argparse(p) for p in patterns]
+    matchers = [pattern.pattern_to_matcher(p) for p in patterns]
+
+    print(f"{'command':<32} {'argparse (us)':>14} {'matcher (us)':>14} {'speedup':>8}")
+
+    for command in COMMANDS:
+        before = timeit.timeit(lambda: match_argparse(parsers, command), number=namespace.number)
+        after = timeit.timeit(lambda: match_matcher(matchers, command), number=namespace.number)
+
+        print(f"{command:<32} {before / namespace.number * 1e6:>14.1f} {after / namespace.number * 1e6:>14.1f} "
+              f"{before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare the per-command cost of resolving against the coreutils undo files when every entry's command pattern is
+parsed and converted to an ArgumentParser on each call (the original behaviour) versus reusing the parsed pattern and
+parser stored on each registry entry.
+
+usage: python benchmarks/registry.py [-n NUMBER]
+"""
+import argparse
+import logging
+import os
+import shlex
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from undo import pattern, resolve  # noqa: E402
+
+COREUTILS_UNDO_DIR = os.path.join(os.path.dirname(__file__), "..", "undos", "coreutils")
+
+COMMANDS = [
+    "cp SRC DST",
+    "cp --no-clobber A B C DIR",
+    "mv -t DIR A B C",
+    "ln -s TARGET",
+    "install -d A B",
+    "mkdir -p A/B",
+    "unknown --flag",
+]
+
+
+def load_registries() -> list:
+    return [getattr(resolve, "__UndoRegistry")(os.path.join(COREUTILS_UNDO_DIR, path))
+            for path in sorted(os.listdir(COREUTILS_UNDO_DIR)) if path.endswith(".toml")]
+
+
+def load_raw_entries() -> list[(str, str)]:
+    """Load the raw command pattern and common arguments for every coreutils entry."""
+    import toml
+
+    entries = list()
+
+    for path in sorted(os.listdir(COREUTILS_UNDO_DIR)):
+        if path.endswith(".toml"):
+            data = toml.load(os.path.join(COREUTILS_UNDO_DIR, path))
+            entries += [(entry["cmd"], data.get("common", "")) for entry in data.get("entry", list())]
+
+    return entries
+
+
+def resolve_per_call(entries: list[(str, str)], command: str):
+    """Resolve a command by parsing every pattern and building every parser on each call."""
+    cmd, *argv = shlex.split(command)
+
+    for cmd_pattern, common in entries:
+        cmd_pattern = pattern.parse_command_pattern(cmd_pattern)
+        cmd_pattern = cmd_pattern.with_arguments(pattern.parse_argument_group_pattern(f"({common})")[0].args)
+        parser = pattern.pattern_to_argparse(cmd_pattern)
+
+        if parser.prog == cmd:
+            try:
+                parser.parse_args(argv)
+            except argparse.ArgumentError:
+                pass
+
+
+def resolve_compiled(registries: list, command: str):
+    """Resolve a command against registries whose entries keep their parsed pattern and matcher."""
+    for registry in registries:
+        registry.resolve(command, True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=200, help="the amount of times to resolve each command")
+    namespace = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    entries = load_raw_entries()
+    registries = load_registries()
+
+    print(f"{'command':<32} {'per-call (us)':>14} {'compiled (us)':>14} {'speedup':>8}")
+
+    for command in COMMANDS:
+        before = timeit.timeit(lambda: resolve_per_call(entries, command), number=namespace.number)
+        after = timeit.timeit(lambda: resolve_compiled(registries, command), number=namespace.number)
+
+        print(f"{command:<32} {before / namespace.number * 1e6:>14.1f} {after / namespace.number * 1e6:>14.1f} "
+              f"{before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Show the per-character cost of tokenizing expressions from 100 characters to 1 MB, which should stay constant as
+the tokenizer runs in linear time.
+
+usage: python benchmarks/tokenizer.py [-n NUMBER]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks import cases  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=5, help="the amount of times to tokenize each expression")
+    namespace = parser.parse_args()
+
+    print(f"{'chars':>10} {'tokens':>8} {'total (ms)':>12} {'per char (ns)':>14}")
+
+    for chars in [100, 1_000, 10_000, 100_000, 1_000_000]:
+        content = cases.scaling_expression(chars)
+        tokens = len(cases._tokenize(content))
+
+        elapsed = min(timeit.repeat(lambda: cases._tokenize(content), number=namespace.number, repeat=3))
+        elapsed /= namespace.number
+
+        print(f"{len(content):>10} {tokens:>8} {elapsed * 1e3:>12.3f} {elapsed / len(content) * 1e9:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
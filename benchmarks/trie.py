@@ -0,0 +1,76 @@
+"""Compare the per-command cost of trying every matcher for a command against dispatching through a MatcherTrie, for
+a generated CLI with 1,000 sub-command entries spread over two levels of sub-commands.
+
+usage: python benchmarks/trie.py [-n NUMBER] [-e ENTRIES] [-w WIDTH]
+"""
+import argparse
+import os
+import shlex
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from undo import pattern  # noqa: E402
+
+COMMON = "[-v --verbose] [-q --quiet] [--config=FILE]"
+
+
+def generate_patterns(count: int, width: int) -> list[pattern.CommandPattern]:
+    """Generate entries for 'tool GROUP ACTION', with width actions per group."""
+    common = pattern.parse_argument_group_pattern(f"({COMMON})")[0].args
+    patterns = list()
+
+    for i in range(count):
+        cmd_pattern = pattern.parse_command_pattern(f"tool group{i // width} action{i % width} [-f --force] <NAME>")
+        cmd_pattern = cmd_pattern.with_arguments(common)
+
+        patterns.append(cmd_pattern)
+
+    return patterns
+
+
+def match_linear(matchers: list[pattern.CommandMatcher], command: str):
+    cmd, *argv = shlex.split(command)
+
+    return [i for i, matcher in enumerate(matchers) if matcher.command == cmd and matcher.match(argv) is not None]
+
+
+def match_trie(trie: pattern.MatcherTrie, command: str):
+    cmd, *argv = shlex.split(command)
+
+    return [i for i, _ in trie.match(cmd, argv)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=100, help="the amount of times to match each command")
+    parser.add_argument("-e", "--entries", type=int, default=1000, help="the amount of generated entries")
+    parser.add_argument("-w", "--width", type=int, default=20, help="the amount of actions per group")
+    namespace = parser.parse_args()
+
+    matchers = [pattern.pattern_to_matcher(p) for p in generate_patterns(namespace.entries, namespace.width)]
+    trie = pattern.MatcherTrie(matchers)
+
+    last = namespace.entries - 1
+    commands = [
+        "tool group0 action0 NAME",
+        f"tool group{last // namespace.width} action{last % namespace.width} -f NAME",
+        "tool group0 unknown NAME",
+        "tool unknown",
+    ]
+
+    print(f"{'command':<40} {'linear (us)':>12} {'trie (us)':>12} {'speedup':>8}")
+
+    for command in commands:
+        assert match_linear(matchers, command) == match_trie(trie, command)
+
+        before = timeit.timeit(lambda: match_linear(matchers, command), number=namespace.number)
+        after = timeit.timeit(lambda: match_trie(trie, command), number=namespace.number)
+
+        print(f"{command:<40} {before / namespace.number * 1e6:>12.1f} {after / namespace.number * 1e6:>12.1f} "
+              f"{before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 from .test_pattern import *
+from .test_batch import *
 from .test_expand import *
 from .test_expression import *
+from .test_fs import *
+from .test_cache import *
+from .test_analysis import *
+from .test_daemon import *
 from .test_history import *
+from .test_lru import *
 from .test_resolve import *
 from .test_undo import *
 from .test_undos import *
+from .test_watch import *
@@ -0,0 +1,117 @@
+import os
+import unittest
+
+from undo import analysis
+from undo import expand
+from undo import expression
+from undo import fs
+
+
+def template(undo: str) -> expand.UndoTemplate:
+    return expand.UndoTemplate(undo, ("%", "%"))
+
+
+class TestAnalyze(unittest.TestCase):
+    def test_literal(self):
+        actual = analysis.analyze(template("untest"))
+
+        self.assertEqual(analysis.Analysis(frozenset(), frozenset(), frozenset(), tuple(), tuple()), actual)
+
+    def test_ternary(self):
+        actual = analysis.analyze(template('mv % isdir($DST) ? "`$DST`/`basename($SRC)`" : $DST % % $SRC %'))
+
+        self.assertSetEqual({"DST", "SRC"}, actual.identifiers)
+        self.assertSetEqual({"DST", "SRC"}, actual.required)
+        self.assertSetEqual({"DST", "SRC"}, actual.unexpanded)
+        self.assertListEqual(["isdir($DST)"], [analysis.describe_check(i) for i in actual.checks])
+        self.assertEqual(actual.checks, actual.required_checks)
+
+    def test_branches_not_required(self):
+        actual = analysis.analyze(template("un-foo % VERBOSE ? $LEVEL : $OTHER %"))
+
+        self.assertSetEqual({"VERBOSE", "LEVEL", "OTHER"}, actual.identifiers)
+        self.assertSetEqual(set(), actual.required)
+
+    def test_chained_checks_not_required(self):
+        actual = analysis.analyze(template("un-foo % A && exists($B) ? 'a' %"))
+
+        self.assertSetEqual({"A", "B"}, actual.identifiers)
+        self.assertSetEqual(set(), actual.required)
+        self.assertEqual(1, len(actual.checks))
+        self.assertEqual(tuple(), actual.required_checks)
+
+    def test_list_valued(self):
+        self.assertTrue(analysis.analyze(template("rm % $SRC %")).is_list_valued({"SRC"}))
+        self.assertFalse(analysis.analyze(template("rm % $SRC %")).is_list_valued({"DST"}))
+        self.assertFalse(analysis.analyze(template("rm % $SRC... %")).is_list_valued({"SRC"}))
+        self.assertFalse(analysis.analyze(template("rm % join($SRC, ' ') %")).is_list_valued({"SRC"}))
+        self.assertFalse(analysis.analyze(template("rm % isdir($SRC) ? 'a' %")).is_list_valued({"SRC"}))
+        self.assertTrue(analysis.analyze(template("rm % basename($SRC) %")).is_list_valued({"SRC"}))
+
+    def test_iter_check_paths(self):
+        actual = analysis.analyze(template("rm % exists($SRC) && exists($DST) ? 'a' % % isdir(dirname($SRC)) ? 'b' %"))
+        env = {"SRC": ["a/b", "c/d"]}
+
+        self.assertListEqual(["a", "c"], list(actual.iter_check_paths(env)))
+        self.assertDictEqual({"SRC": ["a/b", "c/d"]}, env)
+
+    def test_iter_check_paths_list_expanded(self):
+        actual = analysis.analyze(template("rm % isdir($SRC...) ? 'a' %"))
+
+        self.assertListEqual(["dir", "d2"], list(actual.iter_check_paths({"SRC": ["dir", "d2"]})))
+
+    def test_list_expanded_check_prefetched(self):
+        undo = template("rm % isdir($SRC...) ? 'a' : 'b' %")
+        env = {"SRC": [os.curdir, os.pardir]}
+
+        with fs.stat_cache() as stats:
+            fs.prefetch(analysis.analyze(undo).iter_check_paths(env))
+
+            self.assertEqual("rm a", undo.render(env))
+
+        self.assertEqual(2, stats.misses)
+        self.assertGreater(stats.hits, 0)
+
+
+class TestDescribe(unittest.TestCase):
+    def test_round_trip(self):
+        contents = [
+            "$A",
+            "$A...",
+            "'literal'",
+            "\"`$A`/`$B`\"",
+            "dirname($A)",
+            "join($A, ', ')",
+            "A ? $A",
+            "!A && isdir($B) || !exists($C...) ? $A : 'b'",
+        ]
+
+        for content in contents:
+            with self.subTest(content=content):
+                self.assertEqual(content, analysis.describe(expression.parse(content)))
+
+
+class TestExplain(unittest.TestCase):
+    def test_explain(self):
+        directory = os.path.dirname(__file__)
+        undo = template('mv % isdir($DST) ? "`$DST`/`basename($SRC)`" : $DST % % $SRC %')
+
+        expected = "\n".join([
+            "undo: mv % isdir($DST) ? \"`$DST`/`basename($SRC)`\" : $DST % % $SRC %",
+            "  reads: DST, SRC",
+            "  requires: DST, SRC",
+            "  filesystem checks: isdir($DST)",
+            "  list valued: yes (SRC)",
+            f"  expands to: mv {directory}/a a; mv {directory}/b b",
+        ])
+
+        self.assertEqual(expected, analysis.explain({"SRC": ["a", "b"], "DST": directory}, undo))
+
+    def test_explain_not_bound(self):
+        actual = analysis.explain({"SRC": "a", "DST": None}, template("mv % $DST % % $SRC %"))
+
+        self.assertIn("  requires: DST, SRC (DST not bound)", actual.splitlines())
+
+
+if __name__ == "__main__":
+    unittest.main()
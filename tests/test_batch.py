@@ -0,0 +1,85 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from undo import batch
+from undo import resolve
+from undo import watch
+
+RESOURCE_DIR_PATH = os.path.join(os.path.dirname(__file__), "resources")
+
+
+class TestReadCommands(unittest.TestCase):
+    def test_newline_delimited(self):
+        stream = io.StringIO("cp a b\n\nmv a b\nrm c")
+
+        self.assertListEqual(["cp a b", "mv a b", "rm c"], list(batch.read_commands(stream)))
+
+    def test_nul_delimited(self):
+        stream = io.StringIO("echo 'a\nb'\0\0mv a b\0")
+
+        self.assertListEqual(["echo 'a\nb'", "mv a b"], list(batch.read_commands(stream, "\0")))
+
+    def test_nul_delimited_across_chunks(self):
+        commands = [f"touch file-{i}" for i in range(10000)]
+        stream = io.StringIO("\0".join(commands))
+
+        self.assertListEqual(commands, list(batch.read_commands(stream, "\0")))
+
+
+class TestResolveBatch(unittest.TestCase):
+    INCLUDE_DIRS = [os.path.join(RESOURCE_DIR_PATH, "search_all")]
+
+    def setUp(self):
+        self.resolver = resolve.Resolver(self.INCLUDE_DIRS, watcher=watch.Watcher(self.INCLUDE_DIRS))
+
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+        with open(os.path.join(self.dir, "env.toml"), "w") as file:
+            file.write("[[entry]]\ncmd = 'test'\nundo = \"untest % env('UNDO_TEST_VALUE') %\"\nprecise = true\n")
+
+    def test_resolve_batch(self):
+        expected = [
+            {"command": "test", "matches": [{"env": dict(), "undo": "untest"}], "undos": ["untest"]},
+            {"command": "no_match", "matches": [], "undos": []},
+            {"command": "test 'unclosed", "error": "No closing quotation"},
+        ]
+
+        actual = list(batch.resolve_batch(["test", "no_match", "test 'unclosed"], self.resolver, False, False, "bash"))
+
+        self.assertListEqual(expected, actual)
+
+    def test_snapshot_env(self):
+        resolver = resolve.Resolver([self.dir], watcher=watch.Watcher([self.dir]))
+
+        actual = list(batch.resolve_batch(["test"], resolver, False, False, "bash", {"UNDO_TEST_VALUE": "snapshot"}))
+
+        self.assertListEqual(["untest snapshot"], actual[0]["undos"])
+        self.assertEqual("untest % env('UNDO_TEST_VALUE') %", actual[0]["matches"][0]["undo"])
+
+    def test_expand_error(self):
+        with open(os.path.join(self.dir, "unset.toml"), "w") as file:
+            file.write("[[entry]]\ncmd = 'unset'\nundo = \"unset % join(env('UNDO_UNSET_VALUE'), ' ') %\"\n"
+                       "precise = true\n")
+
+        resolver = resolve.Resolver([self.dir], watcher=watch.Watcher([self.dir]))
+
+        actual = list(batch.resolve_batch(["unset", "test"], resolver, False, False, "bash",
+                                          {"UNDO_TEST_VALUE": "snapshot"}))
+
+        self.assertListEqual(["unset", "test"], [i["command"] for i in actual])
+        self.assertIn("error", actual[0])
+        self.assertListEqual(["untest snapshot"], actual[1]["undos"])
+
+    def test_registries_loaded_once(self):
+        for _ in batch.resolve_batch(["test"] * 100, self.resolver, True, False, "bash"):
+            pass
+
+        self.assertEqual(2, self.resolver.reloads)
+
+
+if __name__ == "__main__":
+    unittest.main()
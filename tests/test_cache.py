@@ -0,0 +1,181 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from undo import cache
+from undo import expression
+from undo import resolve
+
+RESOURCE_DIR_PATH = os.path.join(os.path.dirname(__file__), "resources")
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+        self.source = os.path.join(self.cache_dir, "source.toml")
+
+        with open(self.source, "w") as file:
+            file.write("")
+
+    def test_miss_then_hit(self):
+        c = cache.Cache(self.cache_dir)
+        signature = cache.file_signature(self.source)
+
+        self.assertIsNone(c.load(self.source, signature))
+
+        c.store(self.source, signature, ["data"])
+
+        self.assertEqual(["data"], c.load(self.source, signature))
+        self.assertEqual(1, c.hits)
+        self.assertEqual(1, c.misses)
+
+    def test_stale_signature(self):
+        c = cache.Cache(self.cache_dir)
+
+        c.store(self.source, (0, 0, 0), ["data"])
+
+        self.assertIsNone(c.load(self.source, cache.file_signature(self.source)))
+        self.assertEqual(1, c.misses)
+
+    def test_functions_changed(self):
+        c = cache.Cache(self.cache_dir)
+        signature = cache.file_signature(self.source)
+
+        c.store(self.source, signature, ["data"])
+
+        expression.register_function(expression.Function("stem", 1, expression.ReturnKind.VALUE, True,
+                                                         expression.mapped(str.upper)))
+        self.addCleanup(expression.unregister_function, "stem")
+
+        self.assertIsNone(c.load(self.source, signature))
+
+    def test_rebuild(self):
+        signature = cache.file_signature(self.source)
+
+        cache.Cache(self.cache_dir).store(self.source, signature, ["data"])
+
+        c = cache.Cache(self.cache_dir, rebuild=True)
+
+        self.assertIsNone(c.load(self.source, signature))
+
+    def test_unwritable_cache_dir(self):
+        c = cache.Cache(os.path.join(self.source, "not_a_directory"))
+        signature = cache.file_signature(self.source)
+
+        c.store(self.source, signature, ["data"])
+
+        self.assertIsNone(c.load(self.source, signature))
+
+
+class TestResolveWithCache(unittest.TestCase):
+    TEST_SEARCH_ALL_DIR = os.path.join(RESOURCE_DIR_PATH, "search_all")
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_cached_resolution(self):
+        expected = resolve.resolve("test", [self.TEST_SEARCH_ALL_DIR], True, False, "bash")
+
+        cold = cache.Cache(self.cache_dir)
+        self.assertListEqual(expected, resolve.resolve("test", [self.TEST_SEARCH_ALL_DIR], True, False, "bash", cold))
+        self.assertLess(0, cold.misses)
+
+        warm = cache.Cache(self.cache_dir)
+        self.assertListEqual(expected, resolve.resolve("test", [self.TEST_SEARCH_ALL_DIR], True, False, "bash", warm))
+        self.assertEqual(0, warm.misses)
+
+
+class TestCommandIndex(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+        self.include_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.include_dir)
+
+        self.write("a.toml", "test", "untest")
+        self.write("b.toml", "other", "unother")
+
+    def write(self, name: str, cmd: str, undo: str):
+        with open(os.path.join(self.include_dir, name), "w") as file:
+            file.write(f"[[entry]]\ncmd = '{cmd}'\nundo = '{undo}'\nprecise = true\n")
+
+    def resolve(self, command: str) -> list:
+        return resolve.resolve(command, [self.include_dir], True, False, "bash", cache.Cache(self.cache_dir))
+
+    def test_only_matching_files_loaded(self):
+        self.resolve("test")
+
+        c = cache.Cache(self.cache_dir)
+        actual = resolve.resolve("test", [self.include_dir], True, False, "bash", c)
+
+        self.assertListEqual([(dict(), "untest")], actual)
+
+        # one hit for the directory index and one for the only file with a 'test' entry
+        self.assertEqual(2, c.hits)
+
+    def test_new_file(self):
+        self.assertListEqual([], self.resolve("new"))
+
+        self.write("c.toml", "new", "unnew")
+
+        # creating a file may not change the directory mtime within its resolution on every filesystem
+        os.utime(self.include_dir, ns=(0, 0))
+
+        self.assertListEqual([(dict(), "unnew")], self.resolve("new"))
+
+    def test_edited_file(self):
+        self.assertListEqual([(dict(), "untest")], self.resolve("test"))
+
+        with open(os.path.join(self.include_dir, "a.toml"), "a") as file:
+            file.write("[[entry]]\ncmd = 'test'\nundo = 'untest again'\nprecise = true\n")
+
+        self.assertListEqual([(dict(), "untest"), (dict(), "untest again")], self.resolve("test"))
+
+    def test_edited_file_new_command(self):
+        self.assertListEqual([], self.resolve("new"))
+
+        with open(os.path.join(self.include_dir, "a.toml"), "a") as file:
+            file.write("[[entry]]\ncmd = 'new'\nundo = 'unnew'\nprecise = true\n")
+
+        self.assertListEqual([(dict(), "unnew")], self.resolve("new"))
+
+    def test_fixed_file(self):
+        with open(os.path.join(self.include_dir, "c.toml"), "w") as file:
+            file.write("[[entry]\n")
+
+        self.assertListEqual([], self.resolve("new"))
+
+        with open(os.path.join(self.include_dir, "c.toml"), "w") as file:
+            file.write("[[entry]]\ncmd = 'new'\nundo = 'unnew'\nprecise = true\n")
+
+        self.assertListEqual([(dict(), "unnew")], self.resolve("new"))
+
+    def test_edited_later_candidate(self):
+        self.write("b.toml", "test", "untest b")
+
+        self.assertListEqual([(dict(), "untest"), (dict(), "untest b")], self.resolve("test"))
+
+        with open(os.path.join(self.include_dir, "b.toml"), "a") as file:
+            file.write("\n")
+
+        actual = self.resolve("test")
+
+        self.assertEqual(2, len(actual))
+        self.assertSetEqual({"untest", "untest b"}, {undo for _, undo in actual})
+
+    def test_rebuild_loads_each_file_once(self):
+        c = cache.Cache(self.cache_dir, rebuild=True)
+
+        self.assertListEqual([(dict(), "untest")], resolve.resolve("test", [self.include_dir], True, False, "bash", c))
+
+        # one miss for the directory index and one for each file, which is not loaded again once the index is built
+        self.assertEqual(3, c.misses)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from undo import client
+from undo import daemon
+
+RESOURCE_DIR_PATH = os.path.join(os.path.dirname(__file__), "resources")
+
+
+class TestDaemon(unittest.TestCase):
+    INCLUDE_DIRS = [os.path.join(RESOURCE_DIR_PATH, "search_all")]
+
+    def setUp(self):
+        self.socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.socket_dir)
+
+        self.socket_path = os.path.join(self.socket_dir, "undo.sock")
+        self.daemon = daemon.Daemon(self.socket_path)
+
+        thread = threading.Thread(target=self.daemon.serve_forever)
+        thread.start()
+
+        self.addCleanup(self.daemon.server_close)
+        self.addCleanup(thread.join)
+        self.addCleanup(self.daemon.shutdown)
+
+    def test_ping(self):
+        self.assertEqual(os.getpid(), client.request(self.socket_path, "ping")["pid"])
+
+    def test_resolve(self):
+        expected = {"matches": [{"env": dict(), "undo": "untest"}, {"env": dict(), "undo": "untest"}]}
+        actual = client.request(self.socket_path, "resolve", command="test", include_dirs=self.INCLUDE_DIRS,
+                                search_all=True, allow_imprecise=False, shell="bash")
+
+        self.assertDictEqual(expected, actual)
+
+    def test_expand(self):
+        actual = client.expand(self.socket_path, "test", self.INCLUDE_DIRS, True, False, "bash")
+
+        self.assertListEqual([["untest"]], actual)
+
+    def test_registries_kept_in_memory(self):
+        client.expand(self.socket_path, "test", self.INCLUDE_DIRS, True, False, "bash")
+        client.expand(self.socket_path, "test", self.INCLUDE_DIRS, True, False, "bash")
+
+        stats = client.request(self.socket_path, "stats")["resolvers"]
+
+        self.assertEqual(1, len(stats))
+        self.assertListEqual([os.path.abspath(i) for i in self.INCLUDE_DIRS], stats[0]["include_dirs"])
+        self.assertEqual(2, stats[0]["registries"])
+        self.assertEqual(2, stats[0]["reloads"])
+
+    def test_resolvers_bounded(self):
+        self.daemon.max_resolvers = 2
+
+        for dirs in [self.INCLUDE_DIRS, [RESOURCE_DIR_PATH], self.INCLUDE_DIRS, [self.socket_dir]]:
+            client.expand(self.socket_path, "test", dirs, True, False, "bash")
+
+        stats = client.request(self.socket_path, "stats")["resolvers"]
+
+        # the resolver of the resources directory is the least recently used when a third is needed
+        self.assertListEqual([[os.path.abspath(i) for i in self.INCLUDE_DIRS], [self.socket_dir]],
+                             [i["include_dirs"] for i in stats])
+
+    def test_expand_in_client_environment(self):
+        include_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, include_dir)
+
+        with open(os.path.join(include_dir, "env.toml"), "w") as file:
+            file.write("[[entry]]\ncmd = 'test'\nundo = 'untest % env(\"UNDO_TEST_VALUE\") %'\nprecise = true\n")
+
+        os.environ["UNDO_TEST_VALUE"] = "client"
+        self.addCleanup(os.environ.pop, "UNDO_TEST_VALUE")
+
+        actual = client.request(self.socket_path, "expand", command="test", include_dirs=[include_dir],
+                                search_all=True, allow_imprecise=False, shell="bash", cwd=os.getcwd(),
+                                environ={"UNDO_TEST_VALUE": "other"})
+
+        self.assertListEqual(["untest other"], actual["undos"])
+        self.assertEqual("client", os.environ["UNDO_TEST_VALUE"])
+
+    def test_idle_connection(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as idle:
+            idle.connect(self.socket_path)
+
+            self.assertEqual(os.getpid(), client.request(self.socket_path, "ping")["pid"])
+
+    def test_unknown_op(self):
+        with self.assertRaises(client.DaemonError):
+            client.request(self.socket_path, "unknown")
+
+    def test_missing_key(self):
+        with self.assertRaises(client.DaemonError):
+            client.request(self.socket_path, "resolve")
+
+
+class TestClient(unittest.TestCase):
+    def test_no_daemon(self):
+        socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, socket_dir)
+
+        self.assertIsNone(client.request(os.path.join(socket_dir, "undo.sock"), "ping"))
+        self.assertIsNone(client.expand(os.path.join(socket_dir, "undo.sock"), "test", list(), True, False, "bash"))
+
+    def test_writable_socket_dir(self):
+        socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, socket_dir)
+
+        socket_path = os.path.join(socket_dir, "undo.sock")
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(socket_path)
+            sock.listen()
+
+            os.chmod(socket_dir, 0o777)
+
+            with self.assertRaises(client.DaemonError):
+                client.request(socket_path, "ping")
+
+    def test_not_a_socket(self):
+        socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, socket_dir)
+
+        socket_path = os.path.join(socket_dir, "undo.sock")
+
+        with open(socket_path, "w"):
+            pass
+
+        with self.assertRaises(client.DaemonError):
+            client.request(socket_path, "ping")
+
+    def test_malformed_response(self):
+        socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, socket_dir)
+
+        socket_path = os.path.join(socket_dir, "undo.sock")
+
+        for response in [b"not json\n", b"[]\n", b"{}\n", b'{"undos": [1]}\n']:
+            with self.subTest(response=response), socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+                server.bind(socket_path)
+                server.listen()
+
+                def respond():
+                    conn, _ = server.accept()
+
+                    with conn:
+                        conn.makefile("rb").readline()
+                        conn.sendall(response)
+
+                thread = threading.Thread(target=respond)
+                thread.start()
+
+                with self.assertRaises(client.DaemonError):
+                    client.expand(socket_path, "test", list(), True, False, "bash")
+
+                thread.join()
+                os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
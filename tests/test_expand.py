@@ -1,3 +1,6 @@
+import concurrent.futures
+import pickle
+import types
 import unittest
 
 from undo import expand
@@ -26,6 +29,20 @@ class TestJoinExpanded(unittest.TestCase):
 
         self.assertEqual(expected, actual)
 
+    def test_mismatched_list_sizes(self):
+        with self.assertRaises(ValueError):
+            expand.iter_join([["a", "b"], " ", ["c"]])
+
+    def test_iter_join_is_lazy(self):
+        values = [f"file-{i}" for i in range(3)]
+        commands = expand.iter_join(["rm ", values])
+
+        self.assertEqual("rm file-0", next(commands))
+
+        values[1] = "changed"
+
+        self.assertListEqual(["rm changed", "rm file-2"], list(commands))
+
 
 class TestSeparation(unittest.TestCase):
     def test_separation_basic(self):
@@ -60,6 +77,38 @@ class TestSeparation(unittest.TestCase):
 
         self.assertListEqual(expected, actual)
 
+    def test_open_bound_at_start_with_trailing_backslash(self):
+        content = "% 'hello' % world\\"
+
+        expected = ["% 'hello' %", " world\\"]
+        actual = separate(content, ("%", "%"))
+
+        self.assertListEqual(expected, actual)
+
+    def test_escaped_nested_open_bound(self):
+        content = "$(hello \\$(world) )"
+
+        expected = ["$(hello \\$(world)", " )"]
+        actual = separate(content, ("$(", ")"))
+
+        self.assertListEqual(expected, actual)
+
+    def test_escaped_backslash_before_bound(self):
+        content = "a \\\\% 'b' %"
+
+        expected = ["a \\\\", "% 'b' %"]
+        actual = separate(content, ("%", "%"))
+
+        self.assertListEqual(expected, actual)
+
+    def test_unclosed_bound(self):
+        content = "a $(b $(c)"
+
+        expected = ["a ", "$(b $(c)"]
+        actual = separate(content, ("$(", ")"))
+
+        self.assertListEqual(expected, actual)
+
     @unittest.skip("not yet implemented")
     def test_escaped_open_bound(self):
         content = "\\$( $(hello world)"
@@ -165,5 +214,103 @@ class TestExpansion(unittest.TestCase):
             }, ("%", "%"), None)
 
 
+
+class TestUndoTemplate(unittest.TestCase):
+    def test_render(self):
+        template = expand.UndoTemplate("rm % $A %", ("%", "%"))
+
+        self.assertEqual("rm a", template.render({"A": "a"}))
+        self.assertEqual("rm b; rm c", template.render({"A": ["b", "c"]}, "; "))
+        self.assertEqual("rm a", expand.expand(template, {"A": "a"}, ("%", "%"), None))
+
+    def test_compares_as_str(self):
+        template = expand.UndoTemplate("rm % $A %", ("%", "%"))
+
+        self.assertEqual("rm % $A %", template)
+        self.assertEqual(hash("rm % $A %"), hash(template))
+
+    def test_immutable(self):
+        template = expand.UndoTemplate("rm % $A %", ("%", "%"))
+
+        with self.assertRaises(AttributeError):
+            template.segments = ()
+
+        with self.assertRaises(AttributeError):
+            del template.bounds
+
+    def test_syntax_error_on_create(self):
+        with self.assertRaises(ValueError):
+            expand.UndoTemplate("rm % $A", ("%", "%"))
+
+        with self.assertRaises(ValueError):
+            expand.UndoTemplate("rm % $ %", ("%", "%"))
+
+    def test_folded(self):
+        template = expand.UndoTemplate("rm % basename('/x/y') %/% \"z\" % % $A %", ("%", "%"))
+
+        self.assertEqual(2, template.folded)
+        self.assertEqual("rm y/z ", template.segments[0])
+        self.assertEqual(2, len(template.segments))
+        self.assertEqual("rm y/z a", template.render({"A": "a"}))
+
+    def test_snapshot(self):
+        template = expand.UndoTemplate("echo % env('UNDO_TEST_VALUE') %", ("%", "%"))
+        snapshot = template.snapshot({"UNDO_TEST_VALUE": "snapshot"})
+
+        self.assertEqual(("echo snapshot",), snapshot.segments)
+        self.assertEqual(template, snapshot)
+        self.assertEqual(1, snapshot.folded)
+
+        self.assertIs(template, template.snapshot(dict()))
+
+    def test_pickle(self):
+        template = expand.UndoTemplate("rm % $A %", ("%", "%"))
+
+        unpickled = pickle.loads(pickle.dumps(template))
+
+        self.assertEqual(template, unpickled)
+        self.assertEqual(template.segments, unpickled.segments)
+        self.assertEqual("rm a", unpickled.render({"A": "a"}))
+
+    def test_render_concurrent(self):
+        template = expand.UndoTemplate("mv % DST ? \"`$DST`/`basename($SRC)`\" % % $SRC % % !MISSING ? $MISSING %", ("%", "%"))
+        env = types.MappingProxyType({"SRC": [f"dir/{i}" for i in range(100)], "DST": "dst"})
+
+        expected = [f"mv dst/{i} dir/{i} " for i in range(100)]
+
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            for actual in pool.map(lambda _: template.render(env), range(32)):
+                self.assertListEqual(expected, actual)
+
+        self.assertNotIn("MISSING", env)
+
+
+
+class TestIterExpandResolved(unittest.TestCase):
+    def test_iter_expand_resolved(self):
+        template = expand.UndoTemplate("rm % $A %", ("%", "%"))
+        resolved = [
+            ({"A": ["a", "b"]}, template),
+            ({"A": "c"}, "touch % $A %"),
+            ({"A": ["a", "b"]}, expand.UndoTemplate("rm % $A %", ("%", "%"))),
+        ]
+
+        actual = [list(i) for i in expand.iter_expand_resolved(resolved, ("%", "%"))]
+
+        self.assertListEqual([["rm a", "rm b"], ["touch c"]], actual)
+
+    def test_same_commands_dropped(self):
+        resolved = [
+            ({"A": "a"}, "rm % $A %"),
+            ({"B": "a"}, "rm % $B %"),
+            ({"A": ["a", "b"]}, "rm % $A %"),
+        ]
+
+        actual = [list(i) for i in expand.iter_expand_resolved(resolved, ("%", "%"))]
+
+        self.assertListEqual([["rm a"], ["rm a", "rm b"]], actual)
+        self.assertListEqual(["; ".join(i) for i in actual], expand.expand_resolved(resolved, ("%", "%"), "; "))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,12 @@
+import copy
+import itertools
 import os.path
+import pickle
+import types
 import unittest
 
 from undo import expression
+from undo import fs
 from undo.expression import *
 
 
@@ -11,6 +16,8 @@ from undo.expression import *
 
 tokenize = expression.__tokenize
 
+iter_tokens = expression.__iter_tokens
+
 parse_tokens = expression.__parse_tokens
 
 
@@ -89,6 +96,9 @@ class TestTokenize(unittest.TestCase):
         self.assertEqual([Token(TokenKind.COMMAND, "isdir", 1)], tokenize("isdir"))
         self.assertEqual([Token(TokenKind.COMMAND, "join", 1)], tokenize("join"))
 
+    def test_tokenize_command_prefix(self):
+        self.assertEqual([Token(TokenKind.IDENT, "isdir_path", 1)], tokenize("isdir_path"))
+
     def test_tokenize_command_single_arg(self):
         expected = [
             Token(TokenKind.COMMAND, "join", 1),
@@ -190,6 +200,31 @@ class TestTokenize(unittest.TestCase):
         with self.assertRaises(ExpressionError):
             tokenize("+")
 
+    def test_unrecognized_token_col(self):
+        with self.assertRaises(TokenError) as context:
+            tokenize("A && + B")
+
+        self.assertEqual(Token(TokenKind.UNKNOWN, "+", 6), context.exception.token)
+
+    def test_surrounding_whitespace(self):
+        expected = [
+            Token(TokenKind.ACCESSOR, "$", 3),
+            Token(TokenKind.IDENT, "A", 4),
+        ]
+
+        actual = tokenize("  $A  ")
+
+        self.assertListEqual(expected, actual)
+
+    def test_iter_tokens_is_lazy(self):
+        tokens = iter_tokens("$A + B")
+
+        self.assertEqual(Token(TokenKind.ACCESSOR, "$", 1), next(tokens))
+        self.assertEqual(Token(TokenKind.IDENT, "A", 2), next(tokens))
+
+        with self.assertRaises(TokenError):
+            next(tokens)
+
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # Parsing Tests                                                               #
@@ -358,6 +393,36 @@ class TestParseConditionalExpression(unittest.TestCase):
         self.assertEqual(expected, actual)
         self.assertEqual(4, offset)
 
+    def test_negated_conditional_command(self):
+        tokens = [
+            Token(TokenKind.NOT, "!", 0),
+            Token(TokenKind.COMMAND, "isdir", 0),
+            Token(TokenKind.OPEN_PARENTHESE, "(", 0),
+            Token(TokenKind.ACCESSOR, "$", 0),
+            Token(TokenKind.IDENT, "A", 0),
+            Token(TokenKind.CLOSE_PARENTHESE, ")", 0),
+        ]
+
+        actual, offset = parse_conditional_tokens(tokens)
+
+        self.assertTrue(actual.negate)
+        self.assertEqual(6, offset)
+
+    def test_long_chain_conditional(self):
+        tokens = tokenize(" && ".join(f"A{i}" for i in range(5000)))
+
+        actual, offset = parse_conditional_tokens(tokens)
+
+        self.assertEqual(len(tokens), offset)
+        self.assertEqual(Token(TokenKind.IDENT, "A1", 7), actual.right.identifier)
+
+    def test_unexpected_end_of_line(self):
+        with self.assertRaises(UnexpectedEndOfLineError):
+            parse_conditional_tokens([
+                Token(TokenKind.IDENT, "A", 0),
+                Token(TokenKind.AND, "&&", 0),
+            ])
+
 
 parse_accessor_tokens = expression.__parse_accessor_expression_tokens
 parse_ternary_tokens = expression.__parse_ternary_expression_tokens
@@ -688,6 +753,18 @@ class TestAccessorExpression(unittest.TestCase):
 
         self.assertEqual(expected, actual)
 
+    def test_does_not_exist_env_unmodified(self):
+        env = types.MappingProxyType(self.env)
+
+        for list_expand in [False, True]:
+            expr = AccessorExpression(Token(TokenKind.IDENT, "DOES_NOT_EXIST", 0), list_expand, " ")
+
+            self.assertEqual(expression.MISSING, expr.evaluate(env))
+            self.assertEqual(expression.MISSING, expr.no_expand_evaluate(env))
+            self.assertEqual(expression.MISSING, expr.compile_no_expand()(env))
+
+        self.assertNotIn("DOES_NOT_EXIST", self.env)
+
     def test_list_value(self):
         expr = AccessorExpression(Token(TokenKind.IDENT, "LIST", 0), False)
 
@@ -824,6 +901,20 @@ class TestStringExpansion(unittest.TestCase):
 
         self.assertListEqual(expected, actual)
 
+    def test_broadcast_list_and_string(self):
+        expr = StringExpansionExpression(Token(TokenKind.STRING_EXPANSION, "`$DST`/`basename($SRC)`", 0))
+
+        expected = ["dir/a", "dir/b"]
+        actual = expr.evaluate({"DST": "dir", "SRC": ["/some/a", "/other/b"]})
+
+        self.assertListEqual(expected, actual)
+
+    def test_broadcast_different_sizes(self):
+        expr = StringExpansionExpression(Token(TokenKind.STRING_EXPANSION, "`$A` `$B`", 0))
+
+        with self.assertRaises(BroadcastError):
+            expr.evaluate({"A": ["a", "b"], "B": ["c"]})
+
     def test_list_expansions(self):
         expr = StringExpansionExpression(Token(TokenKind.STRING_EXPANSION, "`$LIST...`", 0))
 
@@ -846,6 +937,23 @@ class TestStringExpansion(unittest.TestCase):
         with self.assertRaises(ParseError):
             expr.evaluate(dict())
 
+    def test_parsed_with_expression(self):
+        expr = expression.parse("\"`$A`/`basename($B)`\"")
+
+        expected = [
+            AccessorExpression(Token(TokenKind.IDENT, "A", 2), False),
+            "/",
+            ValueCommandExpression(Token(TokenKind.COMMAND, "basename", 1),
+                                   [AccessorExpression(Token(TokenKind.IDENT, "B", 11), False)]),
+        ]
+
+        self.assertTupleEqual(tuple(expected), expr.template.segments)
+        self.assertEqual("a/b", expr.evaluate({"A": "a", "B": "/b"}))
+
+    def test_bad_expression_parsed_with_expression(self):
+        with self.assertRaises(ParseError):
+            expression.parse("\"This is a bad `expression`\"")
+
 
 class TestExistenceExpression(unittest.TestCase):
     def setUp(self):
@@ -946,6 +1054,23 @@ class TestValueCommandExpression(unittest.TestCase):
 
         self.assertEqual(expected, actual)
 
+    def test_env_list(self):
+        env_var = self.id()
+        env_var_value = "SET"
+
+        os.environ[env_var] = env_var_value
+        self.addCleanup(lambda: os.environ.pop(env_var))
+
+        expr = ValueCommandExpression(
+            Token(TokenKind.COMMAND, "env", 0),
+            [AccessorExpression(Token(TokenKind.IDENT, "LIST", 0), False)]
+        )
+
+        expected = [env_var_value, env_var_value]
+        actual = expr.evaluate({"LIST": [env_var, env_var]})
+
+        self.assertListEqual(expected, actual)
+
     def test_join(self):
         expr = ValueCommandExpression(
             Token(TokenKind.COMMAND, "join", 0),
@@ -1005,6 +1130,11 @@ class TestValueCommandExpression(unittest.TestCase):
         with self.assertRaises(UnknownCommandException):
             expr.evaluate(dict())
 
+        expr = ConditionalCommandExpression(False, Token(TokenKind.IDENT, "unknown_command", 0), [])
+
+        with self.assertRaises(UnknownCommandException):
+            expr.evaluate(dict())
+
 
 class TestConditionalCommandExpression(unittest.TestCase):
     def test_exists(self):
@@ -1099,5 +1229,303 @@ class TestConditionalCommandExpression(unittest.TestCase):
             expr.evaluate(dict())
 
 
+
+class TestBroadcast(unittest.TestCase):
+    def test_no_lists(self):
+        self.assertEqual("a/b", expression.broadcast(os.path.join, "a", "b"))
+
+    def test_string_and_list(self):
+        self.assertListEqual(["a/b", "a/c"], expression.broadcast(os.path.join, "a", ["b", "c"]))
+
+    def test_lists_of_same_size(self):
+        self.assertListEqual(["a/c", "b/d"], expression.broadcast(os.path.join, ["a", "b"], ["c", "d"]))
+
+    def test_lists_of_different_sizes(self):
+        with self.assertRaises(BroadcastError):
+            expression.broadcast(os.path.join, ["a", "b"], ["c"])
+
+    def test_empty_list(self):
+        self.assertListEqual([], expression.broadcast(os.path.join, "a", []))
+
+    def test_iter_broadcast_join(self):
+        self.assertListEqual(["a c", "b c"], list(expression.iter_broadcast_join([["a", "b"], " ", "c"])))
+        self.assertListEqual(["a c"], list(expression.iter_broadcast_join(["a", " ", "c"])))
+
+
+class TestConditionalChain(unittest.TestCase):
+    def setUp(self):
+        self.dir = os.path.dirname(__file__)
+
+    def test_truth_table(self):
+        contents = [
+            "A && B",
+            "A || B",
+            "A || B && C",
+            "A && B || C",
+            "!A && B || !C && isdir($DIR)",
+            "A && B && C || !A && !B || C",
+        ]
+
+        for content in contents:
+            # the same chain written in python, which shares the precedence of '&&' and '||' with C
+            python = content.replace("&&", "and").replace("||", "or").replace("!", "not ")
+            python = python.replace("isdir($DIR)", "True")
+
+            for values in itertools.product([True, False], repeat=3):
+                env = {name: "set" for name, value in zip("ABC", values) if value}
+                env["DIR"] = self.dir
+
+                with self.subTest(content=content, values=values):
+                    condition = parse_tokens(tokenize(f"{content} ? 'true' : 'false'")).condition
+
+                    self.assertEqual(eval(python, dict(zip("ABC", values))), condition.evaluate(env))
+
+    def test_short_circuit(self):
+        condition = parse_tokens(tokenize("A && isdir($DIR) ? 'true'")).condition
+
+        with fs.stat_cache() as stats:
+            self.assertFalse(condition.evaluate({"DIR": self.dir}))
+
+        self.assertEqual(0, stats.misses)
+
+    def test_cheap_checks_first(self):
+        condition = parse_tokens(tokenize("isdir($DIR) && A || exists($DIR) && B ? 'true'")).condition
+
+        with fs.stat_cache() as stats:
+            self.assertFalse(condition.evaluate({"DIR": self.dir}))
+            self.assertTrue(condition.evaluate({"DIR": self.dir, "B": "set"}))
+
+        self.assertEqual(1, stats.misses)
+
+    def test_long_chain(self):
+        condition = parse_tokens(tokenize(" && ".join(f"A{i}" for i in range(5000)) + " ? 'true'")).condition
+
+        self.assertTrue(condition.evaluate({f"A{i}": "set" for i in range(5000)}))
+        self.assertFalse(condition.evaluate({f"A{i}": "set" for i in range(4999)}))
+
+
+class TestFold(unittest.TestCase):
+    def assertFolded(self, content: str, expected: str, count: int, environ=None):
+        expr, actual_count = expression.parse(content).fold(environ)
+
+        self.assertIsInstance(expr, StringLiteralExpression)
+        self.assertEqual(expected, expr.evaluate(dict()))
+        self.assertEqual(count, actual_count)
+
+    def assertNotFolded(self, content: str, environ=None):
+        expr = expression.parse(content)
+
+        self.assertEqual((expr, 0), expr.fold(environ))
+
+    def test_pure_commands(self):
+        self.assertFolded("join('a b', ' ')", "a b", 1)
+        self.assertFolded("basename('/x/y')", "y", 1)
+        self.assertFolded("dirname(basename('/x/y/z'))", "", 2)
+
+    def test_string_expansion(self):
+        self.assertFolded('"no expressions"', "no expressions", 1)
+        self.assertFolded('"`basename(\'/x/y\')`/z"', "y/z", 2)
+
+    def test_not_folded(self):
+        self.assertNotFolded("$A")
+        self.assertNotFolded("basename($A)")
+        self.assertNotFolded("abspath('a')")
+        self.assertNotFolded("env('HOME')")
+        self.assertNotFolded("\"`$A`\"")
+
+    def test_env_snapshot(self):
+        self.assertFolded("env('HOME')", "/home/bilbo", 1, {"HOME": "/home/bilbo"})
+        self.assertNotFolded("env('HOME')", dict())
+
+    def test_partial(self):
+        expr, count = expression.parse("!isdir(dirname('/x/y')) && A ? \"`$A`/`basename('/x/y')`\" : $B").fold()
+
+        self.assertEqual(2, count)
+        self.assertEqual(("/x", "/y"), (expr.condition.arguments[0].evaluate(dict()), expr.if_value.template.segments[-1]))
+        self.assertEqual("a//y", expr.evaluate({"A": "a/"}))
+
+    def test_original_not_modified(self):
+        expr = expression.parse("A && isdir(dirname('/x/y')) && B ? 'a'")
+        folded, _ = expr.fold()
+
+        self.assertIsInstance(expr.condition.right.arguments[0], ValueCommandExpression)
+        self.assertEqual(folded.condition.right.right, expr.condition.right.right)
+        self.assertIsNot(folded.condition, expr.condition)
+
+
+class TestFunctions(unittest.TestCase):
+    def register(self, function: Function):
+        expression.register_function(function)
+        self.addCleanup(expression.unregister_function, function.name)
+
+    def setUp(self):
+        self.register(Function("realpath", 1, ReturnKind.VALUE, False, mapped(os.path.realpath)))
+        self.register(Function("relpath", 2, ReturnKind.VALUE, False, mapped(os.path.relpath)))
+        self.register(Function("stem", 1, ReturnKind.VALUE, True,
+                               mapped(lambda path: os.path.splitext(os.path.basename(path))[0])))
+
+    def test_registered(self):
+        self.assertEqual([Token(TokenKind.COMMAND, "stem", 1)], tokenize("stem"))
+
+        self.assertEqual(["a", "b"], expression.parse("stem($A)").evaluate({"A": ["/x/a.txt", "b.tar"]}))
+        self.assertEqual("b/c", expression.parse("relpath($A, '/a')").evaluate({"A": "/a/b/c"}))
+        self.assertEqual(os.path.realpath("."), expression.parse("realpath('.')").evaluate(dict()))
+
+    def test_registered_conditional(self):
+        self.register(Function("isempty", 1, ReturnKind.BOOL, True, mapped_all(lambda value: value == "")))
+
+        expr = expression.parse("isempty($A) && !isempty($B) ? 'yes' : 'no'")
+
+        self.assertEqual("yes", expr.evaluate({"A": ["", ""], "B": "b"}))
+        self.assertEqual("no", expr.evaluate({"A": ["", "a"], "B": "b"}))
+
+    def test_fold_pure(self):
+        expr, count = expression.parse("stem('/x/y.txt')").fold()
+
+        self.assertEqual((StringLiteralExpression(Token(TokenKind.STRING_LITERAL, "y", 1)), 1), (expr, count))
+
+        expr = expression.parse("realpath('.')")
+
+        self.assertEqual((expr, 0), expr.fold())
+
+    def test_arity_checked_when_parsed(self):
+        for content in ["relpath($A)", "stem($A, $B)", "isdir($A, $B) ? 'a'", "join($A)"]:
+            with self.subTest(content=content), self.assertRaises(WrongArgumentNum):
+                expression.parse(content)
+
+    def test_register_invalid(self):
+        with self.assertRaises(ValueError):
+            expression.register_function(Function("stem", 1, ReturnKind.VALUE, True, mapped(str.upper)))
+
+        with self.assertRaises(ValueError):
+            expression.register_function(Function("not-an-ident", 1, ReturnKind.VALUE, True, mapped(str.upper)))
+
+    def test_unregister(self):
+        self.assertIsInstance(expression.parse("stem($A)"), ValueCommandExpression)
+
+        expression.unregister_function("stem")
+
+        with self.assertRaises(ParseError):
+            expression.parse("stem($A)")
+
+        with self.assertRaises(ValueError):
+            expression.unregister_function("stem")
+
+        # registered again for the cleanup to unregister
+        expression.register_function(Function("stem", 1, ReturnKind.VALUE, True, mapped(str.upper)))
+
+    def test_functions_signature(self):
+        signature = expression.functions_signature()
+
+        self.assertIn(("stem", 1, "VALUE", True), signature)
+
+        expression.register_function(Function("stem", 2, ReturnKind.VALUE, True, mapped(str.upper)), True)
+
+        self.assertNotEqual(signature, expression.functions_signature())
+
+    def test_register_replace(self):
+        expression.register_function(Function("stem", 1, ReturnKind.VALUE, True, mapped(str.upper)), True)
+
+        self.assertEqual("A", expression.parse("stem('a')").evaluate(dict()))
+
+
+class TestFrozen(unittest.TestCase):
+    CONTENT = "A && isdir(dirname($B)) ? \"`$C`/`basename($D...)`\" : join($E, ',')"
+
+    def test_parse_cached(self):
+        self.assertIs(expression.parse(self.CONTENT), expression.parse(self.CONTENT))
+
+    def test_immutable(self):
+        expr = expression.parse(self.CONTENT)
+
+        for node in [expr, expr.condition, expr.condition.right, expr.if_value, expr.else_value.arguments[0]]:
+            with self.subTest(node=node), self.assertRaises(AttributeError):
+                node.right = None
+
+        with self.assertRaises(TypeError):
+            expr.else_value.arguments[0] = expr
+
+    def test_equal_to_unfrozen(self):
+        expected = ValueCommandExpression(Token(TokenKind.COMMAND, "dirname", 1),
+                                          [AccessorExpression(Token(TokenKind.IDENT, "A", 10), False)])
+
+        self.assertEqual(expected, expression.parse("dirname($A)"))
+        self.assertIsInstance(expression.parse("dirname($A)"), ValueCommandExpression)
+
+    def test_copy_not_frozen(self):
+        expr = copy.copy(expression.parse(self.CONTENT))
+        expr.else_value = None
+
+        self.assertEqual("", expr.evaluate({"A": ""}))
+        self.assertIsNotNone(expression.parse(self.CONTENT).else_value)
+
+    def test_pickle(self):
+        expr = expression.parse(self.CONTENT)
+        unpickled = pickle.loads(pickle.dumps(expr))
+
+        self.assertEqual(expr, unpickled)
+
+        with self.assertRaises(AttributeError):
+            unpickled.condition.negate = True
+
+    def test_register_clears_cache(self):
+        self.assertIsInstance(expression.parse("shout ? 'a'"), TernaryExpression)
+
+        expression.register_function(Function("shout", 1, ReturnKind.VALUE, True, mapped(str.upper)))
+        self.addCleanup(expression.unregister_function, "shout")
+
+        self.assertEqual("A", expression.parse("shout('a')").evaluate(dict()))
+
+        with self.assertRaises(ParseError):
+            expression.parse("shout ? 'a'")
+
+
+class TestCompile(unittest.TestCase):
+    def setUp(self):
+        self.env = {
+            "A": "some_value",
+            "DIR": os.path.dirname(__file__),
+            "LIST": [__file__, os.path.dirname(__file__)],
+        }
+
+    def test_compile_matches_evaluate(self):
+        contents = [
+            "$A",
+            "$LIST... ",
+            "A ? 'yes' : 'no'",
+            "!A ? 'yes' : 'no'",
+            "isdir($DIR) ? basename($LIST...) : dirname($LIST)",
+            "!exists($LIST...) ? 'missing'",
+            "join($LIST, ',')",
+            "join(basename($LIST), ' ')",
+            "\"`$A`/`basename($DIR)`\"",
+        ]
+
+        for content in contents:
+            with self.subTest(content=content):
+                expr = expression.parse(content)
+
+                self.assertEqual(expr.evaluate(dict(self.env)), expr.compile()(dict(self.env)))
+
+    def test_compile_defaults_to_evaluate(self):
+        class EchoValueExpression(ValueExpression):
+            def evaluate(self, env: dict[str, str]) -> str:
+                return "echo"
+
+        expr = TernaryExpression(ExistenceExpression(False, Token(TokenKind.IDENT, "A", 0)),
+                                 EchoValueExpression(), None)
+
+        self.assertEqual("echo", expr.compile()(self.env))
+
+    def test_compile_unknown_command(self):
+        compiled = ValueCommandExpression(
+            Token(TokenKind.COMMAND, "unknown_command", 0),
+            [StringLiteralExpression(Token(TokenKind.STRING_LITERAL, "arg", 0))]
+        ).compile()
+
+        with self.assertRaises(UnknownCommandException):
+            compiled(dict())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from undo import expand
+from undo import fs
+
+
+class TestStatCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+        self.file = os.path.join(self.dir, "file")
+        self.missing = os.path.join(self.dir, "missing")
+
+        with open(self.file, "w") as file:
+            file.write("")
+
+        self.cache = fs.StatCache()
+
+    def test_predicates(self):
+        for path in [self.dir, self.file, self.missing, "", "null\0byte"]:
+            with self.subTest(path=path):
+                self.assertEqual(os.path.exists(path), self.cache.exists(path))
+                self.assertEqual(os.path.isfile(path), self.cache.isfile(path))
+                self.assertEqual(os.path.isdir(path), self.cache.isdir(path))
+
+    def test_symlink_followed(self):
+        link = os.path.join(self.dir, "link")
+        os.symlink(self.dir, link)
+
+        self.assertTrue(self.cache.isdir(link))
+
+    def test_single_stat_per_path(self):
+        self.cache.exists(self.file)
+        self.cache.isfile(self.file)
+        self.cache.isdir(self.file)
+
+        self.assertEqual(1, self.cache.misses)
+        self.assertEqual(2, self.cache.hits)
+
+    def test_invalidate(self):
+        self.assertFalse(self.cache.exists(self.missing))
+
+        os.mkdir(self.missing)
+
+        self.assertFalse(self.cache.exists(self.missing))
+
+        self.cache.invalidate()
+
+        self.assertTrue(self.cache.isdir(self.missing))
+        self.assertEqual(2, self.cache.misses)
+
+
+    def test_prefetch(self):
+        paths = [self.dir, self.file, self.missing] + [os.path.join(self.dir, str(i)) for i in range(100)]
+
+        self.cache.prefetch(paths + paths)
+
+        self.assertEqual(len(paths), len(self.cache))
+        self.assertEqual(len(paths), self.cache.misses)
+
+        self.assertTrue(self.cache.isdir(self.dir))
+        self.assertTrue(self.cache.isfile(self.file))
+        self.assertFalse(self.cache.exists(self.missing))
+        self.assertEqual(3, self.cache.hits)
+
+    def test_prefetch_without_cache(self):
+        fs.prefetch(iter(self.fail, None))
+
+
+class TestStatCacheContext(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    def test_expand_uses_cache(self):
+        undo = expand.UndoTemplate('mv % isdir($DST) ? "`$DST`/`basename($SRC)`" : $DST % % $SRC %', ("%", "%"))
+        env = {"SRC": ["a", "b"], "DST": self.dir}
+
+        with fs.stat_cache() as stats:
+            expected = [f"mv {self.dir}/a a", f"mv {self.dir}/b b"]
+
+            for _ in range(3):
+                self.assertListEqual(expected, list(undo.iter_render(env)))
+
+        self.assertEqual(1, stats.misses)
+        self.assertEqual(2, stats.hits)
+
+    def test_invalidated_on_exit(self):
+        with fs.stat_cache() as stats:
+            self.assertTrue(fs.isdir(self.dir))
+
+        self.assertEqual(0, len(stats))
+
+        shutil.rmtree(self.dir)
+
+        self.assertFalse(fs.isdir(self.dir))
+        self.assertEqual(1, stats.misses)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import threading
+import unittest
+
+from undo import lru
+
+
+class TestLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = list()
+        self.cache = lru.LRUCache(self.f, 2)
+
+    def f(self, key: str) -> str:
+        self.calls.append(key)
+
+        if key == "error":
+            raise ValueError(key)
+
+        return key.upper()
+
+    def test_hit_and_miss(self):
+        self.assertEqual("A", self.cache("a"))
+        self.assertEqual("A", self.cache("a"))
+
+        self.assertListEqual(["a"], self.calls)
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_least_recently_used_evicted(self):
+        self.cache("a")
+        self.cache("b")
+        self.cache("a")
+        self.cache("c")
+
+        self.assertEqual(2, len(self.cache))
+
+        self.cache("a")
+        self.cache("b")
+
+        self.assertListEqual(["a", "b", "c", "b"], self.calls)
+
+    def test_error_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                self.cache("error")
+
+        self.assertListEqual(["error", "error"], self.calls)
+
+    def test_no_size(self):
+        self.cache.maxsize = 0
+
+        self.cache("a")
+        self.cache("a")
+
+        self.assertEqual(0, len(self.cache))
+        self.assertListEqual(["a", "a"], self.calls)
+
+    def test_resize(self):
+        self.cache("a")
+        self.cache("a")
+
+        self.cache.maxsize = 10
+
+        self.assertEqual(10, self.cache.maxsize)
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_clear(self):
+        self.cache("a")
+        self.cache.clear()
+        self.cache("a")
+
+        self.assertListEqual(["a", "a"], self.calls)
+        self.assertEqual((0, 2), (self.cache.hits, self.cache.misses))
+
+    def test_negative_size(self):
+        with self.assertRaises(ValueError):
+            lru.LRUCache(self.f, -1)
+
+        with self.assertRaises(ValueError):
+            self.cache.maxsize = -1
+
+    def test_threads(self):
+        cache = lru.LRUCache(str.upper, 8)
+        keys = [str(i % 16) for i in range(1000)]
+
+        threads = [threading.Thread(target=lambda: [cache(i) for i in keys]) for _ in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(4000, cache.hits + cache.misses)
+        self.assertEqual(8, len(cache))
+
+
+if __name__ == "__main__":
+    unittest.main()
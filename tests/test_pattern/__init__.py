@@ -1,2 +1,3 @@
 from .test_pattern import *
 from .test_pattern_to_argparse import *
+from .test_pattern_to_matcher import *
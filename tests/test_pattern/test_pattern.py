@@ -1,3 +1,4 @@
+import dataclasses
 import unittest
 
 from undo.pattern import ArgNum, ArgumentPattern, ArgumentGroupPattern, CommandPattern, PatternError, Quantifier, \
@@ -452,6 +453,36 @@ class TestCommandPattern(unittest.TestCase):
         with self.assertRaises(PatternError):
             parse_command_pattern(content)
 
+    def test_parse_cached(self):
+        content = "test [-v --verbose] <SRC...> (! [-a] [-b])"
+
+        self.assertIs(parse_command_pattern(content), parse_command_pattern(content))
+
+    def test_immutable(self):
+        cmd_pattern = parse_command_pattern("test [-v --verbose] <SRC...>")
+
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            cmd_pattern.arguments = tuple()
+
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            cmd_pattern.arguments[0].var_name = "V"
+
+        with self.assertRaises(AttributeError):
+            cmd_pattern.arguments[0].arg_num.count = 2
+
+    def test_with_arguments(self):
+        cmd_pattern = parse_command_pattern("test [-v --verbose]")
+        common = parse_argument_group_pattern("([-f --force])")[0].args
+
+        expected = CommandPattern("test", list(), [
+            ArgumentPattern("VERBOSE", ArgNum(Quantifier.FLAG), ["-v", "--verbose"], False, False, None),
+            ArgumentPattern("FORCE", ArgNum(Quantifier.FLAG), ["-f", "--force"], False, False, None),
+        ], list())
+
+        self.assertEqual(expected, cmd_pattern.with_arguments(common))
+        self.assertEqual(1, len(parse_command_pattern("test [-v --verbose]").arguments))
+
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,384 @@
+import argparse
+import os
+import unittest
+
+import toml
+
+from undo.pattern import CommandPattern, pattern_to_argparse, pattern_to_matcher, ArgumentPattern, ArgNum, Quantifier, \
+    ArgumentGroupPattern, PatternError, parse_command_pattern, parse_argument_group_pattern, MatcherGroup, \
+    MatcherTrie
+
+COREUTILS_UNDO_DIR = os.path.realpath(os.path.join(__file__, "..", "..", "..", "undos", "coreutils"))
+
+
+class TestPatternToMatcher(unittest.TestCase):
+    def test_basic(self):
+        pattern = CommandPattern("test", list(), list(), list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual(dict(), matcher.match([]))
+        self.assertIsNone(matcher.match(["--verbose"]))
+        self.assertIsNone(matcher.match(["some", "positional", "args"]))
+
+    def test_sub_command(self):
+        pattern = CommandPattern("test", ["one"], list(), list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertIsNone(matcher.match([]))
+        self.assertIsNone(matcher.match(["one", "three"]))
+        self.assertIsNone(matcher.match(["two"]))
+
+        self.assertEqual({"command": "one"}, matcher.match(["one"]))
+
+    def test_nested_sub_commands(self):
+        pattern = CommandPattern("test", ["one", "two"], list(), list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertIsNone(matcher.match([]))
+        self.assertIsNone(matcher.match(["one"]))
+        self.assertIsNone(matcher.match(["one", "three"]))
+        self.assertIsNone(matcher.match(["two"]))
+
+        self.assertEqual({"command": "two"}, matcher.match("one two".split()))
+
+    # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+    # Required Testing                                                        #
+    # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+    def test_optional_arg(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern("VAL", ArgNum(Quantifier.N, 1), ["-V", "--val"], False, False, None)
+        ], list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"VAL": None}, matcher.match([]))
+        self.assertEqual({"VAL": "value"}, matcher.match(["-V", "value"]))
+        self.assertEqual({"VAL": "value"}, matcher.match(["--val", "value"]))
+        self.assertEqual({"VAL": "value"}, matcher.match(["--val=value"]))
+        self.assertEqual({"VAL": "value"}, matcher.match(["-Vvalue"]))
+        self.assertEqual({"VAL": "value"}, matcher.match(["--va", "value"]))
+
+    def test_required_arg(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern("VAL", ArgNum(Quantifier.N, 1), ["-V", "--val"], False, True, None)
+        ], list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertIsNone(matcher.match([]))
+        self.assertEqual({"VAL": "value"}, matcher.match(["-V", "value"]))
+        self.assertEqual({"VAL": "value"}, matcher.match(["--val", "value"]))
+
+    def test_arg_group_optional(self):
+        pattern = CommandPattern("test", list(), list(), [
+            ArgumentGroupPattern(False, [
+                ArgumentPattern("INTERACTIVE", ArgNum(Quantifier.FLAG), ["--interactive"], False, False, None),
+                ArgumentPattern("NO_CLOBBER", ArgNum(Quantifier.FLAG), ["--no-clobber"], False, False, None),
+            ])
+        ])
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"INTERACTIVE": False, "NO_CLOBBER": False}, matcher.match([]))
+        self.assertEqual({"INTERACTIVE": True, "NO_CLOBBER": False}, matcher.match(["--interactive"]))
+        self.assertEqual({"INTERACTIVE": False, "NO_CLOBBER": True}, matcher.match(["--no-clobber"]))
+        self.assertEqual({"INTERACTIVE": True, "NO_CLOBBER": True}, matcher.match(["--interactive", "--no-clobber"]))
+
+    def test_arg_group_required(self):
+        pattern = CommandPattern("test", list(), list(), [
+            ArgumentGroupPattern(True, [
+                ArgumentPattern("INTERACTIVE", ArgNum(Quantifier.FLAG), ["--interactive"], False, False, None),
+                ArgumentPattern("NO_CLOBBER", ArgNum(Quantifier.FLAG), ["--no-clobber"], False, False, None),
+            ])
+        ])
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"INTERACTIVE": True, "NO_CLOBBER": False}, matcher.match(["--interactive"]))
+        self.assertEqual({"INTERACTIVE": False, "NO_CLOBBER": True}, matcher.match(["--no-clobber"]))
+        self.assertEqual({"INTERACTIVE": True, "NO_CLOBBER": True}, matcher.match(["--no-clobber", "--interactive"]))
+        self.assertIsNone(matcher.match([]))
+
+    def test_arg_group_required_with_sub_command(self):
+        pattern = CommandPattern("test", ["one"], list(), [
+            ArgumentGroupPattern(True, [
+                ArgumentPattern("FORCE", ArgNum(Quantifier.FLAG), ["--force"], False, False, None),
+            ])
+        ])
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"command": "one", "FORCE": True}, matcher.match(["one", "--force"]))
+        self.assertIsNone(matcher.match(["one"]))
+
+    def test_empty_arg_group_required(self):
+        pattern = CommandPattern("test", list(), list(), [
+            ArgumentGroupPattern(True, [])
+        ])
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual(dict(), matcher.match([]))
+
+    def test_empty_list_arg_group_required(self):
+        pattern = CommandPattern("test", list(), list(), [
+            ArgumentGroupPattern(True, [
+                ArgumentPattern("LIST", ArgNum(Quantifier.ANY), ["--list"], False, False, None)
+            ])
+        ])
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"LIST": []}, matcher.match(["--list"]))
+
+    def test_optional_argument(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern("NUMBER", ArgNum(Quantifier.OPTIONAL), ["--number"], False, False, None)
+        ], list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"NUMBER": None}, matcher.match(["--number"]))
+        self.assertEqual({"NUMBER": "10"}, matcher.match(["--number", "10"]))
+
+    def test_conflicting_options(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern("A", ArgNum(Quantifier.FLAG), ["-a"], False, False, None),
+            ArgumentPattern("B", ArgNum(Quantifier.FLAG), ["-a"], False, False, None),
+        ], list())
+
+        with self.assertRaises(PatternError):
+            pattern_to_matcher(pattern)
+
+    # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+    # Identifier Testing                                                      #
+    # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+    def test_mixed_positional_args(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern(None, ArgNum(Quantifier.N, 1), list(), True, True, None),
+            ArgumentPattern("FILE", ArgNum(Quantifier.N, 1), list(), True, True, None),
+            ArgumentPattern(None, ArgNum(Quantifier.N, 1), list(), True, True, None),
+        ], list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertIsNone(matcher.match(["a"]))
+        self.assertIsNone(matcher.match(["a", "b"]))
+        self.assertEqual({"FILE": "b", "1": "a", "3": "c"}, matcher.match(["a", "b", "c"]))
+
+    # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+    # Quantifier Testing                                                      #
+    # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+    def test_positional_arg(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern("VAL", ArgNum(Quantifier.AT_LEAST_ONE, None), list(), True, True, None)
+        ], list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertIsNone(matcher.match([]))
+        self.assertEqual({"VAL": ["value"]}, matcher.match(["value"]))
+        self.assertEqual({"VAL": ["value", "another", "final"]}, matcher.match(["value", "another", "final"]))
+
+    def test_flag_arg(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern("verbose", ArgNum(Quantifier.FLAG), ["--verbose"], False, False, None)
+        ], list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"verbose": True}, matcher.match(["--verbose"]))
+
+    def test_combined_short_flags(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern("A", ArgNum(Quantifier.FLAG), ["-a"], False, False, None),
+            ArgumentPattern("B", ArgNum(Quantifier.FLAG), ["-b"], False, False, None),
+            ArgumentPattern("C", ArgNum(Quantifier.N, 1), ["-c"], False, False, None),
+        ], list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"A": True, "B": True, "C": None}, matcher.match(["-ab"]))
+        self.assertEqual({"A": True, "B": False, "C": "value"}, matcher.match(["-acvalue"]))
+        self.assertIsNone(matcher.match(["-ax"]))
+
+    def test_at_least_one_argument(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern("LIST", ArgNum(Quantifier.AT_LEAST_ONE), ["--list"], False, False, None)
+        ], list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"LIST": ["a", "b", "c", "d"]}, matcher.match("--list a b c d".split()))
+        self.assertIsNone(matcher.match("--list".split()))
+
+    def test_any_argnum(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern("LIST", ArgNum(Quantifier.ANY), ["--list"], False, False, None)
+        ], list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"LIST": []}, matcher.match("--list".split()))
+        self.assertEqual({"LIST": ["a", "b"]}, matcher.match("--list a b".split()))
+
+    # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+    # Delimiter Testing                                                       #
+    # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+    def test_delim_splitting(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern("LIST", ArgNum(Quantifier.N, 1), ["--list"], False, True, ","),
+        ], list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"LIST": ["a", "b", "c"]}, matcher.match(["--list", "a,b,c"]))
+        self.assertEqual({"LIST": ["a"]}, matcher.match(["--list", "a"]))
+        self.assertIsNone(matcher.match(["--list"]))
+
+    def test_delim_splitting_optional(self):
+        pattern = CommandPattern("test", list(), [
+            ArgumentPattern("LIST", ArgNum(Quantifier.OPTIONAL), ["--list"], False, True, ","),
+        ], list())
+        matcher = pattern_to_matcher(pattern)
+
+        self.assertEqual({"LIST": ["a", "b", "c"]}, matcher.match(["--list", "a,b,c"]))
+        self.assertEqual({"LIST": ["a"]}, matcher.match(["--list", "a"]))
+        self.assertEqual({"LIST": []}, matcher.match(["--list"]))
+
+
+class TestMatcherArgparseEquivalence(unittest.TestCase):
+    """Check that the matcher agrees with argparse for every coreutils command pattern."""
+
+    ARGVS = [
+        [], ["A"], ["A", "B"], ["A", "B", "C", "DIR"], ["-T", "A", "B"], ["--no-clobber", "A", "B"], ["-n", "A", "B"],
+        ["-t", "DIR", "A"], ["--target-directory=DIR", "A", "B"], ["-tDIR", "A"], ["--target", "DIR", "A"],
+        ["-f", "A", "B"], ["-fi", "A", "B"], ["-nT", "A", "B"], ["A", "-n", "B"], ["A", "B", "-n", "C"],
+        ["--", "-A", "B"], ["-n", "--", "A", "B"], ["--no", "A", "B"], ["--unknown", "A"], ["-d", "A", "B"],
+        ["--directory", "A"], ["-m", "755", "A"], ["--mode=755", "-p", "A/B"], ["-1", "A"], ["A B", "C"],
+        ["--backup", "A", "B"], ["--backup=numbered", "A", "B"], ["--preserve=mode,ownership", "A", "B"],
+        ["--remove-destination", "-t", "DIR", "A", "B"], ["-s", "TARGET"], ["-s", "-f", "TARGET", "LINK"],
+        ["NAME", "TYPE", "1", "2"], ["NAME", "TYPE", "1"], ["-v=", "A", "B"], ["--verbose=x", "A", "B"],
+    ]
+
+    def test_coreutils_equivalence(self):
+        for path in sorted(os.listdir(COREUTILS_UNDO_DIR)):
+            if not path.endswith(".toml"):
+                continue
+
+            data = toml.load(os.path.join(COREUTILS_UNDO_DIR, path))
+            common = parse_argument_group_pattern(f"({data.get('common', '')})")[0].args
+
+            for entry in data["entry"]:
+                cmd_pattern = parse_command_pattern(entry["cmd"])
+                cmd_pattern = cmd_pattern.with_arguments(common)
+
+                parser = pattern_to_argparse(cmd_pattern)
+                matcher = pattern_to_matcher(cmd_pattern)
+
+                for argv in self.ARGVS:
+                    try:
+                        expected = vars(parser.parse_args(argv))
+                    except argparse.ArgumentError:
+                        expected = None
+
+                    with self.subTest(cmd=entry["cmd"], argv=argv):
+                        self.assertEqual(expected, matcher.match(argv))
+
+
+def load_coreutils_patterns() -> dict[str, list[CommandPattern]]:
+    """Load the command patterns, including their common arguments, of every coreutils entry keyed by command."""
+    patterns = dict()
+
+    for path in sorted(os.listdir(COREUTILS_UNDO_DIR)):
+        if not path.endswith(".toml"):
+            continue
+
+        data = toml.load(os.path.join(COREUTILS_UNDO_DIR, path))
+        common = parse_argument_group_pattern(f"({data.get('common', '')})")[0].args
+
+        for entry in data["entry"]:
+            cmd_pattern = parse_command_pattern(entry["cmd"])
+            cmd_pattern = cmd_pattern.with_arguments(common)
+
+            patterns.setdefault(cmd_pattern.command, list()).append(cmd_pattern)
+
+    return patterns
+
+
+class TestMatcherGroup(unittest.TestCase):
+    ARGVS = TestMatcherArgparseEquivalence.ARGVS + [
+        ["-fT", "A", "B"], ["-tDIR", "-f", "A", "B"], ["--target-dir", "DIR", "A"], ["--no-t", "A", "B"],
+        ["-1", "-2"], ["-t=DIR", "A"], ["-S", "SUFFIX", "A", "B"], ["-sf", "TARGET", "LINK"], ["--", "--", "A"],
+        ["-", "A"], ["", "A"], ["-f", "-i", "-n", "A", "B", "C", "D", "E"], ["-b", "A", "B"], ["-Z", "A"],
+    ]
+
+    def test_coreutils_equivalence(self):
+        for command, patterns in load_coreutils_patterns().items():
+            matchers = [pattern_to_matcher(p) for p in patterns]
+            group = MatcherGroup(matchers)
+
+            for argv in self.ARGVS:
+                expected = [(i, m.match(argv)) for i, m in enumerate(matchers) if m.match(argv) is not None]
+
+                with self.subTest(command=command, argv=argv):
+                    self.assertListEqual(expected, list(group.match(argv)))
+
+    def test_candidates(self):
+        group = MatcherGroup([pattern_to_matcher(parse_command_pattern(cmd)) for cmd in [
+            "test <SRC> <DST>",
+            "test [--force] <SRC>",
+            "test <--target=DIR> <SRC...>",
+            "test (![--all] [--none])",
+        ]])
+
+        self.assertListEqual([0], group.candidates(["a", "b"]))
+        self.assertListEqual([1], group.candidates(["--force", "a"]))
+        self.assertListEqual([2], group.candidates(["--target", "dir", "a", "b"]))
+        self.assertListEqual([3], group.candidates(["--all"]))
+        self.assertListEqual([], group.candidates(["--unknown"]))
+        self.assertListEqual([1], group.candidates(["--", "a"]))
+
+        # an abbreviated option could belong to any pattern, so only positional counts rule patterns out
+        self.assertListEqual([1, 2, 3], group.candidates(["--t", "a"]))
+
+    def test_sub_commands(self):
+        group = MatcherGroup([pattern_to_matcher(parse_command_pattern("test sub <SRC>"))])
+
+        self.assertListEqual([], group.candidates(["other", "a"]))
+        self.assertListEqual([(0, {"command": "sub", "SRC": "a"})], list(group.match(["sub", "a"])))
+
+    def test_mismatched_commands(self):
+        with self.assertRaises(ValueError):
+            MatcherGroup([pattern_to_matcher(parse_command_pattern("test")),
+                          pattern_to_matcher(parse_command_pattern("other"))])
+
+
+class TestMatcherTrie(unittest.TestCase):
+    CMDS = [
+        "git [-C=PATH] <ARGS*>",
+        "git remote add <NAME> <URL>",
+        "git remote remove <NAME>",
+        "git remote <ARGS*>",
+        "git branch [-d --delete] <NAME>",
+        "tool sub <ARG>",
+    ]
+
+    def setUp(self):
+        self.matchers = [pattern_to_matcher(parse_command_pattern(cmd)) for cmd in self.CMDS]
+        self.trie = MatcherTrie(self.matchers)
+
+    def assertLinearMatch(self, command: str, argv: list[str]):
+        expected = [(i, m.match(argv)) for i, m in enumerate(self.matchers)
+                    if m.command == command and m.match(argv) is not None]
+
+        self.assertListEqual(expected, self.trie.match(command, argv))
+
+    def test_sub_command_path(self):
+        self.assertListEqual([0, 1, 3], [i for i, _ in self.trie.match("git", ["remote", "add", "origin", "url"])])
+        self.assertListEqual([0, 2, 3], [i for i, _ in self.trie.match("git", ["remote", "remove", "origin"])])
+        self.assertListEqual([(4, {"command": "branch", "DELETE": True, "NAME": "b"})],
+                             self.trie.match("git", ["branch", "-d", "b"]))
+
+    def test_linear_equivalence(self):
+        for command, argv in [("git", []), ("git", ["remote"]), ("git", ["remote", "add"]), ("git", ["status"]),
+                              ("git", ["remote", "add", "a", "b", "c"]), ("tool", ["sub", "a"]), ("tool", ["a"]),
+                              ("other", ["sub", "a"]), ("git", ["-C", "remote", "add", "a", "b"])]:
+            with self.subTest(command=command, argv=argv):
+                self.assertLinearMatch(command, argv)
+
+    def test_commands(self):
+        self.assertDictEqual({"git": [0, 1, 2, 3, 4], "tool": [5]}, self.trie.commands())
+
+
+if __name__ == "__main__":
+    unittest.main()
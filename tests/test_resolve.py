@@ -1,7 +1,10 @@
 import io
 import os
+import pickle
 import unittest
 
+from undo import expand
+from undo import fs
 from undo import resolve
 
 UndoRegistry = resolve.__UndoRegistry
@@ -212,6 +215,57 @@ class TestUndoRegistry(unittest.TestCase):
 
         self.assertListEqual([], registry.resolve("test --unknown-argument", False))
 
+    def test_unbound_identifier(self):
+        registry = UndoRegistry(io.StringIO("""
+        [[entry]]
+        cmd = "test <SRC>"
+        undo = "untest % $DST %"
+        precise = true
+
+        [[entry]]
+        cmd = "test <SRC>"
+        undo = "untest % $SRC %"
+        precise = true
+        """))
+
+        self.assertListEqual([({"SRC": "a"}, "untest % $SRC %")], registry.resolve("test a", False))
+
+    def test_checks_prefetched(self):
+        registry = UndoRegistry(io.StringIO("""
+        [[entry]]
+        cmd = "test <SRC>"
+        undo = "untest % isdir($SRC) ? 'dir' : 'file' %"
+        precise = true
+        """))
+
+        with fs.stat_cache() as stats:
+            resolved = registry.resolve(f"test {RESOURCE_DIR_PATH}", False)
+
+            self.assertEqual(1, len(stats))
+
+            self.assertListEqual(["untest dir"], expand.expand_resolved(resolved, ("%", "%"), "; "))
+
+        self.assertEqual(1, stats.misses)
+        self.assertEqual(1, stats.hits)
+
+    def test_pickled_registry(self):
+        registry = UndoRegistry(io.StringIO("""common = '[--force]'
+
+        [[entry]]
+        cmd = "test <SRC>"
+        undo = "untest % $SRC %"
+        precise = true
+        """))
+
+        expected = [({"SRC": "a", "FORCE": True}, "untest % $SRC %")]
+
+        self.assertListEqual(expected, registry.resolve("test --force a", False))
+
+        unpickled = pickle.loads(pickle.dumps(registry))
+
+        self.assertListEqual(expected, unpickled.resolve("test --force a", False))
+        self.assertListEqual(expected, unpickled.resolve("test --force a", False))
+
 
 class TestResolve(unittest.TestCase):
     TEST_SEARCH_ALL_DIR = os.path.join(RESOURCE_DIR_PATH, "search_all")
@@ -1,7 +1,43 @@
 import os
 import subprocess
+import sys
 import unittest
 
+PACKAGE_DIR_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestImports(unittest.TestCase):
+    MODULES = ["undo.expression", "undo.expand", "undo.cache", "undo.analysis", "undo.batch", "undo.daemon",
+               "undo.resolve"]
+
+    def test_import_first(self):
+        script = ("import {module}, sys, undo\n"
+                  "sys.argv = ['undo', '--no-daemon', '--no-cache', '-d', '--shell', 'bash', '-c', 'test_one']\n"
+                  "undo.main()\n")
+        env = {**os.environ, "PYTHONPATH": PACKAGE_DIR_PATH,
+               "UNDO_INCLUDE_DIRS": os.path.join(os.path.dirname(__file__), "resources", "cli")}
+
+        # each module is imported first in a fresh interpreter, so no earlier import hides a circular import
+        for module in self.MODULES:
+            with self.subTest(module=module):
+                proc = subprocess.run([sys.executable, "-c", script.format(module=module)], capture_output=True,
+                                      env=env)
+
+                self.assertEqual(b"", proc.stderr)
+                self.assertEqual(b"echo 'command found'\n", proc.stdout)
+
+    def test_import_alone(self):
+        modules = sorted(f"undo.{name[:-3]}" for name in os.listdir(os.path.join(PACKAGE_DIR_PATH, "undo"))
+                         if name.endswith(".py") and not name.startswith("__"))
+
+        # library users may import any one module without importing the package's entry points
+        for module in modules + ["undo.pattern"]:
+            with self.subTest(module=module):
+                proc = subprocess.run([sys.executable, "-c", f"import {module}"], capture_output=True,
+                                      env={**os.environ, "PYTHONPATH": PACKAGE_DIR_PATH})
+
+                self.assertEqual(b"", proc.stderr)
+
 
 # todo: these tests fail outside of pycharm
 class TestUndo(unittest.TestCase):
@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from undo import resolve
+from undo import watch
+
+
+class WatcherTestMixin:
+    def create_watcher(self, dirs: list[str]) -> watch.Watcher:
+        raise NotImplementedError
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+        self.path = os.path.join(self.dir, "file.toml")
+
+        with open(self.path, "w") as file:
+            file.write("")
+
+        self.watcher = self.create_watcher([self.dir])
+        self.addCleanup(self.watcher.close)
+
+    def test_no_changes(self):
+        self.assertSetEqual(set(), self.watcher.poll())
+
+    def test_modified(self):
+        with open(self.path, "w") as file:
+            file.write("modified")
+
+        self.assertSetEqual({self.path}, self.watcher.poll())
+        self.assertSetEqual(set(), self.watcher.poll())
+
+    def test_created_and_removed(self):
+        created = os.path.join(self.dir, "created.toml")
+
+        with open(created, "w") as file:
+            file.write("")
+
+        os.remove(self.path)
+
+        self.assertSetEqual({created, self.path}, self.watcher.poll())
+
+    def test_dir_removed_and_recreated(self):
+        shutil.rmtree(self.dir)
+
+        self.assertIn(self.dir, self.watcher.poll())
+
+        os.mkdir(self.dir)
+
+        self.assertIn(self.dir, self.watcher.poll())
+
+    def test_dir_moved(self):
+        moved = self.dir + "-moved"
+
+        os.rename(self.dir, moved)
+        self.addCleanup(shutil.rmtree, moved, True)
+
+        self.assertIn(self.dir, self.watcher.poll())
+
+        with open(os.path.join(moved, "moved.toml"), "w") as file:
+            file.write("")
+
+        self.assertSetEqual(set(), self.watcher.poll())
+
+        os.mkdir(self.dir)
+
+        self.assertIn(self.dir, self.watcher.poll())
+
+        created = os.path.join(self.dir, "created.toml")
+
+        with open(created, "w") as file:
+            file.write("")
+
+        self.assertSetEqual({created}, self.watcher.poll())
+
+
+class TestInotifyWatcher(WatcherTestMixin, unittest.TestCase):
+    def create_watcher(self, dirs: list[str]) -> watch.Watcher:
+        try:
+            return watch.InotifyWatcher(dirs)
+        except watch.WatcherError as err:
+            self.skipTest(str(err))
+
+
+class TestPollingWatcher(WatcherTestMixin, unittest.TestCase):
+    def create_watcher(self, dirs: list[str]) -> watch.Watcher:
+        return watch.PollingWatcher(dirs, interval=0)
+
+    def test_interval(self):
+        watcher = watch.PollingWatcher([self.dir], interval=60)
+
+        os.remove(self.path)
+
+        self.assertSetEqual(set(), watcher.poll())
+
+
+class TestResolver(unittest.TestCase):
+    def setUp(self):
+        self.include_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.include_dir)
+
+        self.write("a.toml", "test", "untest")
+        self.write("b.toml", "other", "unother")
+
+        self.resolver = resolve.Resolver([self.include_dir], watcher=watch.PollingWatcher([self.include_dir], 0))
+        self.addCleanup(self.resolver.close)
+
+    def write(self, name: str, cmd: str, undo: str):
+        with open(os.path.join(self.include_dir, name), "w") as file:
+            file.write(f"[[entry]]\ncmd = '{cmd}'\nundo = '{undo}'\nprecise = true\n")
+
+    def test_resolve(self):
+        self.assertListEqual([(dict(), "untest")], self.resolver.resolve("test", True, False, "bash"))
+        self.assertListEqual([(dict(), "unother")], self.resolver.resolve("other", True, False, "bash"))
+        self.assertListEqual([], self.resolver.resolve("", True, False, "bash"))
+
+        self.assertEqual(2, self.resolver.reloads)
+
+    def test_only_changed_file_reloaded(self):
+        self.write("a.toml", "test", "untest again")
+
+        self.assertListEqual([(dict(), "untest again")], self.resolver.resolve("test", True, False, "bash"))
+        self.assertListEqual([(dict(), "unother")], self.resolver.resolve("other", True, False, "bash"))
+
+        self.assertEqual(3, self.resolver.reloads)
+        self.assertEqual(3, self.resolver.stats()["reloads"])
+
+    def test_include_dir_not_normalised(self):
+        for watcher in [None, watch.PollingWatcher([self.include_dir + os.sep], 0)]:
+            with self.subTest(watcher=watcher):
+                resolver = resolve.Resolver([self.include_dir + os.sep], watcher=watcher)
+                self.addCleanup(resolver.close)
+
+                self.write("a.toml", "test", "untest")
+                self.assertListEqual([(dict(), "untest")], resolver.resolve("test", True, False, "bash"))
+
+                self.write("a.toml", "test", "untest again")
+                self.assertListEqual([(dict(), "untest again")], resolver.resolve("test", True, False, "bash"))
+
+    def test_file_added_and_removed(self):
+        self.write("c.toml", "new", "unnew")
+        os.remove(os.path.join(self.include_dir, "b.toml"))
+
+        self.assertListEqual([(dict(), "unnew")], self.resolver.resolve("new", True, False, "bash"))
+        self.assertListEqual([], self.resolver.resolve("other", True, False, "bash"))
+        self.assertEqual(2, self.resolver.stats()["registries"])
+
+
+if __name__ == "__main__":
+    unittest.main()
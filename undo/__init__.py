@@ -6,9 +6,8 @@ import sys
 import subprocess
 import typing
 
-from undo import expand
+from undo import client
 from undo import history
-from undo import resolve
 from undo import utils
 
 
@@ -78,6 +77,49 @@ def parse_args():
                         action="store_true", help="require user input before running the found undo command even when "
                                                   "there is only one")
 
+    parser.add_argument("--explain",
+                        action="store_true", help="show how each matching undo is expanded, including the values it "
+                                                  "reads and the filesystem checks it makes, but do not run them")
+
+    parser.add_argument("--batch",
+                        nargs="?", const="-", metavar="FILE",
+                        help="resolve every command read from FILE (or stdin if not given) rather than a single command, "
+                             "writing one JSON result per command to stdout without running any of them")
+
+    parser.add_argument("-0", "--null",
+                        action="store_true", help="commands read with '--batch' are delimited by NUL rather than "
+                                                  "newline")
+
+    parser.add_argument("--snapshot-env",
+                        action="store_true", help="read the environment variables used by undo expressions once at the "
+                                                  "start of a '--batch' rather than for every command")
+
+    cache_group = parser.add_argument_group("Cache",
+                                            "control the cache of parsed undo files, stored in '$XDG_CACHE_HOME/undo'"
+                                            ).add_mutually_exclusive_group()
+
+    cache_group.add_argument("--no-cache", action="store_true",
+                             help="do not read or write any cached undo files")
+
+    cache_group.add_argument("--rebuild-cache", action="store_true",
+                             help="ignore any cached undo files and replace them with freshly parsed ones")
+
+    daemon_group = parser.add_argument_group("Daemon",
+                                             "resolve commands with a long-running daemon which keeps the parsed undo "
+                                             "files in memory, falling back to resolving in-process if no daemon is "
+                                             "running")
+
+    daemon_group.add_argument("--socket", metavar="PATH", default=client.default_socket_path(),
+                              help="the path of the daemon socket, defaults to '$XDG_RUNTIME_DIR/undo.sock'")
+
+    daemon_mode_group = daemon_group.add_mutually_exclusive_group()
+
+    daemon_mode_group.add_argument("--daemon", action="store_true",
+                                   help="run the daemon in the foreground rather than resolving a command")
+
+    daemon_mode_group.add_argument("--no-daemon", action="store_true",
+                                   help="always resolve in-process, even if a daemon is running")
+
     shell_env_group = parser.add_argument_group("Parent Shell",
                                                 "control how Undo will determine the parent shell, by default it will "
                                                 "attempt to parse the value form procfs").add_mutually_exclusive_group()
@@ -94,6 +136,113 @@ def parse_args():
     return parser.parse_args()
 
 
+def log_parse_caches():
+    """Log the hits and misses of the caches in front of the expression and pattern parsers."""
+    from undo import expression, pattern
+
+    for name, parse_cache in [("expression", expression.PARSE_CACHE),
+                              ("argument pattern", pattern.ARGUMENT_PATTERN_CACHE),
+                              ("command pattern", pattern.COMMAND_PATTERN_CACHE)]:
+        logging.debug(f"{name} parse cache: {parse_cache.hits} hit(s), {parse_cache.misses} miss(es), "
+                      f"{len(parse_cache)} of {parse_cache.maxsize} kept")
+
+
+def resolve_undos(command: str, include_dirs: list[str], namespace: argparse.Namespace,
+                  shell: str) -> list[typing.Iterator[str]]:
+    """Resolve the undo commands in-process, returning the lazily expanded commands of each undo."""
+    # only imported when needed, so that resolving through the daemon does not pay for importing them
+    from undo import cache, expand, fs, resolve
+
+    registry_cache = None if namespace.no_cache else cache.Cache(cache.default_cache_dir(), namespace.rebuild_cache)
+
+    # every conditional is evaluated when the undos are expanded, so the stat cache is invalidated before any of the
+    # expanded commands are run
+    with fs.stat_cache() as stats:
+        resolved = resolve.resolve(command, include_dirs, namespace.all, namespace.allow_imprecise, shell,
+                                   registry_cache)
+        undos = expand.iter_expand_resolved(resolved, ("%", "%"))
+
+    if registry_cache is not None:
+        logging.debug(f"registry cache: {registry_cache.hits} hit(s), {registry_cache.misses} miss(es)")
+
+    logging.debug(f"stat cache: {stats.misses} stat(s), {stats.hits} hit(s)")
+
+    log_parse_caches()
+
+    return undos
+
+
+def run_explain(command: str, include_dirs: list[str], namespace: argparse.Namespace, shell: str):
+    """Print how each undo matching the command is expanded, always resolving in-process."""
+    from undo import analysis, cache, fs, resolve
+
+    registry_cache = None if namespace.no_cache else cache.Cache(cache.default_cache_dir(), namespace.rebuild_cache)
+
+    with fs.stat_cache():
+        resolved = resolve.resolve(command, include_dirs, namespace.all, namespace.allow_imprecise, shell,
+                                   registry_cache)
+
+        if len(resolved) == 0:
+            print(f"no command was found to undo '{command}'")
+
+        for env, undo in resolved:
+            print(analysis.explain(env, undo))
+
+
+def print_commands(commands: typing.Iterable[str], sep: str = "; "):
+    """Print commands on a single line joined by sep, writing each command as soon as it is expanded."""
+    for i, command in enumerate(commands):
+        if i != 0:
+            sys.stdout.write(sep)
+
+        sys.stdout.write(command)
+
+    sys.stdout.write("\n")
+
+
+def run_commands(commands: typing.Iterable[str]):
+    """Run each command as soon as it is expanded."""
+    for command in commands:
+        subprocess.run(shlex.split(command))
+
+
+def run_daemon(namespace: argparse.Namespace):
+    """Run the daemon in the foreground, exiting if it could not be started."""
+    from undo import cache, daemon
+
+    registry_cache = None if namespace.no_cache else cache.Cache(cache.default_cache_dir(), namespace.rebuild_cache)
+
+    try:
+        daemon.serve(namespace.socket, registry_cache)
+    except (daemon.DaemonRunningError, OSError) as err:
+        logging.critical(f"could not start daemon: {err}")
+
+        sys.exit(1)
+
+
+def run_batch(include_dirs: list[str], namespace: argparse.Namespace, shell: str):
+    """Resolve every command in the batch input, writing one JSON result per line to stdout."""
+    import json
+
+    from undo import batch, cache, resolve, watch
+
+    registry_cache = None if namespace.no_cache else cache.Cache(cache.default_cache_dir(), namespace.rebuild_cache)
+
+    # the undo files are not expected to change during a batch, so they are loaded once and never checked for changes
+    resolver = resolve.Resolver(include_dirs, registry_cache, watch.Watcher(include_dirs))
+
+    stream = sys.stdin if namespace.batch == "-" else open(namespace.batch)
+
+    with stream:
+        commands = batch.read_commands(stream, "\0" if namespace.null else "\n")
+
+        environ = dict(os.environ) if namespace.snapshot_env else None
+
+        for result in batch.resolve_batch(commands, resolver, namespace.all, namespace.allow_imprecise, shell,
+                                          environ):
+            print(json.dumps(result))
+
+
 def main():
     namespace = parse_args()
 
@@ -101,6 +250,10 @@ def main():
 
     logging.basicConfig(format="[%(levelname)s] %(message)s", level=50 - namespace.verbose * 10)
 
+    if namespace.daemon:
+        run_daemon(namespace)
+        return
+
     if namespace.shell is None:
         shell = utils.get_parent_shell(use_env=namespace.force_shell_env,
                                        env_on_error=namespace.shell_env_on_error)
@@ -112,27 +265,57 @@ def main():
 
         sys.exit(1)
 
+    if namespace.batch is not None:
+        try:
+            run_batch(include_dirs, namespace, shell)
+        except OSError as err:
+            logging.critical(f"could not read commands: {err}")
+
+            sys.exit(1)
+
+        return
+
     command = history.history(shell, 1)[0] if namespace.command is None else namespace.command
 
-    resolved = resolve.resolve(command, include_dirs, namespace.all, namespace.allow_imprecise, shell)
+    if namespace.explain:
+        run_explain(command, include_dirs, namespace, shell)
+        return
+
+    undos = None
+
+    if not namespace.no_daemon:
+        try:
+            undos = client.expand(namespace.socket, command, include_dirs, namespace.all, namespace.allow_imprecise,
+                                  shell)
+        except client.DaemonError as err:
+            logging.warning(f"daemon could not resolve command, resolving in-process: {err}")
 
-    # construct set to remove duplicates, and cast to list to allow for accessing elements
-    undos = list({expand.expand(undo, env, ("%", "%"), "; ") for (env, undo) in resolved})
+    if undos is None:
+        undos = resolve_undos(command, include_dirs, namespace, shell)
 
+    # the commands of each undo are printed or run as they are expanded, so they are never all held in memory unless
+    # they must be shown for the user to choose between
     if len(undos) == 0:
         print(f"no command was found to undo '{command}'")
         return
-    elif len(undos) == 1 and not namespace.interactive:
-        subprocess.run(shlex.split(undos[0]))
     elif namespace.dry:
-        print('\n'.join(undos))
+        for undo in undos:
+            print_commands(undo)
+    elif len(undos) == 1 and not namespace.interactive:
+        run_commands(undos[0])
     elif namespace.interactive:
-        undo_command = interact(undos)
+        undos = [list(undo) for undo in undos]
+        choices = ["; ".join(undo) for undo in undos]
+
+        undo_command = interact(choices)
 
         if undo_command is not None:
-            subprocess.run(shlex.split(undo_command))
+            run_commands(undos[choices.index(undo_command)])
         else:
             print("no command was selected")
     else:
         print("multiple undo commands found, copy on the the commands below to clipboard to run: ")
-        print('\n'.join(f"  {i + 1} ) {command}" for i, command in enumerate(undos)))
+
+        for i, undo in enumerate(undos):
+            sys.stdout.write(f"  {i + 1} ) ")
+            print_commands(undo)
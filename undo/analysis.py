@@ -0,0 +1,208 @@
+import dataclasses
+import typing
+
+from undo import expand
+from undo import expression
+
+
+@dataclasses.dataclass(frozen=True)
+class Analysis:
+    """What the expressions of an undo read and check, found without evaluating them."""
+
+    # every identifier read by the expressions, including those only checked for existence
+    identifiers: frozenset[str]
+
+    # the identifiers read whatever the result of any condition, without which the undo is never complete
+    required: frozenset[str]
+
+    # the identifiers whose list values are not expanded, so the undo expands to one command for each of their values
+    unexpanded: frozenset[str]
+
+    # every filesystem check
+    checks: tuple[expression.ConditionalCommandExpression, ...]
+
+    # the filesystem checks evaluated whatever the result of any other condition
+    required_checks: tuple[expression.ConditionalCommandExpression, ...]
+
+    def is_list_valued(self, list_identifiers: typing.AbstractSet[str]) -> bool:
+        """Check if the undo may expand to more than one command.
+
+        :param list_identifiers: the identifiers which may have a list value.
+        :return: True if any of list_identifiers is not expanded.
+        """
+        return not self.unexpanded.isdisjoint(list_identifiers)
+
+    def iter_check_paths(self, env: expression.Env) -> typing.Iterator[str]:
+        """Evaluate the paths of each required filesystem check.
+
+        Any check whose arguments cannot be evaluated is skipped, as the same error is raised when the undo is expanded.
+
+        :param env: the values bound by the match.
+        :return: each path checked by the required filesystem checks.
+        """
+        for check in self.required_checks:
+            # the arguments are evaluated as the check evaluates them, checking each value of a list expanded accessor
+            for arg in check.compile_arguments():
+                try:
+                    value = arg(env)
+                except expression.ExpressionError:
+                    continue
+
+                if isinstance(value, list):
+                    yield from value
+                elif isinstance(value, str):
+                    yield value
+
+
+class _Analyzer:
+    def __init__(self):
+        """Collect the identifiers and checks of each expression visited."""
+        self.identifiers: set[str] = set()
+        self.required: set[str] = set()
+        self.unexpanded: set[str] = set()
+
+        self.checks: list[expression.ConditionalCommandExpression] = list()
+        self.required_checks: list[expression.ConditionalCommandExpression] = list()
+
+    def visit(self, expr: expression.UndoExpression, required: bool, output: bool):
+        """Visit an expression and every expression within it.
+
+        :param expr: the expression to visit.
+        :param required: the expression is evaluated whatever the result of any condition.
+        :param output: the value of the expression is part of the expanded undo rather than joined or checked.
+        """
+        if isinstance(expr, expression.AccessorExpression):
+            name = expr.identifier.body
+
+            self.identifiers.add(name)
+
+            if required:
+                self.required.add(name)
+
+            if output and not expr.list_expand:
+                self.unexpanded.add(name)
+        elif isinstance(expr, expression.StringExpansionExpression):
+            for segment in expr.template.segments:
+                if not isinstance(segment, str):
+                    self.visit(segment, required, output)
+        elif isinstance(expr, expression.TernaryExpression):
+            self.visit(expr.condition, required, False)
+            self.visit(expr.if_value, False, output)
+
+            if expr.else_value is not None:
+                self.visit(expr.else_value, False, output)
+        elif isinstance(expr, expression.ValueCommandExpression):
+            # a function like join reduces any list value to a single string
+            function = expression.FUNCTIONS.get(expr.command.body)
+            output = output and (function is None or function.returns != expression.ReturnKind.STRING)
+
+            for arg in expr.arguments:
+                self.visit(arg, required, output)
+        elif isinstance(expr, expression.ConditionalExpression):
+            chain = list(expr.iter_chain())
+
+            # the checks of a chain are reordered and short-circuited, so only a lone check is always evaluated
+            required = required and len(chain) == 1
+
+            for check in chain:
+                if isinstance(check, expression.ExistenceExpression):
+                    self.identifiers.add(check.identifier.body)
+                elif isinstance(check, expression.ConditionalCommandExpression):
+                    self.checks.append(check)
+
+                    if required:
+                        self.required_checks.append(check)
+
+                    for arg in check.arguments:
+                        self.visit(arg, required, False)
+
+    def analysis(self) -> Analysis:
+        return Analysis(frozenset(self.identifiers), frozenset(self.required), frozenset(self.unexpanded),
+                        tuple(self.checks), tuple(self.required_checks))
+
+
+def analyze(undo: expand.UndoTemplate) -> Analysis:
+    """Analyze the expressions of an undo template.
+
+    :param undo: the undo template to analyze.
+    :return: what the expressions of the undo read and check.
+    """
+    analyzer = _Analyzer()
+
+    for segment in undo.segments:
+        if not isinstance(segment, str):
+            analyzer.visit(segment, True, True)
+
+    return analyzer.analysis()
+
+
+def describe_check(check: expression.ConditionalExpression) -> str:
+    """Describe the single check of a conditional expression, ignoring the rest of the chain."""
+    negate = "!" if check.negate else ""
+
+    if isinstance(check, expression.ExistenceExpression):
+        return f"{negate}{check.identifier.body}"
+    elif isinstance(check, expression.ConditionalCommandExpression):
+        return f"{negate}{check.command.body}({', '.join(describe(arg) for arg in check.arguments)})"
+
+    return repr(check)
+
+
+def describe(expr: expression.UndoExpression) -> str:
+    """Describe an expression with the same syntax it is parsed from."""
+    if isinstance(expr, expression.AccessorExpression):
+        return f"${expr.identifier.body}{'...' if expr.list_expand else ''}"
+    elif isinstance(expr, expression.StringLiteralExpression):
+        return f"'{expr.token.body}'"
+    elif isinstance(expr, expression.StringExpansionExpression):
+        return f"\"{expr.token.body}\""
+    elif isinstance(expr, expression.TernaryExpression):
+        if expr.else_value is None:
+            return f"{describe(expr.condition)} ? {describe(expr.if_value)}"
+
+        return f"{describe(expr.condition)} ? {describe(expr.if_value)} : {describe(expr.else_value)}"
+    elif isinstance(expr, expression.ConditionalExpression):
+        checks = list()
+
+        for check in expr.iter_chain():
+            checks.append(describe_check(check))
+
+            if check.operator is not None:
+                checks.append(check.operator.body)
+
+        return " ".join(checks)
+    elif isinstance(expr, expression.ValueCommandExpression):
+        return f"{expr.command.body}({', '.join(describe(arg) for arg in expr.arguments)})"
+
+    return repr(expr)
+
+
+def explain(env: expression.Env, undo: expand.UndoTemplate) -> str:
+    """Explain how an undo is expanded for the values bound by a match.
+
+    :param env: the values bound by the match.
+    :param undo: the matched undo template.
+    :return: the explanation, over several lines.
+    """
+    result = analyze(undo)
+
+    list_identifiers = {name for name, value in env.items() if isinstance(value, list)}
+    unbound = sorted(name for name in result.required if env.get(name) is None)
+    list_valued = sorted(result.unexpanded & list_identifiers)
+
+    try:
+        expanded = expand.expand(undo, env, undo.bounds, "; ")
+    except (ValueError, TypeError) as err:
+        expanded = f"error: {err}"
+
+    lines = [
+        f"undo: {undo}",
+        f"  reads: {', '.join(sorted(result.identifiers)) or '-'}",
+        f"  requires: {', '.join(sorted(result.required)) or '-'}"
+        + (f" ({', '.join(unbound)} not bound)" if unbound else ""),
+        f"  filesystem checks: {', '.join(describe_check(i) for i in result.checks) or '-'}",
+        f"  list valued: {'yes (' + ', '.join(list_valued) + ')' if list_valued else 'no'}",
+        f"  expands to: {expanded}",
+    ]
+
+    return "\n".join(lines)
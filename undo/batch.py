@@ -0,0 +1,78 @@
+import logging
+import typing
+
+from undo import expand
+from undo import fs
+from undo import resolve
+
+# the amount of characters read at a time when reading NUL delimited commands
+_CHUNK_SIZE = 64 * 1024
+
+
+def read_commands(stream: typing.TextIO, delimiter: str = "\n") -> typing.Iterator[str]:
+    """Lazily read the commands in a stream, skipping any empty commands.
+
+    :param stream: the stream to read.
+    :param delimiter: the character separating each command, either a newline or NUL.
+    :return: each command in the stream.
+    """
+    if delimiter == "\n":
+        for line in stream:
+            if command := line.rstrip("\n"):
+                yield command
+
+        return
+
+    remainder = ""
+
+    while chunk := stream.read(_CHUNK_SIZE):
+        *commands, remainder = (remainder + chunk).split(delimiter)
+
+        yield from filter(None, commands)
+
+    if remainder:
+        yield remainder
+
+
+def resolve_batch(commands: typing.Iterable[str], resolver: resolve.Resolver, search_all: bool,
+                  allow_imprecise: bool, shell: str,
+                  environ: typing.Optional[typing.Mapping[str, str]] = None) -> typing.Iterator[dict[str, typing.Any]]:
+    """Resolve and expand each command using a single resolver, so every undo file is loaded only once.
+
+    :param commands: the commands to resolve.
+    :param resolver: the resolver to use for every command.
+    :param search_all: search all files rather than stopping at the first file with a matching undo pattern.
+    :param allow_imprecise: include imprecise undo patterns in the returned results.
+    :param shell: the shell to use when checking if the current shell is supported by the undo registry.
+    :param environ: a snapshot of the environment variables to fold the env commands of every undo with, or None to
+        read them every time an undo is expanded.
+    :return: for each command a result with the command, the env and undo pattern of each matching entry as
+        "matches", and the unique expanded undo commands as "undos"; or the command and an "error" if it could not be
+        resolved.
+    """
+    # the templates folded with the snapshot, so each undo is only folded the first time it is resolved
+    snapshots: dict[str, expand.UndoTemplate] = dict()
+
+    for command in commands:
+        try:
+            with fs.stat_cache():
+                resolved = resolver.resolve(command, search_all, allow_imprecise, shell)
+
+                if environ is not None:
+                    for _, undo in resolved:
+                        if undo not in snapshots:
+                            snapshots[undo] = undo.snapshot(environ)
+
+                    resolved = [(env, snapshots[undo]) for env, undo in resolved]
+
+                undos = expand.expand_resolved(resolved, ("%", "%"), "; ")
+
+            yield {
+                "command": command,
+                "matches": [{"env": env, "undo": str(undo)} for env, undo in resolved],
+                "undos": undos,
+            }
+        except (ValueError, TypeError) as err:
+            logging.debug(f"could not resolve command '{command}': {err}")
+
+            yield {"command": command, "error": str(err)}
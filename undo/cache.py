@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import typing
+
+# bump whenever the layout of any cached object changes so that stale cache files are discarded rather than loaded
+CACHE_VERSION = 10
+
+
+def cache_version() -> tuple:
+    """Get the version stored with each cache file, which also changes with the registered expression functions since
+    cached registries hold expressions parsed against them.
+    """
+    # imported here so that importing cache, which most entry points import first, never imports expression
+    from undo import expression
+
+    return CACHE_VERSION, expression.functions_signature()
+
+
+def default_cache_dir() -> str:
+    """Get the default directory for undo cache files: '$XDG_CACHE_HOME/undo' or '$HOME/.cache/undo'."""
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.join(cache_home, "undo")
+
+
+def file_signature(path: str) -> tuple[int, int, int]:
+    """Get the signature used to decide if the cached data for a file is still valid.
+
+    :param path: the path to the file.
+    :return: the modification time (ns), size, and inode of the file.
+    """
+    st = os.stat(path)
+
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class Cache:
+    def __init__(self, cache_dir: str, rebuild: bool = False):
+        """A persistent cache of objects compiled from a source file, validated against the file's signature.
+
+        :param cache_dir: the directory to store cache files in, created on the first store.
+        :param rebuild: ignore any existing cache files, forcing every load to miss and be re-stored.
+        """
+        self.cache_dir = cache_dir
+        self.rebuild = rebuild
+
+        self.hits = 0
+        self.misses = 0
+
+    def __cache_path(self, path: str) -> str:
+        digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+
+        return os.path.join(self.cache_dir, f"{digest}.pickle")
+
+    def load(self, path: str, signature: typing.Hashable) -> typing.Optional[typing.Any]:
+        """Load the cached data for the given source file.
+
+        :param path: the path of the source file.
+        :param signature: the current signature of the source file.
+        :return: the cached data, or None if there is no valid cached data.
+        """
+        if self.rebuild:
+            self.misses += 1
+            return None
+
+        try:
+            with open(self.__cache_path(path), "rb") as file:
+                version, cached_path, cached_signature, data = pickle.load(file)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as err:
+            logging.debug(f"could not read cache for '{path}': {err}")
+            self.misses += 1
+            return None
+
+        if version != cache_version() or cached_path != os.path.abspath(path) or cached_signature != signature:
+            logging.debug(f"cache for '{path}' is stale")
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        return data
+
+    def store(self, path: str, signature: typing.Hashable, data: typing.Any):
+        """Store data for the given source file, failing silently if the cache directory is not writable.
+
+        :param path: the path of the source file.
+        :param signature: the signature of the source file at the time data was compiled.
+        :param data: the picklable data to cache.
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            # write to a temporary file first so concurrent readers never see a partially written cache file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    pickle.dump((cache_version(), os.path.abspath(path), signature, data), file,
+                                protocol=pickle.HIGHEST_PROTOCOL)
+
+                os.replace(tmp_path, self.__cache_path(path))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except (OSError, pickle.PicklingError) as err:
+            logging.debug(f"could not write cache for '{path}': {err}")
+
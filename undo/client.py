@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import socket
+import stat
+import struct
+import typing
+
+# a daemon which takes longer than this to answer is treated as unavailable, and the command is resolved in-process
+TIMEOUT = 1.0
+
+
+class DaemonError(RuntimeError):
+    """The daemon could be reached but failed to handle a request, or could not be trusted to handle it."""
+
+
+def default_socket_path() -> str:
+    """Get the per-user path of the daemon socket: '$XDG_RUNTIME_DIR/undo.sock' or '$TMPDIR/undo-$UID/undo.sock'."""
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+
+    if runtime_dir:
+        return os.path.join(runtime_dir, "undo.sock")
+
+    # tempfile.gettempdir is not used to keep the client's imports to a minimum
+    return os.path.join(os.getenv("TMPDIR") or os.path.join(os.sep, "tmp"), f"undo-{os.getuid()}", "undo.sock")
+
+
+def __check_socket(socket_path: str) -> bool:
+    """Check that the socket and its directory belong to the current user, and that no other user may replace the socket.
+
+    :return: True if the socket exists, or False if it does not.
+    :raise DaemonError: if the socket or its directory could have been created by another user.
+    """
+    try:
+        dir_st = os.stat(os.path.dirname(socket_path) or os.curdir)
+        socket_st = os.lstat(socket_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+    except OSError as err:
+        raise DaemonError(f"could not check socket '{socket_path}': {err}")
+
+    if dir_st.st_uid != os.getuid() or dir_st.st_mode & 0o022:
+        raise DaemonError(f"socket directory of '{socket_path}' is not owned by or is writable by other users")
+
+    if socket_st.st_uid != os.getuid() or not stat.S_ISSOCK(socket_st.st_mode):
+        raise DaemonError(f"'{socket_path}' is not a socket owned by the current user")
+
+    return True
+
+
+def __check_peer(sock: socket.socket):
+    """Check that the daemon on the other end of a connected socket is run by the current user, where the platform
+    reports the credentials of the peer.
+
+    :raise DaemonError: if the daemon is run by another user.
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return
+
+    _, uid, _ = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+
+    if uid != os.getuid():
+        raise DaemonError(f"daemon is run by uid {uid} rather than the current user")
+
+
+def request(socket_path: str, op: str, **kwargs) -> typing.Optional[dict]:
+    """Send a single request to the daemon.
+
+    :param socket_path: the path to the daemon socket.
+    :param op: the operation for the daemon to perform.
+    :param kwargs: the arguments of the operation.
+    :return: the daemon's response, or None if no daemon is listening on the socket.
+    :raise DaemonError: if the socket or daemon does not belong to the current user, the response is malformed, or the
+        daemon responded with an error.
+    """
+    if not __check_socket(socket_path):
+        logging.debug(f"no daemon listening on '{socket_path}'")
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(TIMEOUT)
+            sock.connect(socket_path)
+
+            __check_peer(sock)
+
+            sock.sendall(json.dumps({"op": op, **kwargs}).encode("utf-8") + b"\n")
+
+            with sock.makefile("rb") as stream:
+                line = stream.readline()
+    except (FileNotFoundError, ConnectionRefusedError, socket.timeout) as err:
+        logging.debug(f"no daemon listening on '{socket_path}': {err}")
+        return None
+    except OSError as err:
+        logging.debug(f"could not communicate with daemon on '{socket_path}': {err}")
+        return None
+
+    if not line:
+        logging.debug(f"daemon on '{socket_path}' closed the connection without responding")
+        return None
+
+    try:
+        response = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError) as err:
+        raise DaemonError(f"malformed response: {err}")
+
+    if not isinstance(response, dict):
+        raise DaemonError(f"malformed response: expected an object but found '{type(response).__name__}'")
+
+    if "error" in response:
+        raise DaemonError(response["error"])
+
+    return response
+
+
+def expand(socket_path: str, command: str, include_dirs: list[str], search_all: bool, allow_imprecise: bool,
+           shell: str) -> typing.Optional[list[list[str]]]:
+    """Ask the daemon to resolve and expand the undo commands for a command in the caller's working directory and
+    environment.
+
+    :return: the expanded commands of each undo, or None if there is no daemon.
+    :raise DaemonError: for the same reasons as request, or if the response has no valid 'undos'.
+    """
+    response = request(socket_path, "expand", command=command, include_dirs=include_dirs, search_all=search_all,
+                       allow_imprecise=allow_imprecise, shell=shell, cwd=os.getcwd(), environ=dict(os.environ),
+                       separate=True)
+
+    if response is None:
+        return None
+
+    undos = response.get("undos")
+
+    if (not isinstance(undos, list)
+            or not all(isinstance(undo, list) and all(isinstance(i, str) for i in undo) for undo in undos)):
+        raise DaemonError("malformed response: expected 'undos' to be a list of lists of commands")
+
+    return undos
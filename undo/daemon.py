@@ -0,0 +1,214 @@
+import collections
+import contextlib
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import typing
+
+from undo import cache
+from undo import expand
+from undo import fs
+from undo import resolve
+
+
+# the most seconds a connection may be idle before it is closed, well under the time a client waits for a response
+IDLE_TIMEOUT = 0.25
+
+# the most resolvers kept at once, each holding the registries of its include directories and a watcher of them
+MAX_RESOLVERS = 8
+
+
+class DaemonRunningError(RuntimeError):
+    """Another daemon is already listening on the socket."""
+
+
+@contextlib.contextmanager
+def _client_context(cwd: typing.Optional[str], environ: typing.Optional[dict[str, str]]):
+    """Temporarily run in the working directory and environment of the client, so relative paths and environment
+    variables in undo expressions are evaluated as they would be in-process. Requests are handled one at a time, so no
+    other request can observe the change.
+    """
+    old_cwd = os.getcwd()
+    old_environ = dict(os.environ)
+
+    try:
+        if cwd is not None:
+            os.chdir(cwd)
+
+        if environ is not None:
+            os.environ.clear()
+            os.environ.update(environ)
+
+        yield
+    finally:
+        os.chdir(old_cwd)
+
+        if environ is not None:
+            os.environ.clear()
+            os.environ.update(old_environ)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    # connections are handled one at a time, so a client idle for longer than this is disconnected rather than blocking
+    # every other client until they time out
+    timeout = IDLE_TIMEOUT
+
+    def handle(self):
+        # a client may send any number of newline delimited requests over a single connection
+        try:
+            for line in self.rfile:
+                try:
+                    response = self.server.dispatch(json.loads(line))
+                except json.JSONDecodeError as err:
+                    response = {"error": f"bad request: {err}"}
+
+                self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        except TimeoutError:
+            logging.debug(f"closing connection idle for more than {self.timeout}s")
+
+
+class Daemon(socketserver.UnixStreamServer):
+    def __init__(self, socket_path: str, registry_cache: typing.Optional[cache.Cache] = None,
+                 max_resolvers: int = MAX_RESOLVERS):
+        """A server keeping compiled registries in memory and serving resolve and expand requests over a Unix socket.
+
+        A resolve.Resolver is kept for each distinct list of include directories requested, which watches the
+        directories and reloads only the undo files changed between requests. Only the max_resolvers most recently used
+        resolvers are kept, and the watcher of any other resolver is closed.
+
+        Each request is a single line JSON object with an 'op' key, and receives a single line JSON response:
+            ping: {} -> {"pid": PID}
+            stats: {} -> {"resolvers": [{"include_dirs": [DIR, ...], ...Resolver.stats()}, ...]}
+            resolve: {"command", "include_dirs", "search_all", "allow_imprecise", "shell", "cwd"?}
+                -> {"matches": [{"env": ENV, "undo": UNDO}, ...]}
+            expand: {the keys of resolve, "environ"?, "separate"?} -> {"undos": [UNDO, ...]}
+                where each UNDO is a list of its commands if "separate" is true, otherwise its commands joined by "; "
+        Any failed request receives {"error": MESSAGE}.
+
+        :param socket_path: the path of the socket to listen on.
+        :param registry_cache: the cache to load registries from when they are first loaded or changed, or None to
+            always parse the undo files.
+        :param max_resolvers: the most resolvers to keep.
+        """
+        self.socket_path = socket_path
+        self.registry_cache = registry_cache
+
+        self.max_resolvers = max_resolvers
+
+        # the resolver of each distinct list of include directories, from least to most recently used
+        self.__resolvers: collections.OrderedDict[tuple[str, ...], resolve.Resolver] = collections.OrderedDict()
+
+        super().__init__(socket_path, _RequestHandler)
+
+    def __resolve(self, request: dict) -> list[(dict, str)]:
+        include_dirs = tuple(os.path.abspath(i) for i in request["include_dirs"])
+        resolver = self.__resolvers.get(include_dirs)
+
+        if resolver is None:
+            resolver = resolve.Resolver(list(include_dirs), self.registry_cache)
+            self.__resolvers[include_dirs] = resolver
+
+            while len(self.__resolvers) > max(self.max_resolvers, 1):
+                evicted_dirs, evicted = self.__resolvers.popitem(last=False)
+                logging.debug(f"closing resolver for {list(evicted_dirs)}")
+                evicted.close()
+        else:
+            self.__resolvers.move_to_end(include_dirs)
+
+        return resolver.resolve(request["command"], request["search_all"], request["allow_imprecise"],
+                                request["shell"])
+
+    def server_close(self):
+        super().server_close()
+
+        for resolver in self.__resolvers.values():
+            resolver.close()
+
+    def dispatch(self, request: dict) -> dict:
+        """Handle a single decoded request.
+
+        :param request: the request.
+        :return: the response to send to the client.
+        """
+        op = request.get("op")
+        logging.debug(f"handling '{op}' request")
+
+        try:
+            # every request is a separate resolution, and the client only runs the expanded commands after the
+            # response is sent, so a stat cache never outlives the request
+            with _client_context(request.get("cwd"), request.get("environ")), fs.stat_cache():
+                if op == "ping":
+                    return {"pid": os.getpid()}
+                elif op == "stats":
+                    return {"resolvers": [{"include_dirs": list(include_dirs), **resolver.stats()}
+                                          for include_dirs, resolver in self.__resolvers.items()]}
+                elif op == "resolve":
+                    return {"matches": [{"env": env, "undo": str(undo)} for env, undo in self.__resolve(request)]}
+                elif op == "expand" and request.get("separate"):
+                    return {"undos": [list(i) for i in expand.iter_expand_resolved(self.__resolve(request),
+                                                                                    ("%", "%"))]}
+                elif op == "expand":
+                    return {"undos": expand.expand_resolved(self.__resolve(request), ("%", "%"), "; ")}
+        except KeyError as err:
+            return {"error": f"missing required key {err}"}
+        except Exception as err:
+            logging.error(f"could not handle '{op}' request: {err}")
+            return {"error": str(err)}
+
+        return {"error": f"unknown op '{op}'"}
+
+
+def __prepare_socket_path(socket_path: str):
+    """Create the socket's directory only accessible by the current user, and remove any stale socket file.
+
+    :raise DaemonRunningError: if a daemon is already listening on the socket.
+    :raise PermissionError: if the socket's directory is accessible by other users.
+    """
+    socket_dir = os.path.dirname(socket_path)
+
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+
+    st = os.stat(socket_dir)
+
+    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise PermissionError(f"socket directory '{socket_dir}' is writable by other users")
+
+    if not os.path.exists(socket_path):
+        return
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            logging.debug(f"removing stale socket '{socket_path}'")
+            os.unlink(socket_path)
+            return
+
+    raise DaemonRunningError(f"a daemon is already listening on '{socket_path}'")
+
+
+def serve(socket_path: str, registry_cache: typing.Optional[cache.Cache] = None):
+    """Run the daemon in the foreground until interrupted.
+
+    :param socket_path: the path of the socket to listen on.
+    :param registry_cache: the cache to load registries from, or None to always parse the undo files.
+    :raise DaemonRunningError: if a daemon is already listening on the socket.
+    """
+    __prepare_socket_path(socket_path)
+
+    with Daemon(socket_path, registry_cache) as daemon:
+        os.chmod(socket_path, 0o600)
+        logging.info(f"listening on '{socket_path}'")
+
+        # treat a termination like an interrupt so the socket file is always removed
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            logging.info("shutting down")
+        finally:
+            os.unlink(socket_path)
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import logging
 import re
 import typing
@@ -11,89 +13,113 @@ def __join_expanded(expanded: list[typing.Union[str, list[str]]]) -> list[str]:
     :param expanded: the expanded items to join.
     :return: The string value
     """
-    list_values = [(i, val) for i, val in enumerate(expanded) if isinstance(val, list)]
+    return list(iter_join(expanded))
 
-    if len(list_values) == 0:
-        return ["".join(expanded)]
 
-    initial_len = len(list_values[0][1]) if list_values else None
+def iter_join(expanded: typing.Sequence[typing.Union[str, list[str]]]) -> typing.Iterator[str]:
+    """Lazily join the expanded items into a single command, or one command for each value of the list items.
 
-    if not all(len(i) == initial_len for _, i in list_values[1::]):
-        raise ValueError("not all non-expanded list are of the same size")
+    The items are broadcast with `expression.iter_broadcast_join`, so only a single command is held at a time and the
+    memory used does not grow with the size of the list items.
 
-    pairs = zip(*[[(i, j) for j in val] for i, val in list_values])
+    :param expanded: the expanded items to join.
+    :return: each joined command.
+    :raise ValueError: if the list items are not all the same size, raised when called rather than when iterated.
+    """
+    return expression.iter_broadcast_join(expanded)
 
-    result = list()
-    for pair in pairs:
-        cc = expanded.copy()
 
-        for i, v in pair:
-            del(cc[i])
-            cc.insert(i, v)
+def __is_escaped(content: str, head: int) -> bool:
+    """Check if the character at head is escaped by an odd number of backslashes directly before it."""
+    start = head
 
-        result.append("".join(cc))
+    while start > 0 and content[start - 1] == "\\":
+        start -= 1
 
-    return result
+    return (head - start) % 2 == 1
 
 
 def __find_matching_closing_bound(content: str, head: int, open_bound: str, close_bound: str) -> int:
-    depth = 0
+    """Find the end of the expression whose open bound is at head, in a single pass over the expression.
+
+    Escaped bounds are ignored, and any nested open bound must be closed before the expression is closed unless the
+    open and close bounds are the same.
 
-    while head < len(content):
-        if content[head::].startswith(open_bound) and not (open_bound == close_bound and depth != 0):
-            depth += 1
-            head += len(open_bound)
-        elif content[head::].startswith(close_bound) and content[head - 1] != "\\":
+    :return: the index after the matching close bound, or the length of content if there is none.
+    """
+    depth = 1
+    head += len(open_bound)
+
+    # the positions of the next open and close bounds at or after head, each found only when head passes it
+    next_open = -1 if open_bound == close_bound else content.find(open_bound, head)
+    next_close = content.find(close_bound, head)
+
+    while next_close != -1:
+        if next_open != -1 and next_open <= next_close:
+            if __is_escaped(content, next_open):
+                head = next_open + 1
+            else:
+                depth += 1
+                head = next_open + len(open_bound)
+
+            next_open = content.find(open_bound, head)
+        elif __is_escaped(content, next_close):
+            head = next_close + 1
+        else:
             depth -= 1
-            head += len(close_bound)
+            head = next_close + len(close_bound)
 
             if depth == 0:
                 return head
-        else:
-            head += 1
 
-    return head
+            if next_open != -1 and next_open < head:
+                next_open = content.find(open_bound, head)
+
+        next_close = content.find(close_bound, head)
+
+    return len(content)
 
 
 def __separate(content: str, bounds: tuple[str, str]) -> list[str]:
+    """Separate content into literal strings and expressions including their bounds, in a single pass over content.
+
+    :param content: the content to separate.
+    :param bounds: the bounds around an expressions.
+    :return: the literal strings and expressions in the order they appear in content.
+    """
     open_bound = bounds[0]
     close_bound = bounds[1]
 
     result = list()
 
     last = 0
-    head = 0
+    head = content.find(open_bound)
 
-    while head < len(content):
+    while head != -1:
+        if __is_escaped(content, head):
+            head = content.find(open_bound, head + 1)
+            continue
 
-        if content[head::].startswith(open_bound) and content[head - 1] != "\\":
-            if head != last:
-                result.append(content[last:head:])
-                last = head
+        if head != last:
+            result.append(content[last:head])
 
-            head = __find_matching_closing_bound(content, head, open_bound, close_bound)
+        last = __find_matching_closing_bound(content, head, open_bound, close_bound)
+        result.append(content[head:last])
 
-            result.append(content[last:head:])
-            last = head
-        else:
-            head += 1
+        head = content.find(open_bound, last)
 
-    if head != last:
-        result.append(content[last:head:])
+    if last != len(content):
+        result.append(content[last:])
 
     return result
 
 
-def expand(undo: str, env: dict[str, typing.Union[str, list[str]]], bounds: tuple[str, str],
-           command_sep: typing.Optional[str]) -> typing.Union[str, list[str]]:
-    """Expand a string containing 0 or more UndoExpressions in them using the given environment.
+def parse(undo: str, bounds: tuple[str, str]) -> list[typing.Union[str, expression.ValueExpression]]:
+    """Separate a string containing 0 or more UndoExpressions into literal strings and parsed expressions.
 
-    :param undo: the undo pattern to expand.
-    :param env: the dictionary containing the  values to use for evaluating undo expressions.
+    :param undo: the undo pattern to parse.
     :param bounds: the bounds around an expressions.
-    :param command_sep: the join delimiter to use if expansion results in a string.
-    :return: if command_sep is not None or only one command is expanded, then a string of the one or more expanded
-        commands join on command-sep. Otherwise the list of expanded commands.
+    :return: the literal strings and parsed value expressions, in the order they appear in undo.
     :raise ValueError: for any error with bad syntax or format.
     """
     if undo.count("%") % 2 != 0:
@@ -101,22 +127,181 @@ def expand(undo: str, env: dict[str, typing.Union[str, list[str]]], bounds: tupl
 
     expr_regex = rf"{re.escape(bounds[0])}.*?{re.escape(bounds[1])}"
 
-    splits = __separate(undo, bounds)
-
-    expanded = list()
+    segments = list()
 
-    for i in splits:
+    for i in __separate(undo, bounds):
         if re.fullmatch(expr_regex, i):
             expr = expression.parse(i.removeprefix(bounds[0]).removesuffix(bounds[1]).strip())
 
             if isinstance(expr, expression.ValueExpression):
-                expanded.append(expr.evaluate(env))
+                segments.append(expr)
             else:
                 logging.error(f"expected a string value but found a boolean: '{i}'")
         else:
-            expanded.append(i)
+            segments.append(i)
+
+    return segments
+
+
+def compile_segments(segments: typing.Iterable[typing.Union[str, expression.ValueExpression]]) -> list[
+        typing.Union[str, expression.Compiled]]:
+    """Compile the parsed expressions in the segments returned by `parse`, leaving the literal strings as they are."""
+    return [i if isinstance(i, str) else i.compile() for i in segments]
+
+
+def fold_segments(segments: typing.Iterable[typing.Union[str, expression.ValueExpression]],
+                  environ: typing.Optional[typing.Mapping[str, str]] = None) -> (
+        list[typing.Union[str, expression.ValueExpression]], int):
+    """Fold the parsed expressions in the segments returned by `parse`, replacing any expression folded into a string
+    literal with its value and merging it with any literal strings beside it.
+
+    :param segments: the literal strings and parsed expressions to fold.
+    :param environ: a snapshot of the environment variables to fold env commands with, or None to leave them to be read
+        every time the segments are expanded.
+    :return: the folded segments, and the amount of expressions folded.
+    """
+    folded = list()
+    count = 0
+
+    for segment in segments:
+        if not isinstance(segment, str):
+            segment, n = segment.fold(environ)
+            count += n
+
+            if isinstance(segment, expression.StringLiteralExpression):
+                segment = segment.token.body
+
+        if isinstance(segment, str) and folded and isinstance(folded[-1], str):
+            folded[-1] += segment
+        elif segment != "":
+            folded.append(segment)
+
+    return folded, count
+
+
+class UndoTemplate(str):
+    """An undo string compiled once into its literal strings and compiled expressions.
+
+    An UndoTemplate compares and hashes the same as the raw undo string so it may be used anywhere an undo string is
+    expected, but it is parsed, folded, and compiled when it is created, so any syntax error is raised then rather than
+    when it is rendered. Templates are immutable, so a single template may be shared and rendered by any number of
+    callers.
+    """
+
+    def __new__(cls, undo: str, bounds: tuple[str, str],
+                segments: typing.Optional[typing.Sequence[typing.Union[str, expression.ValueExpression]]] = None):
+        """Create a template for an undo string.
+
+        :param undo: the undo string.
+        :param bounds: the bounds around an expressions.
+        :param segments: the already parsed segments of undo, if None undo is parsed and folded.
+        :raise ValueError: for any error with bad syntax or format.
+        """
+        self = super().__new__(cls, undo)
+
+        folded = 0
+
+        if segments is None:
+            segments, folded = fold_segments(parse(undo, bounds))
+
+        segments = tuple(segments)
+
+        object.__setattr__(self, "bounds", bounds)
+        object.__setattr__(self, "segments", segments)
+        object.__setattr__(self, "folded", folded)
+        object.__setattr__(self, "compiled", tuple(compile_segments(segments)))
+
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"'{type(self).__name__}' object is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"'{type(self).__name__}' object is immutable")
 
-    command = __join_expanded(expanded)
+    def __reduce__(self):
+        # the compiled expressions cannot be pickled, and are compiled again from the segments when unpickled
+        return UndoTemplate, (str(self), self.bounds, self.segments)
+
+    def snapshot(self, environ: typing.Mapping[str, str]) -> 'UndoTemplate':
+        """Fold the env commands of the template with a snapshot of the environment variables.
+
+        The returned template never reads the environment variables again, so it should only be used for as long as
+        the snapshot is expected to be up to date.
+
+        :param environ: the snapshot of the environment variables.
+        :return: the folded template, or this template if there is nothing to fold.
+        """
+        segments, folded = fold_segments(self.segments, environ)
+
+        if folded == 0:
+            return self
+
+        template = UndoTemplate(str(self), self.bounds, segments)
+        object.__setattr__(template, "folded", self.folded + folded)
+
+        return template
+
+    def iter_render(self, env: expression.Env) -> typing.Iterator[str]:
+        """Lazily render each command of the template using the given environment.
+
+        :param env: the mapping containing the values to use for evaluating undo expressions.
+        :return: each rendered command, one for each value of any list value not expanded by the template.
+        """
+        return iter_join([i if isinstance(i, str) else i(env) for i in self.compiled])
+
+    def render(self, env: expression.Env,
+               command_sep: typing.Optional[str] = None) -> typing.Union[str, list[str]]:
+        """Render the template using the given environment.
+
+        :param env: the mapping containing the values to use for evaluating undo expressions.
+        :param command_sep: the join delimiter to use if expansion results in a string.
+        :return: the same as `expand`.
+        """
+        return expand_compiled(self.compiled, env, command_sep)
+
+
+def expand(undo: str, env: expression.Env, bounds: tuple[str, str],
+           command_sep: typing.Optional[str]) -> typing.Union[str, list[str]]:
+    """Expand a string containing 0 or more UndoExpressions in them using the given environment.
+
+    :param undo: the undo pattern to expand, if it is an UndoTemplate with the same bounds it will not be parsed again.
+    :param env: the mapping containing the values to use for evaluating undo expressions.
+    :param bounds: the bounds around an expressions.
+    :param command_sep: the join delimiter to use if expansion results in a string.
+    :return: if command_sep is not None or only one command is expanded, then a string of the one or more expanded
+        commands join on command-sep. Otherwise the list of expanded commands.
+    :raise ValueError: for any error with bad syntax or format.
+    """
+    if not isinstance(undo, UndoTemplate) or undo.bounds != bounds:
+        undo = UndoTemplate(undo, bounds)
+
+    return undo.render(env, command_sep)
+
+
+def iter_expand(undo: str, env: expression.Env,
+                bounds: tuple[str, str]) -> typing.Iterator[str]:
+    """Same as `expand` but lazily yielding each expanded command rather than joining them.
+
+    :raise ValueError: for any error with bad syntax or format, raised when called rather than when iterated.
+    """
+    if not isinstance(undo, UndoTemplate) or undo.bounds != bounds:
+        undo = UndoTemplate(undo, bounds)
+
+    return undo.iter_render(env)
+
+
+def expand_compiled(segments: typing.Sequence[typing.Union[str, expression.Compiled]],
+                    env: expression.Env,
+                    command_sep: typing.Optional[str]) -> typing.Union[str, list[str]]:
+    """Expand the literal strings and compiled expressions returned by `compile_segments` using the given environment.
+
+    :param segments: the literal strings and compiled expressions to expand.
+    :param env: the mapping containing the values to use for evaluating undo expressions.
+    :param command_sep: the join delimiter to use if expansion results in a string.
+    :return: the same as `expand`.
+    """
+    command = list(iter_join([i if isinstance(i, str) else i(env) for i in segments]))
 
     if len(command) == 1:
         return command[0]
@@ -125,3 +310,43 @@ def expand(undo: str, env: dict[str, typing.Union[str, list[str]]], bounds: tupl
         return command_sep.join(command)
 
     return command
+
+
+def expand_resolved(resolved: list[(dict, str)], bounds: tuple[str, str], command_sep: str) -> list[str]:
+    """Expand every undo resolved for a command, dropping any duplicate commands.
+
+    :param resolved: the env and undo pattern of each entry matching the command, as returned by `resolve.resolve`.
+    :param bounds: the bounds around an expressions.
+    :param command_sep: the join delimiter to use when an undo expands to multiple commands.
+    :return: the unique expanded undo commands in the order they were resolved.
+    """
+    return [command_sep.join(undo) for undo in iter_expand_resolved(resolved, bounds)]
+
+
+def __env_key(env: dict[str, typing.Any]) -> tuple:
+    """Get a hashable key for the values in an env."""
+    return tuple((key, tuple(val) if isinstance(val, list) else val) for key, val in sorted(env.items()))
+
+
+def iter_expand_resolved(resolved: list[(dict, str)], bounds: tuple[str, str]) -> list[typing.Iterator[str]]:
+    """Expand every undo resolved for a command, dropping any undo which expands to the same commands as an earlier
+    undo.
+
+    A single unique undo is expanded lazily, but when there are several each is expanded in full to compare them.
+
+    :param resolved: the env and undo pattern of each entry matching the command, as returned by `resolve.resolve`.
+    :param bounds: the bounds around an expressions.
+    :return: the expanded commands of each unique undo in the order they were resolved.
+    """
+    unique = dict()
+
+    # an undo with the same pattern and env as an earlier undo expands to the same commands, so it is never expanded
+    for env, undo in resolved:
+        unique.setdefault((str(undo), __env_key(env)), (env, undo))
+
+    if len(unique) == 1:
+        return [iter_expand(undo, env, bounds) for env, undo in unique.values()]
+
+    expanded = dict.fromkeys(tuple(iter_expand(undo, env, bounds)) for env, undo in unique.values())
+
+    return [iter(commands) for commands in expanded]
@@ -1,12 +1,16 @@
 import abc
+import copy
 import dataclasses
 import enum
+import itertools
 import os
 import os.path
 import re
 import typing
 
 from undo import expand
+from undo import fs
+from undo import lru
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # Tokenization classes                                                        #
@@ -39,9 +43,8 @@ class TokenKind(enum.Enum):
     UNKNOWN = enum.auto()
 
 
-@dataclasses.dataclass
-class Token:
-    """Represents a single token in an expression.
+class Token(typing.NamedTuple):
+    """Represents a single immutable token in an expression.
     todo: todo add support for multiple lines for cleaner expressions
     """
     kind: TokenKind
@@ -50,75 +53,81 @@ class Token:
 
 
 __IDENT_REGEX = r"[a-zA-Z0-9]([a-zA-Z0-9_])*"
-__COMMAND_REGEX = r"dirname|basename|abspath|env|join|exists|isfile|isdir"
 __STRING_LITERAL_REGEX = r"'.*?[^\\]'"
 __STRING_EXPANSION_REGEX = r"\".*?[^\\]\""
 __SYMBOL_REGEX = r"\$|\?|:|&&|\|\||!|\.\.\.|,|\(|\)"
 
 __TOKEN_REGEX = re.compile(rf"\s*({__STRING_EXPANSION_REGEX}|"
                            rf"{__STRING_LITERAL_REGEX}|"
-                           rf"{__COMMAND_REGEX}|"
                            rf"{__IDENT_REGEX}|"
                            rf"{__SYMBOL_REGEX})")
 
 
-def __tokenize(content) -> list[Token]:
-    """Split a string individual tokens."""
+__WHITESPACE_REGEX = re.compile(r"\s*")
+
+# the kind of every token with a fixed body, any other token is a string, a command if it names a registered function,
+# or an identifier
+__TOKEN_KINDS = {
+    "?": TokenKind.TERNARY_IF,
+    ":": TokenKind.TERNARY_ELSE,
+    "&&": TokenKind.AND,
+    "||": TokenKind.OR,
+    "!": TokenKind.NOT,
+    "...": TokenKind.ELLIPSE,
+    ",": TokenKind.COMMA,
+    "(": TokenKind.OPEN_PARENTHESE,
+    ")": TokenKind.CLOSE_PARENTHESE,
+    "$": TokenKind.ACCESSOR,
+}
+
+
+def __iter_tokens(content: str) -> typing.Iterator[Token]:
+    """Lazily split a string into individual tokens in a single pass over the string.
+
+    :param content: the string to split.
+    :return: each token in the string.
+    :raise TokenError: when no token can be matched.
+    """
     offset = 0
-    tokens = []
+    size = len(content)
 
-    while offset < len(content):
-        m = __TOKEN_REGEX.match(content[offset:])
+    while offset < size:
+        m = __TOKEN_REGEX.match(content, offset)
 
         if m is None:
-            body = content[offset:].lstrip().split()[0]
-            col = offset
-            token = Token(TokenKind.UNKNOWN, body, col)
-
-            raise TokenError(token, "Unknown token")
-
-        raw_body = m.string[:m.end()]
-        body = raw_body.strip()
-
-        col = offset + 1 + m.end() - len(body)
-
-        if body == "?":
-            kind = TokenKind.TERNARY_IF
-        elif body == ":":
-            kind = TokenKind.TERNARY_ELSE
-        elif body == "&&":
-            kind = TokenKind.AND
-        elif body == "||":
-            kind = TokenKind.OR
-        elif body == "!":
-            kind = TokenKind.NOT
-        elif body == "...":
-            kind = TokenKind.ELLIPSE
-        elif body == ",":
-            kind = TokenKind.COMMA
-        elif body == "(":
-            kind = TokenKind.OPEN_PARENTHESE
-        elif body == ")":
-            kind = TokenKind.CLOSE_PARENTHESE
-        elif body == "$":
-            kind = TokenKind.ACCESSOR
-        elif body in __COMMAND_REGEX.split("|"):
-            kind = TokenKind.COMMAND
-        elif body[0] == "'":
-            kind = TokenKind.STRING_LITERAL
-            body = body[1:-1]
-        elif body[0] == "\"":
-            kind = TokenKind.STRING_EXPANSION
-            body = body[1:-1]
-        else:
-            kind = TokenKind.IDENT
-
-        token = Token(kind, body, col)
-        tokens.append(token)
-
-        offset += m.end()
-
-    return tokens
+            offset = __WHITESPACE_REGEX.match(content, offset).end()
+
+            # only trailing whitespace remains
+            if offset == size:
+                return
+
+            body = content[offset:].split(maxsplit=1)[0]
+
+            raise TokenError(Token(TokenKind.UNKNOWN, body, offset + 1), "Unknown token")
+
+        body = m.group(1)
+        col = m.start(1) + 1
+
+        if (kind := __TOKEN_KINDS.get(body)) is None:
+            if body[0] == "'":
+                kind = TokenKind.STRING_LITERAL
+                body = body[1:-1]
+            elif body[0] == "\"":
+                kind = TokenKind.STRING_EXPANSION
+                body = body[1:-1]
+            elif body in FUNCTIONS:
+                kind = TokenKind.COMMAND
+            else:
+                kind = TokenKind.IDENT
+
+        yield Token(kind, body, col)
+
+        offset = m.end()
+
+
+def __tokenize(content: str) -> list[Token]:
+    """Split a string individual tokens."""
+    return list(__iter_tokens(content))
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -165,27 +174,351 @@ class UnknownCommandException(EvaluationError):
         super().__init__(f"no such command '{command.body}' at col {command.col}")
 
 
+class BroadcastError(EvaluationError):
+    def __init__(self, expected: int, actual: int):
+        super().__init__(f"cannot broadcast list values of different sizes, expected {expected} but found {actual}")
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Broadcasting methods                                                        #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+Value = typing.Union[str, list[str]]
+
+
+def broadcast_size(values: typing.Iterable[Value]) -> typing.Optional[int]:
+    """Get the size every value is broadcast to when they are combined element-wise.
+
+    A string is broadcast to any size, while every list value must have the same size.
+
+    :param values: the values to broadcast.
+    :return: the size of the list values, or None if there are no list values.
+    :raise BroadcastError: if the list values are not all the same size.
+    """
+    size = None
+
+    for value in values:
+        if isinstance(value, list):
+            if size is None:
+                size = len(value)
+            elif len(value) != size:
+                raise BroadcastError(size, len(value))
+
+    return size
+
+
+def broadcast_columns(values: typing.Iterable[Value], size: int) -> list[typing.Iterable[str]]:
+    """Get a column of size elements for each value, repeating each string value size times."""
+    return [value if isinstance(value, list) else itertools.repeat(value, size) for value in values]
+
+
+def broadcast(f: typing.Callable[..., str], *values: Value) -> Value:
+    """Apply f to the values element-wise in a single pass.
+
+    If no value is a list, f is applied to the values once. Otherwise, f is applied to each row of the values, where the
+    row holds the element at the same index of each list value and every string value unchanged. (eg
+    `broadcast(os.path.join, "a", ["b", "c"])` will return ["a/b", "a/c"])
+
+    :param f: the function to apply.
+    :param values: the arguments to f.
+    :return: the result of f, or a list of the result of f for each row.
+    :raise BroadcastError: if the list values are not all the same size.
+    """
+    if (size := broadcast_size(values)) is None:
+        return f(*values)
+
+    if len(values) == 1:
+        return list(map(f, values[0]))
+
+    return list(map(f, *broadcast_columns(values, size)))
+
+
+def iter_broadcast_join(values: typing.Sequence[Value]) -> typing.Iterator[str]:
+    """Lazily concatenate the values element-wise, yielding one string for each row of the values.
+
+    :param values: the values to concatenate.
+    :return: the concatenated values, or each concatenated row if any value is a list.
+    :raise BroadcastError: if the list values are not all the same size, raised when called rather than when iterated.
+    """
+    if (size := broadcast_size(values)) is None:
+        return iter(("".join(values),))
+
+    return map("".join, zip(*broadcast_columns(values, size)))
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Function table                                                              #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+class ReturnKind(enum.Enum):
+    # a string, or a list of strings with a value for each element of any list argument
+    VALUE = enum.auto()
+
+    # a single string, even for list arguments
+    STRING = enum.auto()
+
+    # a boolean, called as a conditional command rather than a value command
+    BOOL = enum.auto()
+
+
+@dataclasses.dataclass(frozen=True)
+class Function:
+    """A function which may be called by name as a command in an expression.
+
+    The implementation is vectorised, it is called once with the evaluated arguments, any of which may be a list,
+    rather than once for each of their elements.
+    """
+    name: str
+    arity: int
+    returns: ReturnKind
+
+    # the result depends only on the arguments, so a call with string literal arguments may be folded into its result
+    pure: bool
+
+    implementation: typing.Callable[..., typing.Union[Value, bool]]
+
+    def check_arity(self, arguments: typing.Sized):
+        """Check that the function can be called with the given arguments.
+
+        :raise WrongArgumentNum: if the amount of arguments is not the arity of the function.
+        """
+        if len(arguments) != self.arity:
+            raise WrongArgumentNum(self.arity, len(arguments))
+
+
+def mapped(f: typing.Callable[..., str]) -> typing.Callable[..., Value]:
+    """Vectorise a function of strings by broadcasting it over its arguments."""
+    return lambda *values: broadcast(f, *values)
+
+
+def mapped_all(f: typing.Callable[[str], bool]) -> typing.Callable[[Value], bool]:
+    """Vectorise a check of a string, which is true for a list only if it is true for every element."""
+    return lambda value: all(map(f, value)) if isinstance(value, list) else f(value)
+
+
+def __join(value: Value, delim: str) -> str:
+    return value if isinstance(value, str) else delim.join(value)
+
+
+# every function which may be called by an expression, checks of the filesystem are answered from the current stat cache
+# if there is one
+FUNCTIONS: dict[str, Function] = {function.name: function for function in [
+    Function("dirname", 1, ReturnKind.VALUE, True, mapped(os.path.dirname)),
+    Function("basename", 1, ReturnKind.VALUE, True, mapped(os.path.basename)),
+    Function("abspath", 1, ReturnKind.VALUE, False, mapped(os.path.abspath)),
+    Function("env", 1, ReturnKind.VALUE, False, mapped(os.getenv)),
+    Function("join", 2, ReturnKind.STRING, True, __join),
+
+    Function("exists", 1, ReturnKind.BOOL, False, mapped_all(fs.exists)),
+    Function("isfile", 1, ReturnKind.BOOL, False, mapped_all(fs.isfile)),
+    Function("isdir", 1, ReturnKind.BOOL, False, mapped_all(fs.isdir)),
+]}
+
+
+def register_function(function: Function, replace: bool = False):
+    """Register a function, so it may be called by any expression parsed afterwards.
+
+    Calls are only recognised in expressions parsed after the function is registered, so it should be registered before
+    any undo file calling it is loaded.
+
+    :param function: the function to register.
+    :param replace: replace any function already registered with the same name.
+    :raise ValueError: if the name of the function is not a valid identifier, or is already registered and replace is
+        False.
+    """
+    if re.fullmatch(__IDENT_REGEX, function.name) is None:
+        raise ValueError(f"function name '{function.name}' is not a valid identifier")
+
+    if function.name in FUNCTIONS and not replace:
+        raise ValueError(f"function '{function.name}' is already registered")
+
+    FUNCTIONS[function.name] = function
+
+    # expressions parsed before the function was registered may have parsed its name as an identifier
+    PARSE_CACHE.clear()
+
+
+def unregister_function(name: str):
+    """Unregister a function, so it may no longer be called by any expression parsed afterwards.
+
+    :param name: the name of the function to unregister.
+    :raise ValueError: if no function is registered with the name.
+    """
+    if FUNCTIONS.pop(name, None) is None:
+        raise ValueError(f"function '{name}' is not registered")
+
+    # expressions parsed while the function was registered may have parsed its name as a command
+    PARSE_CACHE.clear()
+
+
+def functions_signature() -> tuple:
+    """Get the name, arity, return kind, and purity of every registered function.
+
+    Expressions are tokenized, checked, and folded against the registered functions, so an expression parsed with one
+    set of functions may not be valid with another.
+    """
+    return tuple(sorted((function.name, function.arity, function.returns.name, function.pure)
+                        for function in FUNCTIONS.values()))
+
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # Expression classes                                                          #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 
+# the values bound to each identifier, which evaluating an expression only ever reads so a single env may be evaluated
+# from several threads at once without copying or locking it
+Env = typing.Mapping[str, Value]
+
+# the value of any identifier the env does not bind, which is never added to the env; an existence check of such an
+# identifier is false, as is one of an identifier bound to an empty value
+MISSING = ""
+
+# a compiled expression, which evaluates the expression given the map of identifiers and values
+Compiled = typing.Callable[[Env], typing.Any]
+
+
+def fold_expressions(expressions: typing.Iterable['UndoExpression'],
+                     environ: typing.Optional[typing.Mapping[str, str]] = None) -> (list['UndoExpression'], int):
+    """Fold each expression, returning the folded expressions and the total amount of expressions folded."""
+    folded = list()
+    count = 0
+
+    for expr in expressions:
+        expr, n = expr.fold(environ)
+
+        folded.append(expr)
+        count += n
+
+    return folded, count
+
+
 class UndoExpression(abc.ABC):
-    """Represents an expression resulting in a string command."""
+    """Represents an expression resulting in a string command.
+
+    Expressions returned by `parse` are frozen, so they may be shared by any number of callers.
+    """
+
+    def freeze(self) -> 'UndoExpression':
+        """Make the expression and every expression within it immutable, replacing any list of expressions with a
+        tuple.
+
+        :return: this expression.
+        """
+        # the expressions are visited iteratively so long conditional chains do not exhaust the recursion limit
+        stack = [self]
+
+        while stack:
+            expr = stack.pop()
+
+            if isinstance(expr, FrozenExpression):
+                continue
+
+            attributes = expr.__dict__
+
+            for name, value in attributes.items():
+                # most attributes are tokens, strings, or flags which hold no expressions
+                if isinstance(value, (tuple, str, bool)) or value is None:
+                    continue
+                elif isinstance(value, list):
+                    stack.extend(i for i in value if isinstance(i, UndoExpression))
+                    attributes[name] = tuple(value)
+                elif isinstance(value, UndoExpression):
+                    stack.append(value)
+
+            expr.__class__ = frozen_type(type(expr))
+
+        return self
+
+    def compile(self) -> Compiled:
+        """Compile the expression into a function of the map of identifiers and values with the same result as
+        evaluate, doing any work which does not depend on the map ahead of time.
+
+        Sub-classes which do not override compile are compiled into their evaluate method.
+        """
+        return self.evaluate
+
+    def fold(self, environ: typing.Optional[typing.Mapping[str, str]] = None) -> ('UndoExpression', int):
+        """Fold every part of the expression which does not depend on the map of identifiers and values into a string
+        literal, so it is evaluated once rather than every time the expression is evaluated.
+
+        Sub-classes which do not override fold are never folded.
+
+        :param environ: a snapshot of the environment variables to fold env commands with, or None to leave them to be
+            read every time the expression is evaluated.
+        :return: the folded expression, which is this expression if nothing was folded, and the amount of expressions
+            folded.
+        """
+        return self, 0
 
     def __repr__(self):
         return f"{type(self).__name__}({', '.join([f'{name}: {repr(value)}' for name, value in vars(self).items() if name[0] != '_'])})"
 
 
+class FrozenExpression:
+    """Mixin of the frozen sub-class of each expression class, which an expression is changed to when frozen.
+
+    Expressions are only frozen after they are built, so building an expression never pays for checking if it is
+    frozen.
+    """
+
+    __slots__ = ()
+
+    # the class the frozen class was made from
+    thawed: type
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"'{type(self).__name__}' object is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"'{type(self).__name__}' object is immutable")
+
+    def __copy__(self) -> UndoExpression:
+        # a copy is not frozen, so a frozen expression may be copied and modified
+        clone = object.__new__(self.thawed)
+        clone.__dict__.update(self.__dict__)
+
+        return clone
+
+
+def frozen_type(cls: type) -> type:
+    """Get the frozen sub-class of an expression class, which is kept as its Frozen attribute so frozen expressions can
+    be pickled.
+    """
+    if issubclass(cls, FrozenExpression):
+        return cls
+
+    # Frozen is looked up on the class itself, as a sub-class would otherwise inherit the frozen class of its parent
+    if (frozen := cls.__dict__.get("Frozen")) is None:
+        # the mixin comes after the class so the frozen class has the same layout, which allows changing the class of an
+        # expression, while no expression class defines __setattr__ so the mixin still overrides it
+        frozen = type(cls)(cls.__name__, (cls, FrozenExpression), {
+            "__slots__": (),
+            "__module__": cls.__module__,
+            "__qualname__": f"{cls.__qualname__}.Frozen",
+            "thawed": cls,
+        })
+
+        cls.Frozen = frozen
+
+    return frozen
+
+
 class ValueExpression(UndoExpression):
     """An expression that will produce a single string value"""
 
-    def evaluate(self, env: dict[str, typing.Union[str, list[str]]]) -> typing.Union[str, list[str]]:
+    def evaluate(self, env: Env) -> typing.Union[str, list[str]]:
         """Evaluate the result of the expression given the map of identifiers and values."""
 
 
 class ConditionalExpression(UndoExpression):
-    """An expression representing a chain of BooleanExpressions and operators."""
+    """An expression representing a chain of BooleanExpressions and operators.
+
+    Each expression in the chain holds a single check, and the operator joining it to the rest of the chain in right.
+    As in C, '&&' binds more tightly than '||', so `A || B && C` is true if A is true or both B and C are true.
+    """
 
     def __init__(
             self, negate: bool, operator: typing.Optional[Token],
@@ -196,22 +529,88 @@ class ConditionalExpression(UndoExpression):
 
     def __eq__(self, other) -> bool:
         return (isinstance(other, ConditionalExpression)
-                and self.negate and other.negate
+                and self.negate == other.negate
                 and self.operator == other.operator
                 and self.right == other.right)
 
-    def evaluate(self, env: dict[str, typing.Union[str, list[str]]]) -> bool:
+    def cost(self) -> int:
+        """The relative cost of evaluating the single check of this expression, ignoring the rest of the chain."""
+        return 0
+
+    def compile_check(self) -> Compiled:
+        """Compile the single check of this expression, ignoring the rest of the chain.
+
+        Sub-classes which do not override compile_check are compiled into their evaluate method.
+        """
+        return self.evaluate
+
+    def fold_check(self, environ: typing.Optional[typing.Mapping[str, str]] = None) -> ('ConditionalExpression', int):
+        """Fold the single check of this expression, ignoring the rest of the chain.
+
+        The check itself is never folded, only the value expressions it checks.
+        """
+        return self, 0
+
+    def fold(self, environ: typing.Optional[typing.Mapping[str, str]] = None) -> ('ConditionalExpression', int):
+        chain = list(self.iter_chain())
+        checks = [expr.fold_check(environ) for expr in chain]
+        count = sum(n for _, n in checks)
+
+        if count == 0:
+            return self, 0
+
+        # the chain is linked again from copies, so the original chain is left as it was
+        checks = [copy.copy(check) if check is expr else check for (check, _), expr in zip(checks, chain)]
+
+        for check, expr, right in zip(checks, chain, checks[1:]):
+            check.operator = expr.operator
+            check.right = right
+
+        return checks[0], count
+
+    def iter_chain(self) -> typing.Iterator['ConditionalExpression']:
+        """Iterate over each expression in the chain, starting with this one."""
+        expr = self
+
+        while expr is not None:
+            yield expr
+
+            expr = expr.right if expr.operator is not None else None
+
+    def compile(self) -> Compiled:
+        """Compile the chain into a function which short-circuits like the equivalent chain in C.
+
+        The chain is split on '||' into groups of checks joined by '&&'. Every check only reads the map of identifiers
+        and values and the filesystem, so the checks in each group and the groups themselves are ordered by cost without
+        changing the result, so cheap checks like existence expressions are evaluated before filesystem checks.
+        """
+        groups = [[]]
+
+        for expr in self.iter_chain():
+            groups[-1].append(expr)
+
+            if expr.operator is not None and expr.operator.kind == TokenKind.OR:
+                groups.append(list())
+
+        # sorted is stable, so checks of the same cost are evaluated in the order they are written
+        groups = [sorted(group, key=lambda expr: expr.cost()) for group in groups]
+        groups.sort(key=lambda group: sum(expr.cost() for expr in group))
+
+        checks = [[expr.compile_check() for expr in group] for group in groups]
+
+        if len(checks) == 1 and len(checks[0]) == 1:
+            return checks[0][0]
+
+        if len(checks) == 1:
+            group = checks[0]
+
+            return lambda env: all(check(env) for check in group)
+
+        return lambda env: any(all(check(env) for check in group) for group in checks)
+
+    def evaluate(self, env: Env) -> bool:
         """Evaluate the result of the expression given the map of identifier and values."""
-        if self.operator.kind == TokenKind.AND:
-            return (self.negate
-                    and self.evaluate(env)
-                    and self.right.evaluate(env))
-        elif self.operator.kind == TokenKind.OR:
-            return (self.negate
-                    and self.evaluate(env)
-                    or self.right.evaluate(env))
-        elif self.operator.kind is None:
-            return self.negate and self.evaluate(env)
+        return self.compile()(env)
 
 
 # sub-classes
@@ -231,24 +630,42 @@ class AccessorExpression(ValueExpression):
                and self.list_expand == other.list_expand
                and self.delim == other.delim)
 
-    def no_expand_evaluate(self, env: dict[str, typing.Union[str, list[str]]]) -> typing.Union[str, list[str]]:
+    def no_expand_evaluate(self, env: Env) -> typing.Union[str, list[str]]:
         """Same as evaluate expect that list expansion is not performed.
 
         Note that this means that responsibility to join the list value with the delimiter is passed to the caller.
         """
-        return env.setdefault(self.identifier.body, "")
+        return env.get(self.identifier.body, MISSING)
+
+    def compile_no_expand(self) -> Compiled:
+        """Same as compile expect that list expansion is not performed."""
+        name = self.identifier.body
+
+        return lambda env: env.get(name, MISSING)
+
+    def compile(self) -> Compiled:
+        name = self.identifier.body
+        delim = self.delim
+
+        if not self.list_expand:
+            return lambda env: env.get(name, MISSING)
+
+        def accessor(env):
+            val = env.get(name, MISSING)
 
-    def evaluate(self, env: dict[str, typing.Union[str, list[str]]]) -> typing.Union[str, list[str]]:
-        """Retrieve the value corresponding to this expression's identifier or "" if it does not exist in env."""
-        val = env.setdefault(self.identifier.body, "")
+            if isinstance(val, list):
+                if delim is None:
+                    raise ValueError(f"delim cannot be None when expanding list")
 
-        if self.list_expand and isinstance(val, list):
-            if self.delim is None:
-                raise ValueError(f"delim cannot be None when expanding list")
+                return delim.join(val)
 
-            return self.delim.join(val)
+            return val
 
-        return val
+        return accessor
+
+    def evaluate(self, env: Env) -> typing.Union[str, list[str]]:
+        """Retrieve the value corresponding to this expression's identifier or MISSING if it does not exist in env."""
+        return self.compile()(env)
 
 
 class TernaryExpression(ValueExpression):
@@ -265,11 +682,31 @@ class TernaryExpression(ValueExpression):
                 and self.if_value == other.if_value
                 and self.else_value == other.else_value)
 
-    def evaluate(self, env: dict[str, typing.Union[str, list[str]]]) -> typing.Union[str, list[str]]:
-        if self.condition.evaluate(env):
-            return self.if_value.evaluate(env)
-        else:
-            return self.else_value.evaluate(env) if self.else_value is not None else ""
+    def compile(self) -> Compiled:
+        condition = self.condition.compile()
+        if_value = self.if_value.compile()
+        else_value = self.else_value.compile() if self.else_value is not None else lambda env: ""
+
+        return lambda env: if_value(env) if condition(env) else else_value(env)
+
+    def fold(self, environ: typing.Optional[typing.Mapping[str, str]] = None) -> ('TernaryExpression', int):
+        condition, count = self.condition.fold(environ)
+        if_value, n = self.if_value.fold(environ)
+        count += n
+
+        else_value = self.else_value
+
+        if else_value is not None:
+            else_value, n = else_value.fold(environ)
+            count += n
+
+        if count == 0:
+            return self, 0
+
+        return TernaryExpression(condition, if_value, else_value), count
+
+    def evaluate(self, env: Env) -> typing.Union[str, list[str]]:
+        return self.compile()(env)
 
 
 class StringLiteralExpression(ValueExpression):
@@ -280,20 +717,56 @@ class StringLiteralExpression(ValueExpression):
         return (isinstance(other, StringLiteralExpression)
                 and self.token == other.token)
 
-    def evaluate(self, env: dict[str, typing.Union[str, list[str]]]) -> typing.Union[str, list[str]]:
+    def compile(self) -> Compiled:
+        body = self.token.body
+
+        return lambda env: body
+
+    def evaluate(self, env: Env) -> typing.Union[str, list[str]]:
         return self.token.body
 
 
 class StringExpansionExpression(ValueExpression):
-    def __init__(self, token: Token):
+    """A string whose body may contain expressions between backticks.
+
+    The body is compiled into a template only once, either when the expression is parsed or the first time it is
+    evaluated.
+    """
+
+    BOUNDS = ("`", "`")
+
+    def __init__(self, token: Token, template: typing.Optional['expand.UndoTemplate'] = None):
         self.token = token
+        self.__template = template
+
+    @property
+    def template(self) -> 'expand.UndoTemplate':
+        """The template of the body."""
+        if self.__template is None:
+            self.__template = expand.UndoTemplate(self.token.body, self.BOUNDS)
+
+        return self.__template
 
     def __eq__(self, other) -> bool:
         return (isinstance(other, StringExpansionExpression)
                 and self.token == other.token)
 
-    def evaluate(self, env: dict[str, typing.Union[str, list[str]]]) -> typing.Union[str, list[str]]:
-        return expand.expand(self.token.body, env, (r"`", r"`"), None)
+    def compile(self) -> Compiled:
+        return self.template.render
+
+    def evaluate(self, env: Env) -> typing.Union[str, list[str]]:
+        return self.template.render(env)
+
+    def fold(self, environ: typing.Optional[typing.Mapping[str, str]] = None) -> (ValueExpression, int):
+        segments, count = expand.fold_segments(self.template.segments, environ)
+
+        if all(isinstance(i, str) for i in segments):
+            return StringLiteralExpression(Token(TokenKind.STRING_LITERAL, "".join(segments), self.token.col)), count + 1
+
+        if count == 0:
+            return self, 0
+
+        return StringExpansionExpression(self.token, expand.UndoTemplate(self.token.body, self.BOUNDS, segments)), count
 
 
 class ExistenceExpression(ConditionalExpression):
@@ -306,14 +779,18 @@ class ExistenceExpression(ConditionalExpression):
 
     def __eq__(self, other) -> bool:
         return (isinstance(other, ExistenceExpression)
+                and self.negate == other.negate
                 and self.identifier == other.identifier
                 and self.operator == other.operator
                 and self.right == other.right)
 
-    def evaluate(self, env: dict[str, typing.Union[str, list[str]]]) -> bool:
-        exists = env.get(self.identifier.body, "") and True
+    def compile_check(self) -> Compiled:
+        name = self.identifier.body
 
-        return not exists if self.negate else exists
+        if self.negate:
+            return lambda env: not env.get(name)
+
+        return lambda env: bool(env.get(name))
 
 
 # command-expressions
@@ -329,7 +806,12 @@ class CommandExpression(abc.ABC):
     def __eq__(self, other) -> bool:
         return (isinstance(other, CommandExpression)
                 and self.command == other.command
-                and self.arguments == other.arguments)
+                and tuple(self.arguments) == tuple(other.arguments))
+
+    def compile_arguments(self) -> list[Compiled]:
+        """Compile each argument, without list expansion for list expanded accessors."""
+        return [arg.compile_no_expand() if isinstance(arg, AccessorExpression) and arg.list_expand else arg.compile()
+                for arg in self.arguments]
 
 
 class ValueCommandExpression(CommandExpression, ValueExpression):
@@ -337,54 +819,70 @@ class ValueCommandExpression(CommandExpression, ValueExpression):
 
     If the given value returns a list of values, evaluate will return a copy of the list with each element having been
     run through the specified command. (eg `dirname(["/a/b", "c/d"])` will return ["a", "c"])
+
+    The command is looked up in FUNCTIONS when the expression is compiled.
     """
 
-    def __init__(self, command: Token, arguments: list[ValueExpression]):
-        if command.body in {"dirname", "basename", "abspath", "env"} and len(arguments) != 1:
-            raise WrongArgumentNum(1, len(arguments))
-        elif command.body == "join" and len(arguments) != 2:
-            raise WrongArgumentNum(2, len(arguments))
-
-        super().__init__(command, arguments)
-
-    @staticmethod
-    def __wrapper(f: typing.Callable[[str], str], arg: typing.Union[str, list[str]]) -> typing.Union[str, list[str]]:
-        return [f(i) for i in arg] if isinstance(arg, list) else f(arg)
-
-    def __run(self, args: list[str]) -> str:
-        if self.command.body == "dirname":
-            return self.__wrapper(os.path.dirname, args[0])
-        elif self.command.body == "basename":
-            return self.__wrapper(os.path.basename, args[0])
-        elif self.command.body == "abspath":
-            return self.__wrapper(os.path.abspath, args[0])
-        elif self.command.body == "env":
-            return os.getenv(args[0])
-        elif self.command.body == "join":
-            if isinstance(args[0], str):
-                return args[0]
-
-            return args[1].join(args[0])
-
-        raise UnknownCommandException(self.command)
-
-    def evaluate(self, env: dict[str, typing.Union[str, list[str]]]) -> typing.Union[str, list[str]]:
-        args = [arg.no_expand_evaluate(env) if isinstance(arg, AccessorExpression) and arg.list_expand
-                else arg.evaluate(env)
-                for arg in self.arguments]
+    def compile(self) -> Compiled:
+        args = self.compile_arguments()
+        command = self.command
+
+        if (function := FUNCTIONS.get(command.body)) is None or function.returns == ReturnKind.BOOL:
+            def unknown(env):
+                raise UnknownCommandException(command)
+
+            return unknown
+
+        f = function.implementation
 
         if len(args) == 1:
-            result = self.__run(args)
+            arg = args[0]
+            raw_arg = self.arguments[0]
+
+            if not (isinstance(raw_arg, AccessorExpression) and raw_arg.list_expand):
+                return lambda env: f(arg(env))
 
-            if isinstance(args[0], list):
-                raw_arg = self.arguments[0]
+            delim = raw_arg.delim
 
-                if isinstance(raw_arg, AccessorExpression) and raw_arg.list_expand:
-                    return raw_arg.delim.join(result)
+            # the argument was not expanded, so the result is expanded instead
+            def expanded(env):
+                result = f(arg(env))
 
-            return result
+                return delim.join(result) if isinstance(result, list) else result
+
+            return expanded
         elif len(args) == 2:
-            return self.__run(args)
+            first, second = args
+
+            return lambda env: f(first(env), second(env))
+
+        return lambda env: f(*[arg(env) for arg in args])
+
+    def evaluate(self, env: Env) -> typing.Union[str, list[str]]:
+        return self.compile()(env)
+
+    def fold(self, environ: typing.Optional[typing.Mapping[str, str]] = None) -> (ValueExpression, int):
+        arguments, count = fold_expressions(self.arguments, environ)
+        function = FUNCTIONS.get(self.command.body)
+        value = None
+
+        if function is not None and all(isinstance(arg, StringLiteralExpression) for arg in arguments):
+            if function.pure:
+                try:
+                    value = ValueCommandExpression(self.command, arguments).evaluate(dict())
+                except (ValueError, TypeError):
+                    pass
+            elif function.name == "env" and environ is not None and len(arguments) == 1:
+                value = environ.get(arguments[0].token.body)
+
+        # only string values can be folded, so an environment variable which is not set is read when evaluated
+        if isinstance(value, str):
+            return StringLiteralExpression(Token(TokenKind.STRING_LITERAL, value, self.command.col)), count + 1
+
+        if count == 0:
+            return self, 0
+
+        return ValueCommandExpression(self.command, arguments), count
 
 
 class ConditionalCommandExpression(CommandExpression, ConditionalExpression):
@@ -395,9 +893,6 @@ class ConditionalCommandExpression(CommandExpression, ConditionalExpression):
     """
 
     def __init__(self, negate: bool, command: Token, arguments: list[ValueExpression]):
-        if len(arguments) != 1:
-            raise WrongArgumentNum(1, len(arguments))
-
         super(ConditionalCommandExpression, self).__init__(command, arguments)
         super(CommandExpression, self).__init__(negate, None, None)
 
@@ -405,33 +900,55 @@ class ConditionalCommandExpression(CommandExpression, ConditionalExpression):
         return (isinstance(other, ConditionalCommandExpression)
                 and self.negate == other.negate
                 and self.command == other.command
-                and self.arguments == other.arguments
+                and tuple(self.arguments) == tuple(other.arguments)
 
                 and self.operator == other.operator
                 and self.right == other.right)
 
-    @staticmethod
-    def __wrapper(f: typing.Callable[[str], bool], arg: typing.Union[str, list[str]]) -> bool:
-        return all(f(i) for i in arg) if isinstance(arg, list) else f(arg)
-
-    def __run(self, arg: str):
-        if self.command.body == "exists":
-            result = self.__wrapper(os.path.exists, arg)
-        elif self.command.body == "isfile":
-            result = self.__wrapper(os.path.isfile, arg)
-        elif self.command.body == "isdir":
-            result = self.__wrapper(os.path.isdir, arg)
-        else:
-            raise UnknownCommandException(self.command)
-
-        return result if not self.negate else not result
-
-    def evaluate(self, env: dict[str, typing.Union[str, list[str]]]) -> bool:
-        args = [arg.no_expand_evaluate(env) if isinstance(arg, AccessorExpression) and arg.list_expand
-                else arg.evaluate(env)
-                for arg in self.arguments]
-        
-        return all(self.__run(i) for i in args)
+    def cost(self) -> int:
+        # every command checks the filesystem, which is far slower than checking the map of identifiers and values
+        return len(self.arguments)
+
+    def fold_check(self, environ: typing.Optional[typing.Mapping[str, str]] = None) -> ('ConditionalExpression', int):
+        arguments, count = fold_expressions(self.arguments, environ)
+
+        if count == 0:
+            return self, 0
+
+        return ConditionalCommandExpression(self.negate, self.command, arguments), count
+
+    def compile_check(self) -> Compiled:
+        args = self.compile_arguments()
+        negate = self.negate
+        command = self.command
+
+        if (function := FUNCTIONS.get(command.body)) is None or function.returns != ReturnKind.BOOL:
+            # the arguments are still evaluated first, so any error in them is raised before the unknown command
+            def unknown(env):
+                for arg in args:
+                    arg(env)
+
+                raise UnknownCommandException(command)
+
+            return unknown
+
+        f = function.implementation
+
+        if len(args) == 1:
+            arg = args[0]
+
+            if negate:
+                return lambda env: not f(arg(env))
+
+            return lambda env: bool(f(arg(env)))
+
+        return lambda env: bool(f(*[arg(env) for arg in args])) != negate
+
+
+# the frozen classes are made when the module is imported, so they exist before any frozen expression is unpickled
+for __cls in [AccessorExpression, TernaryExpression, StringLiteralExpression, StringExpansionExpression,
+              ExistenceExpression, ValueCommandExpression, ConditionalCommandExpression]:
+    frozen_type(__cls)
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -439,212 +956,224 @@ class ConditionalCommandExpression(CommandExpression, ConditionalExpression):
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 
-def __parse_tokens(tokens: list[Token]) -> UndoExpression:
-    """Parse an UndoExpression from a list of tokens."""
-    try:
-        expr, _ = __parse_value_expression_tokens(tokens)
-    except IndexError:
+def __is_value_function(command: Token) -> bool:
+    """Check if the command is a registered function returning a value rather than a boolean."""
+    return (function := FUNCTIONS.get(command.body)) is not None and function.returns != ReturnKind.BOOL
+
+
+def __kind_at(tokens: list[Token], offset: int) -> typing.Optional[TokenKind]:
+    """Get the kind of the token at offset, or None if there are no more tokens."""
+    return tokens[offset].kind if offset < len(tokens) else None
+
+
+def __expect(tokens: list[Token], offset: int, kind: TokenKind) -> Token:
+    """Get the token at offset, raising a ParseError if it is not of the expected kind."""
+    if offset >= len(tokens):
         raise UnexpectedEndOfLineError()
 
-    return expr
+    if tokens[offset].kind != kind:
+        raise UnexpectedTokenError(kind, tokens[offset].kind)
 
+    return tokens[offset]
 
-def __parse_value_expression_tokens(tokens: list[Token]) -> (ValueExpression, int):
-    # todo: could be optimized by checking first token type and calling the appropriate parser method
-    try:
-        return __parse_value_command_expression_tokens(tokens)
-    except (ParseError, IndexError):
-        pass
 
-    try:
-        return __parse_string_literal_expression_tokens(tokens)
-    except (ParseError, IndexError):
-        pass
+def __parse_tokens(tokens: list[Token]) -> UndoExpression:
+    """Parse an UndoExpression from a list of tokens."""
+    expr, _ = __parse_value_expression_tokens(tokens)
 
-    try:
-        return __parse_string_expansion_expression_tokens(tokens)
-    except (ParseError, IndexError):
-        pass
+    return expr
 
-    try:
-        return __parse_ternary_expression_tokens(tokens)
-    except (ParseError, IndexError):
-        pass
 
-    try:
-        return __parse_accessor_expression_tokens(tokens)
-    except (ParseError, IndexError):
-        pass
+def __parse_value_expression_tokens(tokens: list[Token], offset: int = 0) -> (ValueExpression, int):
+    """Parse a ValueExpression from a list of tokens, choosing the expression to parse from the first token.
+
+    Grammar:
+        VALUE_EXPR = VALUE_COMMAND_EXPR | STRING_LITERAL | STRING_EXPANSION | TERNARY_EXPR | ACCESSOR_EXPR
+    """
+    kind = __kind_at(tokens, offset)
+
+    if kind == TokenKind.COMMAND and __is_value_function(tokens[offset]):
+        return __parse_value_command_expression_tokens(tokens, offset)
+    elif kind in {TokenKind.COMMAND, TokenKind.IDENT, TokenKind.NOT}:
+        return __parse_ternary_expression_tokens(tokens, offset)
+    elif kind == TokenKind.STRING_LITERAL:
+        return __parse_string_literal_expression_tokens(tokens, offset)
+    elif kind == TokenKind.STRING_EXPANSION:
+        return __parse_string_expansion_expression_tokens(tokens, offset)
+    elif kind == TokenKind.ACCESSOR:
+        return __parse_accessor_expression_tokens(tokens, offset)
+    elif kind is None:
+        raise UnexpectedEndOfLineError()
 
     raise ParseError("expected a value expression but found none")
 
 
-def __parse_conditional_expression_tokens(tokens: list[Token]) -> (ConditionalExpression, int):
-    """Parse a ConditionalExpression from a list of tokens."""
-    negate = False
-    offset = 0
+def __parse_single_conditional_expression_tokens(tokens: list[Token], offset: int) -> (ConditionalExpression, int):
+    """Parse a single ExistenceExpression or ConditionalCommandExpression from a list of tokens."""
+    kind = __kind_at(tokens, offset + 1) if __kind_at(tokens, offset) == TokenKind.NOT else __kind_at(tokens, offset)
 
-    try:
-        conditional, token_count = __parse_existence_expression_tokens(tokens)
-    except (ParseError, IndexError):
-        try:
-            conditional, token_count = __parse_conditional_command_expression_tokens(tokens)
-        except (ParseError, IndexError):
-            raise ParseError("expected a conditional expression but found none")
+    if kind == TokenKind.IDENT:
+        return __parse_existence_expression_tokens(tokens, offset)
+    elif kind == TokenKind.COMMAND:
+        return __parse_conditional_command_expression_tokens(tokens, offset)
+    elif kind is None:
+        raise UnexpectedEndOfLineError()
 
-    conditional.negate = negate
+    raise ParseError("expected a conditional expression but found none")
 
-    offset += token_count
 
-    # handle chained conditional operators
-    if len(tokens) > offset and tokens[offset].kind in {TokenKind.AND, TokenKind.OR}:
-        right, token_count = __parse_conditional_expression_tokens(tokens[offset + 1:])
+def __parse_conditional_expression_tokens(tokens: list[Token], offset: int = 0) -> (ConditionalExpression, int):
+    """Parse a chain of ConditionalExpressions from a list of tokens, with each expression holding the operator and
+    the rest of the chain.
 
-        conditional.right = right
-        conditional.operator = tokens[offset]
+    Grammar:
+        CONDITIONAL_EXPR = ( EXISTENCE_EXPR | CONDITIONAL_COMMAND_EXPR ) [ ( '&&' | '||' ) CONDITIONAL_EXPR ]
+    """
+    conditional, offset = __parse_single_conditional_expression_tokens(tokens, offset)
+    last = conditional
 
-        offset += token_count + 1
+    # the chain is parsed iteratively so long chains do not exhaust the recursion limit
+    while __kind_at(tokens, offset) in {TokenKind.AND, TokenKind.OR}:
+        operator = tokens[offset]
+        right, offset = __parse_single_conditional_expression_tokens(tokens, offset + 1)
+
+        last.operator = operator
+        last.right = right
+        last = right
 
     return conditional, offset
 
 
-def __parse_accessor_expression_tokens(tokens: list[Token]) -> (AccessorExpression, int):
+def __parse_accessor_expression_tokens(tokens: list[Token], offset: int = 0) -> (AccessorExpression, int):
     """Parse a ValueExpression from a list of tokens (should consist of a single identifier)."""
-    if tokens[0].kind != TokenKind.ACCESSOR:
-        raise UnexpectedTokenError(TokenKind.ACCESSOR, tokens[0].kind)
-
-    if tokens[1].kind != TokenKind.IDENT:
-        raise UnexpectedTokenError(TokenKind.IDENT, tokens[1].kind)
+    __expect(tokens, offset, TokenKind.ACCESSOR)
+    identifier = __expect(tokens, offset + 1, TokenKind.IDENT)
 
-    if len(tokens) >= 3 and tokens[2].kind == TokenKind.ELLIPSE:
-        return AccessorExpression(tokens[1], True, " "), 3
+    if __kind_at(tokens, offset + 2) == TokenKind.ELLIPSE:
+        return AccessorExpression(identifier, True, " "), offset + 3
 
-    return AccessorExpression(tokens[1], False), 2
+    return AccessorExpression(identifier, False), offset + 2
 
 
-def __parse_ternary_expression_tokens(tokens: list[Token]) -> (TernaryExpression, int):
+def __parse_ternary_expression_tokens(tokens: list[Token], offset: int = 0) -> (TernaryExpression, int):
     """Parse a TernaryExpression from a list of tokens.
 
     Grammar:
         EXISTENCE_EXPR ? VALUE_EXPR [ ':'? VALUE_EXPR ]
     """
-    condition, offset = __parse_conditional_expression_tokens(tokens)
+    condition, offset = __parse_conditional_expression_tokens(tokens, offset)
 
-    if tokens[offset].kind != TokenKind.TERNARY_IF:
-        raise UnexpectedTokenError(TokenKind.TERNARY_IF, tokens[offset].kind)
-    offset += 1
-
-    if_value, token_count = __parse_value_expression_tokens(tokens[offset:])
-    offset += token_count
+    __expect(tokens, offset, TokenKind.TERNARY_IF)
 
+    if_value, offset = __parse_value_expression_tokens(tokens, offset + 1)
     else_value = None
 
-    if len(tokens) > offset and tokens[offset].kind == TokenKind.TERNARY_ELSE:
-        offset += 1
-        else_value, token_count = __parse_value_expression_tokens(tokens[offset:])
-        offset += token_count
+    if __kind_at(tokens, offset) == TokenKind.TERNARY_ELSE:
+        else_value, offset = __parse_value_expression_tokens(tokens, offset + 1)
 
     return TernaryExpression(condition, if_value, else_value), offset
 
 
-def __parse_string_literal_expression_tokens(tokens: list[Token]) -> (StringLiteralExpression, int):
+def __parse_string_literal_expression_tokens(tokens: list[Token],
+                                             offset: int = 0) -> (StringLiteralExpression, int):
     """Parse a StringLiteralExpression from a list of tokens."""
-    if tokens[0].kind != TokenKind.STRING_LITERAL:
-        raise UnexpectedTokenError(TokenKind.STRING_LITERAL, tokens[0].kind)
+    return StringLiteralExpression(__expect(tokens, offset, TokenKind.STRING_LITERAL)), offset + 1
 
-    return StringLiteralExpression(tokens[0]), 1
 
+def __parse_string_expansion_expression_tokens(tokens: list[Token],
+                                               offset: int = 0) -> (StringExpansionExpression, int):
+    """Parse a StringExpansionExpression from a list of tokens, including the expressions in its body."""
+    token = __expect(tokens, offset, TokenKind.STRING_EXPANSION)
 
-def __parse_string_expansion_expression_tokens(tokens: list[Token]) -> (StringExpansionExpression, int):
-    """Parse a StringExpansionExpression from a list of tokens."""
-    if tokens[0].kind != TokenKind.STRING_EXPANSION:
-        raise UnexpectedTokenError(TokenKind.STRING_EXPANSION, tokens[0].kind)
+    # the body is left unfolded, as it is folded along with the template the expression belongs to
+    template = expand.UndoTemplate(token.body, StringExpansionExpression.BOUNDS,
+                                   expand.parse(token.body, StringExpansionExpression.BOUNDS))
 
-    return StringExpansionExpression(tokens[0]), 1
+    return StringExpansionExpression(token, template), offset + 1
 
 
-def __parse_existence_expression_tokens(tokens: list[Token]) -> (ExistenceExpression, int):
+def __parse_existence_expression_tokens(tokens: list[Token], offset: int = 0) -> (ExistenceExpression, int):
     """Parse an ExistenceExpression from a list of tokens.
 
     Grammar:
         EXISTENCE_EXPR = '!' ? IDENT
     """
-    negate = False
-    offset = 0
+    negate = __kind_at(tokens, offset) == TokenKind.NOT
 
-    if tokens[0].kind == TokenKind.NOT:
-        negate = True
+    if negate:
         offset += 1
 
-    if tokens[offset].kind != TokenKind.IDENT:
-        raise UnexpectedTokenError(TokenKind.IDENT, tokens[offset].kind)
-
-    ident = tokens[offset]
+    return ExistenceExpression(negate, __expect(tokens, offset, TokenKind.IDENT)), offset + 1
 
-    offset += 1
 
-    return ExistenceExpression(negate, ident), offset
+def __parse_command_tokens(tokens: list[Token], offset: int = 0) -> (Token, list[ValueExpression], int):
+    """Parse the command and argument from a list of tokens
 
+    Grammar:
+        COMMAND '(' [ VALUE_EXPR ( ',' VALUE_EXPR )* ','? ] ')'
+    """
+    command = __expect(tokens, offset, TokenKind.COMMAND)
+    __expect(tokens, offset + 1, TokenKind.OPEN_PARENTHESE)
 
-def __parse_command_tokens(tokens: list[Token]) -> (Token, list[ValueExpression], int):
-    """Parse the command and argument from a list of tokens"""
-    if tokens[0].kind != TokenKind.COMMAND:
-        raise UnexpectedTokenError(TokenKind.COMMAND, tokens[0].kind)
-    command = tokens[0]
-
-    if tokens[1].kind != TokenKind.OPEN_PARENTHESE:
-        raise UnexpectedTokenError(TokenKind.OPEN_PARENTHESE, tokens[1].kind)
-
-    offset = 2
+    offset += 2
     arguments = list()
 
-    while True:
-        try:
-            argument, token_count = __parse_value_expression_tokens(tokens[offset:])
-        except ParseError:
-            break
-
+    while __kind_at(tokens, offset) != TokenKind.CLOSE_PARENTHESE:
+        argument, offset = __parse_value_expression_tokens(tokens, offset)
         arguments.append(argument)
-        offset += token_count
 
-        if tokens[offset].kind == TokenKind.COMMA:
-            offset += 1
-        else:
+        if __kind_at(tokens, offset) != TokenKind.COMMA:
             break
 
-    if tokens[offset].kind != TokenKind.CLOSE_PARENTHESE:
-        raise UnexpectedTokenError(TokenKind.CLOSE_PARENTHESE, tokens[offset].kind)
+        offset += 1
+
+    __expect(tokens, offset, TokenKind.CLOSE_PARENTHESE)
 
     return command, arguments, offset + 1
 
 
-def __parse_value_command_expression_tokens(tokens: list[Token]) -> (ValueCommandExpression, int):
-    command, arguments, offset = __parse_command_tokens(tokens)
+def __parse_value_command_expression_tokens(tokens: list[Token], offset: int = 0) -> (ValueCommandExpression, int):
+    command = __expect(tokens, offset, TokenKind.COMMAND)
 
-    if command.body not in {"dirname", "basename", "abspath", "env", "join"}:
+    if not __is_value_function(command):
         raise ParseError("expected ValueCommand but found none")
 
+    command, arguments, offset = __parse_command_tokens(tokens, offset)
+    FUNCTIONS[command.body].check_arity(arguments)
+
     return ValueCommandExpression(command, arguments), offset
 
 
-def __parse_conditional_command_expression_tokens(tokens: list[Token]) -> (ConditionalCommandExpression, int):
-    negate = False
-    offset = 0
+def __parse_conditional_command_expression_tokens(tokens: list[Token],
+                                                  offset: int = 0) -> (ConditionalCommandExpression, int):
+    negate = __kind_at(tokens, offset) == TokenKind.NOT
 
-    if tokens[0].kind == TokenKind.NOT:
-        negate = True
+    if negate:
         offset += 1
 
-    command, arguments, token_count = __parse_command_tokens(tokens[offset:])
+    command = __expect(tokens, offset, TokenKind.COMMAND)
 
-    if command.body not in {"exists", "isfile", "isdir"}:
+    if (function := FUNCTIONS.get(command.body)) is None or function.returns != ReturnKind.BOOL:
         raise ParseError("expected ConditionalCommand but found none")
 
-    offset += token_count
+    command, arguments, offset = __parse_command_tokens(tokens, offset)
+    function.check_arity(arguments)
 
     return ConditionalCommandExpression(negate, command, arguments), offset
 
 
+def __parse_frozen(content: str) -> UndoExpression:
+    return __parse_tokens(__tokenize(content)).freeze()
+
+
+# the same expressions are parsed many times, in the bodies of string expansions and the undos of similar entries
+PARSE_CACHE = lru.LRUCache(__parse_frozen)
+
+
 def parse(content: str) -> UndoExpression:
-    """Parse an UndoExpression from a string."""
-    return __parse_tokens(__tokenize(content))
+    """Parse an UndoExpression from a string.
+
+    The expression is frozen and may be shared with any other caller parsing the same string, use copy.copy to get an
+    expression which may be modified.
+    """
+    return PARSE_CACHE(content)
@@ -0,0 +1,140 @@
+import concurrent.futures
+import contextlib
+import contextvars
+import os
+import stat
+import typing
+
+# the most paths stat-ed at once when prefetching, as on a network filesystem each stat mostly waits on the server
+PREFETCH_WORKERS = 8
+
+
+class StatCache:
+    def __init__(self):
+        """The result of at most one os.stat for each distinct path, answering exists, isfile, and isdir from it.
+
+        The cached results become stale as soon as the filesystem changes, so a cache should only be used for a single
+        resolution and must be invalidated before any undo command is run.
+        """
+        self.__stats: dict[str, typing.Optional[os.stat_result]] = dict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def stat(self, path: str) -> typing.Optional[os.stat_result]:
+        """Get the result of os.stat for path, following symlinks, or None if it could not be stat-ed."""
+        try:
+            st = self.__stats[path]
+        except KeyError:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+            return st
+
+        st = self.__stat_uncached(path)
+        self.__stats[path] = st
+
+        return st
+
+    @staticmethod
+    def __stat_uncached(path: str) -> typing.Optional[os.stat_result]:
+        try:
+            return os.stat(path)
+        except (OSError, ValueError):
+            return None
+
+    def prefetch(self, paths: typing.Iterable[str]):
+        """Stat every path which is not already cached, several at a time when there is more than one, so the latency of
+        a slow filesystem is paid once for each batch of paths rather than once for each path.
+        """
+        missing = [path for path in dict.fromkeys(paths) if path not in self.__stats]
+
+        self.misses += len(missing)
+
+        if len(missing) < 2:
+            for path in missing:
+                self.__stats[path] = self.__stat_uncached(path)
+
+            return
+
+        # each worker stats an equal share of the paths, rather than each path being a separate task
+        workers = min(len(missing), PREFETCH_WORKERS)
+        chunks = [missing[i::workers] for i in range(workers)]
+
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            for chunk, stats in zip(chunks, pool.map(lambda chunk: list(map(self.__stat_uncached, chunk)), chunks)):
+                self.__stats.update(zip(chunk, stats))
+
+    def exists(self, path: str) -> bool:
+        """Same as os.path.exists but using the cached stat."""
+        return self.stat(path) is not None
+
+    def isfile(self, path: str) -> bool:
+        """Same as os.path.isfile but using the cached stat."""
+        st = self.stat(path)
+
+        return st is not None and stat.S_ISREG(st.st_mode)
+
+    def isdir(self, path: str) -> bool:
+        """Same as os.path.isdir but using the cached stat."""
+        st = self.stat(path)
+
+        return st is not None and stat.S_ISDIR(st.st_mode)
+
+    def invalidate(self):
+        """Discard every cached stat, so the next check of any path stats it again."""
+        self.__stats.clear()
+
+    def __len__(self) -> int:
+        return len(self.__stats)
+
+
+# the stat cache of the resolution running in the current thread or context, if any
+__current_cache: contextvars.ContextVar[typing.Optional[StatCache]] = contextvars.ContextVar("stat_cache",
+                                                                                            default=None)
+
+
+@contextlib.contextmanager
+def stat_cache() -> typing.Iterator[StatCache]:
+    """Cache every filesystem check made by exists, isfile, and isdir until the context exits, when the cache is
+    invalidated. Resolving and expanding undo commands should be done inside the context, and running them after it.
+    """
+    cache = StatCache()
+    token = __current_cache.set(cache)
+
+    try:
+        yield cache
+    finally:
+        __current_cache.reset(token)
+        cache.invalidate()
+
+
+def prefetch(paths: typing.Iterable[str]):
+    """Stat every path ahead of the checks which need them with the current stat cache, if there is one."""
+    if (cache := __current_cache.get()) is not None:
+        cache.prefetch(paths)
+
+
+def exists(path: str) -> bool:
+    """Same as os.path.exists, but using the current stat cache if there is one."""
+    if (cache := __current_cache.get()) is None:
+        return os.path.exists(path)
+
+    return cache.exists(path)
+
+
+def isfile(path: str) -> bool:
+    """Same as os.path.isfile, but using the current stat cache if there is one."""
+    if (cache := __current_cache.get()) is None:
+        return os.path.isfile(path)
+
+    return cache.isfile(path)
+
+
+def isdir(path: str) -> bool:
+    """Same as os.path.isdir, but using the current stat cache if there is one."""
+    if (cache := __current_cache.get()) is None:
+        return os.path.isdir(path)
+
+    return cache.isdir(path)
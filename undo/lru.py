@@ -0,0 +1,65 @@
+import functools
+import typing
+
+# the amount of results kept by each parse cache, enough for every pattern and expression of a large set of undo files
+DEFAULT_MAXSIZE = 1024
+
+
+class LRUCache:
+    def __init__(self, f: typing.Callable[[typing.Hashable], typing.Any], maxsize: int = DEFAULT_MAXSIZE):
+        """Memoize a function of a single hashable argument, keeping the results for only the maxsize most recently used
+        arguments.
+
+        Results are shared by every caller, so f should only return immutable values. Any error raised by f is not
+        cached. The cache may be used from several threads at once.
+
+        :param f: the function to memoize.
+        :param maxsize: the most results to keep, or 0 to keep none.
+        :raise ValueError: if maxsize is negative.
+        """
+        if maxsize < 0:
+            raise ValueError(f"maxsize must be >= 0 but was '{maxsize}'")
+
+        self.f = f
+
+        self.__cached = functools.lru_cache(maxsize)(f)
+
+        # the hits and misses of any results discarded by clear or a resize
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def hits(self) -> int:
+        return self.__hits + self.__cached.cache_info().hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses + self.__cached.cache_info().misses
+
+    @property
+    def maxsize(self) -> int:
+        """The most results to keep, setting a new size discards every result."""
+        return self.__cached.cache_info().maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize: int):
+        if maxsize < 0:
+            raise ValueError(f"maxsize must be >= 0 but was '{maxsize}'")
+
+        self.clear()
+        self.__cached = functools.lru_cache(maxsize)(self.f)
+
+    def __call__(self, key: typing.Hashable) -> typing.Any:
+        return self.__cached(key)
+
+    def clear(self):
+        """Discard every result, leaving the hit and miss counts as they are."""
+        info = self.__cached.cache_info()
+
+        self.__hits += info.hits
+        self.__misses += info.misses
+
+        self.__cached.cache_clear()
+
+    def __len__(self) -> int:
+        return self.__cached.cache_info().currsize
@@ -1,4 +1,5 @@
 from .pattern import *
+from .matcher import CommandMatcher, MatcherGroup, MatcherTrie, pattern_to_matcher
 
 import argparse
 
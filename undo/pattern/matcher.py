@@ -0,0 +1,646 @@
+import re
+import typing
+
+from .pattern import ArgumentPattern, CommandPattern, PatternError, Quantifier
+
+# the nargs values used by CommandMatcher mirror those used by argparse
+_OPTIONAL = "?"
+_ANY = "*"
+_AT_LEAST_ONE = "+"
+
+_NEGATIVE_NUMBER_REGEX = re.compile(r"^-\d+$|^-\d*\.\d+$")
+
+
+class _Action:
+    """A single argument of a CommandMatcher."""
+
+    __slots__ = ("dest", "option_strings", "nargs", "required", "const", "delim", "pattern")
+
+    def __init__(self, dest: str, option_strings: list[str], nargs: typing.Union[int, str, None], required: bool,
+                 const: typing.Any, delim: typing.Optional[str]):
+        self.dest = dest
+        self.option_strings = option_strings
+        self.nargs = nargs
+        self.required = required
+        self.const = const
+        self.delim = delim
+
+        self.pattern = _nargs_pattern(nargs, len(option_strings) == 0)
+
+    @property
+    def is_flag(self) -> bool:
+        return self.nargs == 0
+
+    @property
+    def default(self) -> typing.Any:
+        return False if self.is_flag and self.option_strings else None
+
+    def convert(self, value: str) -> typing.Union[str, list[str]]:
+        return value if self.delim is None else [i for i in value.split(self.delim) if i]
+
+
+def _nargs_pattern(nargs: typing.Union[int, str, None], is_positional: bool) -> str:
+    """Build the regex matching the argument kinds ('A' for an argument and '-' for '--') that an action consumes."""
+    if nargs is None:
+        pattern = "(-*A-*)"
+    elif nargs == _OPTIONAL:
+        pattern = "(-*A?-*)"
+    elif nargs == _ANY:
+        pattern = "(-*[A-]*)"
+    elif nargs == _AT_LEAST_ONE:
+        pattern = "(-*A[A-]*)"
+    else:
+        pattern = f"(-*{'-*'.join('A' * nargs)}-*)"
+
+    # options may never consume a '--'
+    if not is_positional:
+        pattern = pattern.replace("-*", "").replace("-", "")
+
+    return pattern
+
+
+def _positional_range(positionals: list[_Action]) -> tuple[int, typing.Optional[int]]:
+    """Get the least and most (or None if unbounded) argument strings that the positionals may consume."""
+    least, most = 0, 0
+
+    for action in positionals:
+        if action.nargs is None:
+            least, most = least + 1, most + 1
+        elif isinstance(action.nargs, int):
+            least, most = least + action.nargs, most + action.nargs
+        elif action.nargs == _OPTIONAL:
+            most += 1
+        else:
+            least, most = least + (action.nargs == _AT_LEAST_ONE), float("inf")
+
+    return least, None if most == float("inf") else most
+
+
+def _option_dest(option_strings: list[str]) -> str:
+    """Derive an argument's name from its option strings in the same way argparse does."""
+    long_option_strings = [i for i in option_strings if i.startswith("--")]
+
+    return (long_option_strings or option_strings)[0].lstrip("-").replace("-", "_")
+
+
+class CommandMatcher:
+    def __init__(self, command_pattern: CommandPattern):
+        """Match argument lists against a CommandPattern with the same semantics as the argparse.ArgumentParser built
+        by `pattern_to_argparse`, but without constructing a parser or raising exceptions for commands which do not
+        match.
+
+        :param command_pattern: the pattern to match commands against.
+        :raise PatternError: if the pattern cannot be converted to a matcher (eg. it has conflicting option strings).
+        """
+        self.command = command_pattern.command
+        self.sub_commands = list(command_pattern.sub_commands)
+
+        self.__actions: list[_Action] = list()
+        self.__positionals: list[_Action] = list()
+        self.__options: dict[str, _Action] = dict()
+        self.__has_negative_number_options = False
+
+        for arg in command_pattern.arguments:
+            self.__add_argument_pattern(arg)
+
+        self.__required_groups: list[list[typing.Optional[str]]] = list()
+
+        # the option strings of which at least one must be given for the command to match, used by MatcherGroup
+        self.required_option_strings: list[frozenset[str]] = [frozenset(action.option_strings)
+                                                              for action in self.__actions
+                                                              if action.required and action.option_strings]
+
+        for group in command_pattern.groups:
+            if group.is_required and len(group.args) > 0:
+                self.__required_groups.append([arg.var_name for arg in group.args])
+
+                if not any(arg.is_positional for arg in group.args):
+                    self.required_option_strings.append(frozenset(i for arg in group.args for i in arg.args))
+
+            for arg in group.args:
+                self.__add_argument_pattern(arg)
+
+        # the identifiers bound by every match, and those of them whose value may be a list
+        self.identifiers = frozenset(action.dest for action in self.__actions) | (
+            frozenset(["command"]) if self.sub_commands else frozenset())
+        self.list_identifiers = frozenset(action.dest for action in self.__actions
+                                          if action.nargs in (_ANY, _AT_LEAST_ONE)
+                                          or (isinstance(action.nargs, int) and action.nargs > 1)
+                                          or action.delim is not None)
+
+        self.option_strings = frozenset(self.__options)
+        self.value_option_strings = frozenset(i for i, action in self.__options.items() if not action.is_flag)
+        self.positional_range = _positional_range(self.__positionals)
+
+        # computed once so that each match only copies the defaults and checks the required actions
+        self.__defaults = {action.dest: action.default for action in self.__actions}
+        self.__required = [action for action in self.__actions if action.required]
+
+        self.__partial_regexes: dict[(int, int), re.Pattern] = dict()
+        self.__option_regexes = {pattern: re.compile(pattern)
+                                 for pattern in {action.pattern for action in self.__options.values()}}
+
+    def __add_argument_pattern(self, arg: ArgumentPattern):
+        quantifier = arg.arg_num.quantifier
+        count = arg.arg_num.count
+
+        if quantifier == Quantifier.FLAG:
+            nargs = 0
+        elif quantifier == Quantifier.OPTIONAL:
+            nargs = _OPTIONAL
+        elif quantifier == Quantifier.AT_LEAST_ONE:
+            nargs = _AT_LEAST_ONE
+        elif quantifier == Quantifier.ANY:
+            nargs = _ANY
+        elif count > 1:
+            nargs = count
+        else:
+            nargs = None
+
+        delim = arg.delim if quantifier == Quantifier.OPTIONAL or nargs is None else None
+        const = list() if quantifier == Quantifier.OPTIONAL and delim is not None else None
+
+        if arg.is_positional:
+            dest = arg.var_name if arg.var_name is not None else str(len(self.__positionals) + 1)
+            action = _Action(dest, list(), nargs, nargs != _OPTIONAL, const, delim)
+
+            self.__positionals.append(action)
+        else:
+            dest = arg.var_name if arg.var_name is not None else _option_dest(arg.args)
+            action = _Action(dest, list(arg.args), nargs, arg.is_required, const, delim)
+
+            for option_string in arg.args:
+                if option_string in self.__options:
+                    raise PatternError(f"conflicting option string: {option_string}")
+
+                if _NEGATIVE_NUMBER_REGEX.match(option_string):
+                    self.__has_negative_number_options = True
+
+                self.__options[option_string] = action
+
+        self.__actions.append(action)
+
+    def __option_tuples(self, arg_string: str) -> list[(_Action, str, typing.Optional[str])]:
+        """Find every option that the given string could be an abbreviation of."""
+        result = list()
+
+        if arg_string[1] == "-":
+            if "=" in arg_string:
+                option_prefix, explicit_arg = arg_string.split("=", 1)
+            else:
+                option_prefix, explicit_arg = arg_string, None
+
+            for option_string, action in self.__options.items():
+                if option_string.startswith(option_prefix):
+                    result.append((action, option_string, explicit_arg))
+        else:
+            short_option_prefix = arg_string[:2]
+            short_explicit_arg = arg_string[2:]
+
+            for option_string, action in self.__options.items():
+                if option_string == short_option_prefix:
+                    result.append((action, option_string, short_explicit_arg))
+                elif option_string.startswith(arg_string):
+                    result.append((action, option_string, None))
+
+        return result
+
+    def __parse_optional(self, arg_string: str) -> typing.Union[None, bool, tuple]:
+        """Classify an argument string.
+
+        :return: None if the string is a positional value, False if it is an ambiguous option, otherwise the matched
+            action (or None for an unknown option), option string, and explicit argument.
+        """
+        if not arg_string or arg_string[0] != "-":
+            return None
+
+        if (action := self.__options.get(arg_string)) is not None:
+            return action, arg_string, None
+
+        if len(arg_string) == 1:
+            return None
+
+        if "=" in arg_string:
+            option_string, explicit_arg = arg_string.split("=", 1)
+
+            if (action := self.__options.get(option_string)) is not None:
+                return action, option_string, explicit_arg
+
+        option_tuples = self.__option_tuples(arg_string)
+
+        if len(option_tuples) > 1:
+            return False
+        elif len(option_tuples) == 1:
+            return option_tuples[0]
+
+        if _NEGATIVE_NUMBER_REGEX.match(arg_string) and not self.__has_negative_number_options:
+            return None
+
+        if " " in arg_string:
+            return None
+
+        return None, arg_string, None
+
+    def __values(self, action: _Action, arg_strings: list[str]) -> typing.Any:
+        """Convert the argument strings consumed by an action into the value stored for the action."""
+        if action.is_flag:
+            return True
+
+        if "--" in arg_strings:
+            arg_strings.remove("--")
+
+        if not arg_strings and action.nargs == _OPTIONAL:
+            return action.const if action.option_strings else None
+        elif not arg_strings and action.nargs == _ANY and not action.option_strings:
+            return arg_strings
+        elif len(arg_strings) == 1 and action.nargs in (None, _OPTIONAL):
+            return action.convert(arg_strings[0])
+
+        return [action.convert(i) for i in arg_strings]
+
+    def __match_partial(self, first: int, arg_strings_pattern: str) -> list[int]:
+        """Match as many of the remaining positionals as possible (starting at index first) against the pattern."""
+        for i in range(len(self.__positionals) - first, 0, -1):
+            regex = self.__partial_regexes.get((first, i))
+
+            if regex is None:
+                regex = re.compile("".join(a.pattern for a in self.__positionals[first:first + i]))
+                self.__partial_regexes[(first, i)] = regex
+
+            if (match := regex.match(arg_strings_pattern)) is not None:
+                return [len(group) for group in match.groups()]
+
+        return list()
+
+    def __match_args(self, arg_strings: list[str]) -> typing.Optional[dict]:
+        option_string_indices: dict[int, tuple] = dict()
+        pattern_parts = list()
+
+        for i, arg_string in enumerate(arg_strings):
+            if arg_string == "--":
+                pattern_parts.append("-")
+                pattern_parts.append("A" * (len(arg_strings) - i - 1))
+                break
+
+            option_tuple = self.__parse_optional(arg_string)
+
+            if option_tuple is False:
+                return None
+            elif option_tuple is None:
+                pattern_parts.append("A")
+            else:
+                option_string_indices[i] = option_tuple
+                pattern_parts.append("O")
+
+        arg_strings_pattern = "".join(pattern_parts)
+
+        values = self.__defaults.copy()
+        seen: set[int] = set()
+        extras: list[str] = list()
+        next_positional = 0
+
+        def take_action(action: _Action, args: list[str]):
+            seen.add(id(action))
+            values[action.dest] = self.__values(action, args)
+
+        def consume_optional(start_index: int) -> int:
+            """Consume the option at start_index and its values, returning the next index or -1 on an error."""
+            action, option_string, explicit_arg = option_string_indices[start_index]
+            action_tuples = list()
+
+            while True:
+                if action is None:
+                    extras.append(arg_strings[start_index])
+                    return start_index + 1
+
+                if explicit_arg is not None:
+                    # an explicit argument can only satisfy a flag or an option which may take exactly one value
+                    if action.is_flag:
+                        arg_count = 0
+                    elif isinstance(action.nargs, int):
+                        arg_count = None
+                    else:
+                        arg_count = 1
+
+                    if arg_count == 0 and option_string[1] != "-" and explicit_arg != "":
+                        # a single-dash flag may be followed by more single-dash options (eg. -xyz is -x -y -z)
+                        action_tuples.append((action, list()))
+                        option_string = option_string[0] + explicit_arg[0]
+
+                        if (action := self.__options.get(option_string)) is None:
+                            return -1
+
+                        explicit_arg = explicit_arg[1:] or None
+                    elif arg_count == 1:
+                        stop = start_index + 1
+                        action_tuples.append((action, [explicit_arg]))
+                        break
+                    else:
+                        return -1
+                else:
+                    start = start_index + 1
+
+                    if (match := self.__option_regexes[action.pattern].match(arg_strings_pattern, start)) is None:
+                        return -1
+
+                    stop = start + len(match.group(1))
+                    action_tuples.append((action, arg_strings[start:stop]))
+                    break
+
+            for action, args in action_tuples:
+                take_action(action, args)
+
+            return stop
+
+        def consume_positionals(start_index: int) -> int:
+            nonlocal next_positional
+
+            arg_counts = self.__match_partial(next_positional, arg_strings_pattern[start_index:])
+
+            for action, arg_count in zip(self.__positionals[next_positional:], arg_counts):
+                take_action(action, arg_strings[start_index: start_index + arg_count])
+                start_index += arg_count
+
+            next_positional += len(arg_counts)
+
+            return start_index
+
+        start_index = 0
+        max_option_string_index = max(option_string_indices) if option_string_indices else -1
+
+        while start_index <= max_option_string_index:
+            next_option_string_index = min(i for i in option_string_indices if i >= start_index)
+
+            if start_index != next_option_string_index:
+                positionals_end_index = consume_positionals(start_index)
+
+                if positionals_end_index > start_index:
+                    start_index = positionals_end_index
+                    continue
+                else:
+                    start_index = positionals_end_index
+
+            if start_index not in option_string_indices:
+                extras += arg_strings[start_index:next_option_string_index]
+                start_index = next_option_string_index
+
+            if (start_index := consume_optional(start_index)) < 0:
+                return None
+
+        stop_index = consume_positionals(start_index)
+
+        if extras or stop_index < len(arg_strings):
+            return None
+
+        if any(id(action) not in seen for action in self.__required):
+            return None
+
+        # ensure that at least one of the required group arguments are present, an empty list is considered present
+        for group in self.__required_groups:
+            if not any(var_name in values and values[var_name] is not None and values[var_name] is not False
+                       for var_name in group):
+                return None
+
+        return values
+
+    def match(self, argv: list[str]) -> typing.Optional[dict]:
+        """Match the arguments of a command (not including the command itself) against the pattern.
+
+        :param argv: the command arguments.
+        :return: the values of each argument in the pattern if argv matches, otherwise None.
+        """
+        if self.sub_commands:
+            if argv[:len(self.sub_commands)] != self.sub_commands:
+                return None
+
+            values = self.__match_args(argv[len(self.sub_commands):])
+
+            return None if values is None else {"command": self.sub_commands[-1], **values}
+
+        return self.__match_args(argv)
+
+
+class MatcherGroup:
+    def __init__(self, matchers: list[CommandMatcher]):
+        """Select which of several matchers for the same command and sub-commands could match an argument list,
+        without running each of them.
+
+        The arguments are classified once against the option strings of every matcher in the group, and each matcher
+        is then ruled out by the options it does not accept, the required options which are missing, and the number of
+        positional values it can take. The selection is conservative: arguments which cannot be classified without a
+        specific matcher (combined short flags, negative numbers, etc.) only ever keep matchers in the selection, so
+        the result of matching is identical to trying every matcher.
+
+        :param matchers: the matchers to group, all with the same command and sub-commands.
+        :raise ValueError: if the matchers do not all have the same command and sub-commands.
+        """
+        self.matchers = list(matchers)
+
+        self.command = self.matchers[0].command if self.matchers else None
+        self.sub_commands = self.matchers[0].sub_commands if self.matchers else list()
+
+        if any(m.command != self.command or m.sub_commands != self.sub_commands for m in self.matchers):
+            raise ValueError("every matcher in a group must have the same command and sub-commands")
+
+        self.__option_strings = frozenset(i for m in self.matchers for i in m.option_strings)
+
+        # bit i of each mask is set if matcher i may accept the option string, or may take values after it
+        self.__accepting: dict[str, int] = dict.fromkeys(self.__option_strings, 0)
+        self.__value_accepting: dict[str, int] = dict.fromkeys(self.__option_strings, 0)
+
+        # for each matcher, the option strings of which at least one must be present for each of its requirements
+        self.__required: list[list[frozenset[str]]] = list()
+
+        for i, matcher in enumerate(self.matchers):
+            for option_string in self.__option_strings:
+                if _may_resolve_to(option_string, matcher.option_strings):
+                    self.__accepting[option_string] |= 1 << i
+
+                if _may_resolve_to(option_string, matcher.value_option_strings):
+                    self.__value_accepting[option_string] |= 1 << i
+
+            self.__required.append([frozenset(i for i in self.__option_strings if _may_resolve_to(i, required))
+                                    for required in matcher.required_option_strings])
+
+    def __classify(self, arg_strings: list[str]) -> typing.Optional[tuple[set[str], int, bool]]:
+        """Classify the arguments once for every matcher.
+
+        :return: None if no matcher can accept the arguments, otherwise the option strings given, the amount of
+            arguments which may be positional values, and whether the option strings given are exactly known.
+        """
+        option_strings = set()
+        positional_count = 0
+        is_exact = True
+
+        for i, arg_string in enumerate(arg_strings):
+            if arg_string == "--":
+                positional_count += len(arg_strings) - i - 1
+                break
+
+            if len(arg_string) < 2 or arg_string[0] != "-":
+                positional_count += 1
+            elif _NEGATIVE_NUMBER_REGEX.match(arg_string) or " " in arg_string:
+                # may be a positional value or an option depending on the options of each matcher
+                positional_count += 1
+                is_exact = False
+            elif arg_string in self.__option_strings:
+                option_strings.add(arg_string)
+
+                # a single-dash option may also be a shorter option followed by more flags or a value
+                is_exact = is_exact and (arg_string[1] == "-" or len(arg_string) == 2)
+            elif "=" in arg_string and (option_string := arg_string.split("=", 1)[0]) in self.__option_strings:
+                option_strings.add(option_string)
+            elif any(i.startswith(arg_string.split("=", 1)[0]) for i in self.__option_strings):
+                # an abbreviation of an option whose meaning depends on the options of each matcher
+                is_exact = False
+            elif arg_string[1] != "-" and arg_string[:2] in self.__option_strings:
+                # a short option followed by its value or more short flags (eg. -tDIR or -xyz)
+                option_strings.add(arg_string[:2])
+                is_exact = False
+            else:
+                return None
+
+        return option_strings, positional_count, is_exact
+
+    def candidates(self, argv: list[str]) -> list[int]:
+        """Find the indices of the matchers which could match the argument list.
+
+        :param argv: the command arguments (not including the command itself).
+        :return: the indices, in order, of the matchers not ruled out.
+        """
+        if argv[:len(self.sub_commands)] != self.sub_commands:
+            return list()
+
+        classified = self.__classify(argv[len(self.sub_commands):])
+
+        if classified is None:
+            return list()
+
+        option_strings, positional_count, is_exact = classified
+
+        mask = (1 << len(self.matchers)) - 1
+        value_mask = 0
+
+        for option_string in option_strings:
+            mask &= self.__accepting[option_string]
+            value_mask |= self.__value_accepting[option_string]
+
+        candidates = list()
+
+        for i, matcher in enumerate(self.matchers):
+            if not mask >> i & 1:
+                continue
+
+            least, most = matcher.positional_range
+
+            if positional_count < least:
+                continue
+
+            if is_exact:
+                if any(option_strings.isdisjoint(required) for required in self.__required[i]):
+                    continue
+
+                # when no option given can take a value, every positional value must go to a positional argument
+                if not value_mask >> i & 1 and most is not None and positional_count > most:
+                    continue
+
+            candidates.append(i)
+
+        return candidates
+
+    def match(self, argv: list[str]) -> typing.Iterator[tuple[int, dict]]:
+        """Match the argument list against every matcher which could match it.
+
+        :param argv: the command arguments (not including the command itself).
+        :return: the index and matched values, in order, of each matching matcher.
+        """
+        for i in self.candidates(argv):
+            if (values := self.matchers[i].match(argv)) is not None:
+                yield i, values
+
+
+class _TrieNode:
+    __slots__ = ("indices", "group", "children")
+
+    def __init__(self):
+        self.indices: list[int] = list()
+        self.group: typing.Optional[MatcherGroup] = None
+        self.children: dict[str, _TrieNode] = dict()
+
+
+class MatcherTrie:
+    def __init__(self, matchers: list[CommandMatcher]):
+        """Index matchers in a trie keyed on their command and sub-commands, so that an argument list is only matched
+        against the matchers whose sub-commands are a prefix of it rather than every matcher for the command.
+
+        Matchers with the same command and sub-commands share a MatcherGroup at their node of the trie.
+
+        :param matchers: the matchers to index.
+        """
+        self.__roots: dict[str, _TrieNode] = dict()
+
+        for i, matcher in enumerate(matchers):
+            node = self.__roots.setdefault(matcher.command, _TrieNode())
+
+            for sub_command in matcher.sub_commands:
+                node = node.children.setdefault(sub_command, _TrieNode())
+
+            node.indices.append(i)
+
+        for root in self.__roots.values():
+            for node in _walk(root):
+                if node.indices:
+                    node.group = MatcherGroup([matchers[i] for i in node.indices])
+
+    def commands(self) -> dict[str, list[int]]:
+        """Map each command to the indices of the matchers for that command, including those with sub-commands."""
+        return {command: sorted(i for node in _walk(root) for i in node.indices)
+                for command, root in self.__roots.items()}
+
+    def match(self, command: str, argv: list[str]) -> list[tuple[int, dict]]:
+        """Match a command against the matchers at each node along its sub-command path.
+
+        :param command: the command name.
+        :param argv: the command arguments (not including the command itself).
+        :return: the index and matched values, in index order, of each matching matcher.
+        """
+        matches = list()
+        node = self.__roots.get(command)
+        depth = 0
+
+        while node is not None:
+            if node.group is not None:
+                matches += [(node.indices[i], values) for i, values in node.group.match(argv)]
+
+            node = node.children.get(argv[depth]) if depth < len(argv) else None
+            depth += 1
+
+        matches.sort(key=lambda match: match[0])
+
+        return matches
+
+
+def _walk(node: _TrieNode) -> typing.Iterator[_TrieNode]:
+    """Iterate over a node and all of its descendants."""
+    yield node
+
+    for child in node.children.values():
+        yield from _walk(child)
+
+
+def _may_resolve_to(option_string: str, option_strings: typing.Iterable[str]) -> bool:
+    """Determine if an option string given in a command may be resolved to any of option_strings, either exactly, as an
+    abbreviation, or as a short option followed by its value or more flags.
+    """
+    return any(i.startswith(option_string) or option_string[1] != "-" and i == option_string[:2]
+               for i in option_strings)
+
+
+def pattern_to_matcher(command_pattern: CommandPattern) -> CommandMatcher:
+    """Converts the given command pattern to a CommandMatcher.
+
+    :param command_pattern: the source CommandPattern to build the CommandMatcher from.
+    :return: The built CommandMatcher.
+    :raise PatternError: if the pattern cannot be converted to a matcher.
+    """
+    return CommandMatcher(command_pattern)
@@ -3,6 +3,8 @@ import enum
 import re
 import typing
 
+from undo import lru
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # Errors                                                                      #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -34,17 +36,23 @@ class ArgNum:
             parameter is ignored.
         :raises
         """
-        self.quantifier = quantifier
-
-        if self.quantifier == Quantifier.N:
+        if quantifier == Quantifier.N:
             if count is None:
                 raise ValueError("'count' must not be None when quantifier is N")
 
             if count < 0:
                 raise ValueError("'count' must be >= 0 but was '{count}'")
-            self.count = count
         else:
-            self.count = None
+            count = None
+
+        object.__setattr__(self, "quantifier", quantifier)
+        object.__setattr__(self, "count", count)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"'{type(self).__name__}' object is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"'{type(self).__name__}' object is immutable")
 
     def __repr__(self):
         return f"{type(self).__name__}({', '.join([f'{name}: {repr(value)}' for name, value in vars(self).items() if name[0] != '_'])})"
@@ -54,15 +62,25 @@ class ArgNum:
                 and self.quantifier == other.quantifier
                 and self.count == other.count)
 
+    def __hash__(self) -> int:
+        return hash((self.quantifier, self.count))
+
 
-@dataclasses.dataclass
+def _freeze_lists(pattern, *names: str):
+    """Replace each of the named list fields of a frozen dataclass with a tuple."""
+    for name in names:
+        if isinstance(value := getattr(pattern, name), list):
+            object.__setattr__(pattern, name, tuple(value))
+
+
+@dataclasses.dataclass(frozen=True)
 class ArgumentPattern:
     # if var_name is optional, it should be assigned in order from 1 - n in the calling method / class
     var_name: typing.Optional[str]
 
     arg_num: typing.Union[ArgNum, int]
 
-    args: list[str]
+    args: tuple[str, ...]
 
     is_positional: bool
     is_required: bool
@@ -70,23 +88,36 @@ class ArgumentPattern:
     # the delim to use when splitting a list argument into each list element
     delim: typing.Optional[str]
 
+    def __post_init__(self):
+        _freeze_lists(self, "args")
+
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class ArgumentGroupPattern:
     is_required: bool
 
-    args: list[ArgumentPattern]
+    args: tuple[ArgumentPattern, ...]
 
+    def __post_init__(self):
+        _freeze_lists(self, "args")
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(frozen=True)
 class CommandPattern:
     command: str
 
-    sub_commands: list[str]
+    sub_commands: tuple[str, ...]
+
+    arguments: tuple[ArgumentPattern, ...]
 
-    arguments: list[ArgumentPattern]
+    groups: tuple[ArgumentGroupPattern, ...]
 
-    groups: list[ArgumentGroupPattern]
+    def __post_init__(self):
+        _freeze_lists(self, "sub_commands", "arguments", "groups")
+
+    def with_arguments(self, arguments: typing.Iterable[ArgumentPattern]) -> 'CommandPattern':
+        """Get a copy of the pattern with the given arguments after its own arguments."""
+        return dataclasses.replace(self, arguments=self.arguments + tuple(arguments))
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -244,29 +275,8 @@ def __parse_delim(content: str) -> (typing.Optional[str], int):
     return delim if delim else None, offset
 
 
-def parse_argument_pattern(content: str) -> (ArgumentPattern, int):
-    """Attempt to parse an ArgumentPattern from a str.
-
-    Note: expects to receive the surrounding bracket (ie "[-d --dir]" not "-d --dir")
-
-    Grammar:
-        OPEN_BRACE := '[' | '<'
-        CLOSE_BRACE := ']' | '>'
-
-        IDENTIFIER := [A-Za-z_]+
-
-        SHORT := '-[a-zA-Z0-9]'
-        LONG := '--[a-zA-Z][a-zA-Z-]*'
-
-        N := '{' [0-9]+ '}'
-
-        DELIM := ':' + .*
-
-        PATTER := OPEN_BRACE (SHORT | LONG)* '['? '='? IDENT? N? ']' DELIM? CLOSE_BRACE
-
-    :param content: the string to parse.
-    :return: the parsed ArgumentPattern if successful.
-    """
+def __parse_argument_pattern(content: str) -> (ArgumentPattern, int):
+    """Same as `parse_argument_pattern`, without the cache."""
     if len(content) == 0:
         raise PatternError("content may not be empty")
 
@@ -315,6 +325,38 @@ def parse_argument_pattern(content: str) -> (ArgumentPattern, int):
     return ArgumentPattern(ident, arg_num, names, is_positional, is_required, delim), offset
 
 
+# the same argument patterns are repeated across the entries of an undo file, and in the common arguments of each file
+ARGUMENT_PATTERN_CACHE = lru.LRUCache(__parse_argument_pattern)
+
+
+def parse_argument_pattern(content: str) -> (ArgumentPattern, int):
+    """Attempt to parse an ArgumentPattern from a str.
+
+    Note: expects to receive the surrounding bracket (ie "[-d --dir]" not "-d --dir")
+
+    Grammar:
+        OPEN_BRACE := '[' | '<'
+        CLOSE_BRACE := ']' | '>'
+
+        IDENTIFIER := [A-Za-z_]+
+
+        SHORT := '-[a-zA-Z0-9]'
+        LONG := '--[a-zA-Z][a-zA-Z-]*'
+
+        N := '{' [0-9]+ '}'
+
+        DELIM := ':' + .*
+
+        PATTER := OPEN_BRACE (SHORT | LONG)* '['? '='? IDENT? N? ']' DELIM? CLOSE_BRACE
+
+    The parsed pattern is immutable and may be shared with any other caller parsing the same string.
+
+    :param content: the string to parse.
+    :return: the parsed ArgumentPattern if successful.
+    """
+    return ARGUMENT_PATTERN_CACHE(content)
+
+
 def parse_argument_group_pattern(content: str) -> (ArgumentGroupPattern, int):
     """Attempt to parse an ArgumentGroup from a str.
 
@@ -388,13 +430,8 @@ def parse_commands(content: str) -> (str, list[str], int):
     return command, sub_commands, offset
 
 
-def parse_command_pattern(content: str) -> CommandPattern:
-    """Attempt to parse a CommandPattern from a str.
-
-    :param content: the content to parse.
-    :return: the parsed CommandPattern.
-    :raise: PatternError on any error parsing input.
-    """
+def __parse_command_pattern(content: str) -> CommandPattern:
+    """Same as `parse_command_pattern`, without the cache."""
     if len(content) == 0:
         raise PatternError("content may not be empty")
 
@@ -432,3 +469,20 @@ def parse_command_pattern(content: str) -> CommandPattern:
         raise PatternError(f"unexpected value '{content[offset]}'")
 
     return CommandPattern(command, sub_commands, arguments, groups)
+
+
+# the same command patterns are repeated across the precise and imprecise entries of an undo file
+COMMAND_PATTERN_CACHE = lru.LRUCache(__parse_command_pattern)
+
+
+def parse_command_pattern(content: str) -> CommandPattern:
+    """Attempt to parse a CommandPattern from a str.
+
+    The parsed pattern is immutable and may be shared with any other caller parsing the same string, use
+    `CommandPattern.with_arguments` to get a pattern with more arguments.
+
+    :param content: the content to parse.
+    :return: the parsed CommandPattern.
+    :raise: PatternError on any error parsing input.
+    """
+    return COMMAND_PATTERN_CACHE(content)
@@ -1,11 +1,18 @@
-import argparse
 import logging
 import os
 import shlex
+import time
+import typing
 
 import toml
 
+from undo import analysis
+from undo import expand
+from undo import expression
+from undo import fs
 from undo import pattern
+from undo import watch
+from undo.cache import Cache, file_signature
 from undo.pattern import ArgumentPattern
 
 
@@ -13,7 +20,6 @@ class RegistrySpecError(ValueError):
     """An error with an undo file specification."""
 
 
-# todo: maybe add caching? might not make much sense for a command line tool
 class __UndoRegistry:
     __SHELLS = "supported-shells"
     __COMMON = "common"
@@ -22,11 +28,19 @@ class __UndoRegistry:
     __ENTRY_CMD = "cmd"
     __ENTRY_UNDO = "undo"
     __ENTRY_PRECISE = "precise"
+    __ENTRY_PATTERN = "pattern"
+    __ENTRY_MATCHER = "matcher"
+    __ENTRY_ANALYSIS = "analysis"
+    __ENTRY_UNBOUND = "unbound"
 
     def __init__(self, file):
         """A registry of command patterns to undo patterns.
 
+        All command patterns and undo expressions are parsed, and each command pattern compiled to a matcher, when the
+        registry is created, so a registry can be cached and reused without parsing them again.
+
         :param file: a path to a file or file-like object with the toml contents describing the registry.
+        :raise RegistrySpecError: if the registry is missing required keys or contains an invalid pattern or expression.
         """
 
         data = toml.load(file)
@@ -45,7 +59,34 @@ class __UndoRegistry:
         except KeyError as err:
             raise RegistrySpecError(f"missing required key {err}")
 
-    def __parse_common_arguments(self, common: str) -> list[ArgumentPattern]:
+        for entry in self.__entries:
+            try:
+                cmd_pattern = pattern.parse_command_pattern(entry[self.__ENTRY_CMD])
+                cmd_pattern = cmd_pattern.with_arguments(self.__common)
+
+                entry[self.__ENTRY_PATTERN] = cmd_pattern
+                entry[self.__ENTRY_MATCHER] = pattern.pattern_to_matcher(cmd_pattern)
+                entry[self.__ENTRY_UNDO] = expand.UndoTemplate(entry[self.__ENTRY_UNDO], ("%", "%"))
+            except (pattern.PatternError, expression.ExpressionError, ValueError) as err:
+                raise RegistrySpecError(f"bad entry '{entry[self.__ENTRY_CMD]}': {err}")
+
+            entry[self.__ENTRY_ANALYSIS] = analysis.analyze(entry[self.__ENTRY_UNDO])
+
+            # an undo requiring an identifier its pattern never binds can never be expanded completely
+            entry[self.__ENTRY_UNBOUND] = entry[self.__ENTRY_ANALYSIS].required - entry[self.__ENTRY_MATCHER].identifiers
+
+            if entry[self.__ENTRY_UNBOUND]:
+                logging.warning(f"entry '{entry[self.__ENTRY_CMD]}' requires identifiers its pattern never binds: "
+                                f"{', '.join(sorted(entry[self.__ENTRY_UNBOUND]))}")
+
+        logging.debug(f"folded {sum(entry[self.__ENTRY_UNDO].folded for entry in self.__entries)} constant "
+                      f"expression(s) in {len(self.__entries)} undo pattern(s)")
+
+        # entries are indexed by their command and sub-commands, and those with the same command and sub-commands are
+        # matched together, so each command is only checked against the entries which could match it
+        self.__trie = pattern.MatcherTrie([entry[self.__ENTRY_MATCHER] for entry in self.__entries])
+
+    def __parse_common_arguments(self, common: str) -> tuple[ArgumentPattern, ...]:
         """Parse all arguments in the common field.
 
         :param common: the string containing all teh argument patterns.
@@ -70,48 +111,212 @@ class __UndoRegistry:
 
         return is_supported
 
-    def resolve(self, command: str, allow_imprecise: bool) -> list[(dict, str)]:
+    def commands(self) -> dict[str, list[int]]:
+        """Map the command of each entry in the registry to the indices of the entries for that command."""
+        return self.__trie.commands()
+
+    def resolve(self, command: str, allow_imprecise: bool,
+                entries: typing.Optional[list[int]] = None) -> list[(dict, str)]:
         """Resolve the given command with the registered undo pattern.
 
         :param command: the command to register.
         :param allow_imprecise: include imprecise undo patterns in the returned results.
+        :param entries: the indices of the only entries to try matching against, or None to try all entries.
         :return: the matching undo pattern.
         """
         cmd, *argv = shlex.split(command)
 
         undos: list[(dict, str)] = list()
+        checked: list[(analysis.Analysis, dict)] = list()
 
-        for entry in self.__entries:
-            cmd_pattern = pattern.parse_command_pattern(entry[self.__ENTRY_CMD])
-            undo_pattern = entry[self.__ENTRY_UNDO]
-            precise = entry[self.__ENTRY_PRECISE]
-
-            cmd_pattern.arguments += self.__common
-            parser = pattern.pattern_to_argparse(cmd_pattern)
-
-            # todo: consider logging non-matching command?
-            if parser.prog == cmd:
-                try:
-                    namespace = parser.parse_args(argv)
-
-                    if precise or not precise and allow_imprecise:
-                        undos.append((vars(namespace), undo_pattern))
-                        logging.info(f"command '{command}' matched pattern '{entry[self.__ENTRY_CMD]}'")
-                    else:
-                        logging.debug(f"command '{command}' matched pattern '{entry[self.__ENTRY_CMD]}' but was not "
-                                      f"precise enough")
-                except argparse.ArgumentError as err:
-                    logging.debug(f"command '{command}' does not match '{entry[self.__ENTRY_CMD]}': {err}'")
+        for i, values in self.__trie.match(cmd, argv):
+            if entries is not None and i not in entries:
+                continue
+
+            entry = self.__entries[i]
+
+            if entry[self.__ENTRY_UNBOUND]:
+                logging.debug(f"command '{command}' matched pattern '{entry[self.__ENTRY_CMD]}' but its undo requires "
+                              f"identifiers the pattern never binds")
+            elif entry[self.__ENTRY_PRECISE] or allow_imprecise:
+                undos.append((values, entry[self.__ENTRY_UNDO]))
+                checked.append((entry[self.__ENTRY_ANALYSIS], values))
+                logging.info(f"command '{command}' matched pattern '{entry[self.__ENTRY_CMD]}'")
+            else:
+                logging.debug(f"command '{command}' matched pattern '{entry[self.__ENTRY_CMD]}' but was not "
+                              f"precise enough")
+
+        # every filesystem check the matched undos are certain to make is done together before any are expanded, the
+        # paths are only evaluated if there is a stat cache to prefetch them into
+        fs.prefetch(path for entry_analysis, values in checked for path in entry_analysis.iter_check_paths(values))
 
         return undos
 
 
+def __load_registry(path: str, cache: typing.Optional[Cache],
+                    signature: typing.Optional[tuple] = None) -> __UndoRegistry:
+    """Load the registry for the given undo file, using the cached registry if it is still valid.
+
+    :param path: the path to the undo file.
+    :param cache: the cache to load the registry from and store it in, or None to always parse the file.
+    :param signature: the already known signature of the undo file.
+    :return: the loaded registry.
+    """
+    if cache is None:
+        return __UndoRegistry(path)
+
+    if signature is None:
+        signature = file_signature(path)
+
+    registry = cache.load(path, signature)
+
+    if registry is None:
+        registry = __UndoRegistry(path)
+        cache.store(path, signature, registry)
+    else:
+        logging.debug(f"loaded cached registry for '{path}'")
+
+    return registry
+
+
+def __try_load_registry(path: str, cache: typing.Optional[Cache],
+                        signature: typing.Optional[tuple] = None) -> typing.Optional[__UndoRegistry]:
+    """Load the registry for the given undo file, logging rather than raising any errors in the file."""
+    try:
+        return __load_registry(path, cache, signature)
+    except toml.TomlDecodeError as err:
+        logging.error(f"there was an issue deserializing toml file")
+        logging.error(err)
+    except RegistrySpecError as err:
+        logging.error(f"there was an issue with undo file '{path}': {err}")
+
+    return None
+
+
+def load_registry(path: str, cache: typing.Optional[Cache] = None) -> typing.Optional[__UndoRegistry]:
+    """Load the registry for the given undo file, logging rather than raising any errors in the file.
+
+    :param path: the path to the undo file.
+    :param cache: the cache to load the registry from and store it in, or None to always parse the file.
+    :return: the loaded registry, or None if the file could not be loaded.
+    """
+    try:
+        return __try_load_registry(path, cache)
+    except OSError as err:
+        logging.error(f"could not read undo file '{path}': {err}")
+
+    return None
+
+
+def __build_dir_index(include_dir: str, cache: Cache) -> (dict[str, tuple], dict[str, list[(str, list[int])]],
+                                                            dict[str, __UndoRegistry]):
+    """Build the command index for the undo files in the given directory.
+
+    :param include_dir: the directory to index.
+    :param cache: the cache to load registries from.
+    :return: the signature of every file in the directory, including those which could not be loaded or have no entries;
+        a map of command names to the name and matching entry indices of each undo file with one or more entries for
+        that command, in directory listing order; and the registry loaded for the path of each file.
+    """
+    logging.debug(f"building command index for '{include_dir}'")
+    signatures: dict[str, tuple] = dict()
+    index: dict[str, list[(str, list[int])]] = dict()
+    registries: dict[str, __UndoRegistry] = dict()
+
+    for path in os.listdir(include_dir):
+        full_path = os.path.join(include_dir, path)
+
+        if not os.path.isfile(full_path):
+            continue
+
+        signature = file_signature(full_path)
+        signatures[path] = signature
+
+        registry = __try_load_registry(full_path, cache, signature)
+
+        if registry is None:
+            continue
+
+        registries[full_path] = registry
+
+        for command, entries in registry.commands().items():
+            index.setdefault(command, list()).append((path, entries))
+
+    return signatures, index, registries
+
+
+def __is_stale(path: str, signature: tuple) -> bool:
+    """Check if the undo file at path has changed since it was indexed with the given signature."""
+    try:
+        return file_signature(path) != signature
+    except FileNotFoundError:
+        return True
+
+
+def __load_dir_index(include_dir: str, cache: Cache) -> (dict[str, list[(str, list[int])]],
+                                                         dict[str, __UndoRegistry]):
+    """Load the command index for the given directory, rebuilding it if the directory or any file in it has changed.
+
+    Files are added or removed by modifying the directory, but a file edited in place only changes its own signature,
+    so the signature of every indexed file is checked without loading any of them.
+
+    :param include_dir: the directory to index.
+    :param cache: the cache to load the index from and store it in.
+    :return: the command index for the directory, and the registries loaded to build it which is empty if the index was
+        loaded from the cache.
+    """
+    signature = file_signature(include_dir)
+    cached = cache.load(include_dir, signature)
+
+    if cached is not None:
+        signatures, index = cached
+
+        if not any(__is_stale(os.path.join(include_dir, path), path_signature)
+                   for path, path_signature in signatures.items()):
+            return index, dict()
+
+        logging.debug(f"command index for '{include_dir}' is stale")
+
+    signatures, index, registries = __build_dir_index(include_dir, cache)
+    cache.store(include_dir, signature, (signatures, index))
+
+    return index, registries
+
+
+def __list_dir_candidates(include_dir: str, cmd: str, cache: typing.Optional[Cache]) -> typing.Iterator[
+        tuple[str, typing.Optional[list[int]], typing.Optional[__UndoRegistry]]]:
+    """Find the undo files in the given directory which may have entries for the given command.
+
+    :param include_dir: the directory to search.
+    :param cmd: the name of the command being resolved.
+    :param cache: the cache holding the directory's command index, or None to list every file in the directory.
+    :return: the path to each candidate file, the indices of its entries for cmd or None if all entries must be
+        checked, and its registry if it was already loaded while indexing the directory.
+    """
+    if cache is None:
+        for path in os.listdir(include_dir):
+            full_path = os.path.join(include_dir, path)
+
+            if os.path.isfile(full_path):
+                yield full_path, None, None
+
+        return
+
+    index, registries = __load_dir_index(include_dir, cache)
+
+    for path, entries in index.get(cmd, list()):
+        full_path = os.path.join(include_dir, path)
+
+        yield full_path, entries, registries.get(full_path)
+
+
 def __resolve_in_dir(include_dir: str, command: str, search_all: bool, allow_imprecise: bool,
-                     shell: str) -> list[(dict, str)]:
+                     shell: str, cache: typing.Optional[Cache] = None) -> list[(dict, str)]:
     """Attempt to resolve the command from the undo files located in the given directory path.
 
     Please note that this method will not delve into sub directories, and will only search files with the 'undo'
-    extension.
+    extension. When a cache is given, only the undo files listed in the directory's command index for the command are
+    loaded.
 
     todo: allow for a README.md without syntax errors
       ignore all non-toml files
@@ -120,30 +325,24 @@ def __resolve_in_dir(include_dir: str, command: str, search_all: bool, allow_imp
     :param include_dir: the directory to search.
     :param command: the command to resolve.
     :param search_all: allow for finding multiple undo commands across all commands.
+    :param cache: the cache to use for loading registries, or None to disable caching.
     :return: the resolved string command, or None if no appropriate command could be found.
     """
     logging.info(f"resolving directory '{include_dir}'")
     undos = list()
 
-    for path in os.listdir(include_dir):
-        full_path = os.path.join(include_dir, path)
-
-        if not os.path.isfile(full_path):
-            continue
+    cmd = shlex.split(command)[0]
 
+    for full_path, entries, registry in __list_dir_candidates(include_dir, cmd, cache):
         logging.info(f"resolving in file '{full_path}'")
 
-        try:
-            registry = __UndoRegistry(full_path)
-        except toml.TomlDecodeError as err:
-            logging.error(f"there was an issue deserializing toml file")
-            logging.error(err)
-            continue
+        if registry is None:
+            registry = __try_load_registry(full_path, cache)
 
-        if not registry.is_shell_supported(shell):
+        if registry is None or not registry.is_shell_supported(shell):
             continue
 
-        resolution = registry.resolve(command, allow_imprecise)
+        resolution = registry.resolve(command, allow_imprecise, entries)
 
         if resolution:
             undos += resolution
@@ -155,7 +354,7 @@ def __resolve_in_dir(include_dir: str, command: str, search_all: bool, allow_imp
 
 
 def resolve(command: str, include_dirs: list[str], search_all: bool, allow_imprecise: bool,
-            shell: str) -> list[(dict, str)]:
+            shell: str, cache: typing.Optional[Cache] = None) -> list[(dict, str)]:
     """Resolve the given command to the appropriate undo command.
 
     If search_all is False, resolve will return the undo patterns in the first file found with one or more matching undo
@@ -166,14 +365,19 @@ def resolve(command: str, include_dirs: list[str], search_all: bool, allow_impre
     :param search_all: search all files rather than stopping at hte first file with a matching undo pattern.
     :param allow_imprecise: include imprecise undo patterns in the returned results.
     :param shell: the shell to use when checking if the current shell is supported by the undo registry.
+    :param cache: the cache to use for loading registries, or None to disable caching.
     :return: the resolved string command, or None if no appropriate command could be found.
     """
     undos = list()
 
+    if not shlex.split(command):
+        logging.debug("there is no command to resolve")
+        return undos
+
     for include_dir in include_dirs:
 
         if os.path.exists(include_dir):
-            resolutions = __resolve_in_dir(include_dir, command, search_all, allow_imprecise, shell)
+            resolutions = __resolve_in_dir(include_dir, command, search_all, allow_imprecise, shell, cache)
 
             if resolutions:
                 undos += resolutions
@@ -184,3 +388,148 @@ def resolve(command: str, include_dirs: list[str], search_all: bool, allow_impre
             logging.debug(f"include directory '{include_dir}' does not exists")
 
     return undos
+
+
+class Resolver:
+    def __init__(self, include_dirs: list[str], cache: typing.Optional[Cache] = None,
+                 watcher: typing.Optional[watch.Watcher] = None):
+        """Resolve commands against undo files which are loaded once and kept in memory by a long-lived process.
+
+        Rather than checking every undo file for changes when resolving, the include directories are watched and only
+        the registries of the files reported as changed are reloaded.
+
+        :param include_dirs: the directories to use for undo resolution, which are made absolute.
+        :param cache: the cache to use for loading registries, or None to disable caching.
+        :param watcher: the watcher reporting changes to the include directories, defaults to `watch.create_watcher`.
+        """
+        # the changed paths reported by the watcher are made absolute to be matched against the include directories
+        self.include_dirs = [os.path.abspath(i) for i in include_dirs]
+
+        self.__cache = cache
+        self.__watcher = watch.create_watcher(self.include_dirs) if watcher is None else watcher
+
+        # the registry of each file (or None if it could not be loaded) in each include directory, and the names of the
+        # files with entries for each command
+        self.__registries: dict[str, dict[str, typing.Any]] = dict()
+        self.__indices: dict[str, dict[str, list[(str, list[int])]]] = dict()
+
+        self.reloads = 0
+        self.last_reload_seconds = 0.0
+        self.total_reload_seconds = 0.0
+
+        for include_dir in self.include_dirs:
+            self.__load_dir(include_dir)
+
+    def __load_file(self, include_dir: str, name: str):
+        path = os.path.join(include_dir, name)
+        registries = self.__registries[include_dir]
+
+        if os.path.isfile(path):
+            logging.info(f"loading undo file '{path}'")
+            registries[name] = load_registry(path, self.__cache)
+        else:
+            registries.pop(name, None)
+
+        self.reloads += 1
+
+    def __load_dir(self, include_dir: str):
+        self.__registries[include_dir] = dict()
+
+        try:
+            names = os.listdir(include_dir)
+        except OSError as err:
+            logging.debug(f"could not list include directory '{include_dir}': {err}")
+            names = list()
+
+        for name in names:
+            self.__load_file(include_dir, name)
+
+        self.__index_dir(include_dir)
+
+    def __index_dir(self, include_dir: str):
+        index: dict[str, list[(str, list[int])]] = dict()
+
+        for name, registry in self.__registries[include_dir].items():
+            if registry is not None:
+                for command, entries in registry.commands().items():
+                    index.setdefault(command, list()).append((name, entries))
+
+        self.__indices[include_dir] = index
+
+    def refresh(self) -> int:
+        """Reload the registries of every undo file changed since the last refresh.
+
+        :return: the amount of changed paths.
+        """
+        changed = self.__watcher.poll()
+
+        if not changed:
+            return 0
+
+        start = time.perf_counter()
+        changed_dirs = set()
+
+        for path in map(os.path.abspath, changed):
+            if path in self.__registries:
+                self.__load_dir(path)
+            elif (include_dir := os.path.dirname(path)) in self.__registries:
+                self.__load_file(include_dir, os.path.basename(path))
+                changed_dirs.add(include_dir)
+
+        for include_dir in changed_dirs:
+            self.__index_dir(include_dir)
+
+        self.last_reload_seconds = time.perf_counter() - start
+        self.total_reload_seconds += self.last_reload_seconds
+
+        logging.debug(f"reloaded {len(changed)} changed path(s) in {self.last_reload_seconds * 1000:.3f}ms")
+
+        return len(changed)
+
+    def stats(self) -> dict[str, typing.Any]:
+        """Get statistics about the reloads of changed undo files for monitoring."""
+        return {
+            "watcher": type(self.__watcher).__name__,
+            "registries": sum(len(registries) for registries in self.__registries.values()),
+            "reloads": self.reloads,
+            "last_reload_ms": self.last_reload_seconds * 1000,
+            "total_reload_ms": self.total_reload_seconds * 1000,
+        }
+
+    def resolve(self, command: str, search_all: bool, allow_imprecise: bool, shell: str) -> list[(dict, str)]:
+        """Resolve the given command to the appropriate undo command, see `resolve`.
+
+        :param command: the command to resolve.
+        :param search_all: search all files rather than stopping at the first file with a matching undo pattern.
+        :param allow_imprecise: include imprecise undo patterns in the returned results.
+        :param shell: the shell to use when checking if the current shell is supported by the undo registry.
+        :return: the env and undo pattern of each matching entry.
+        """
+        self.refresh()
+
+        undos = list()
+
+        if not (argv := shlex.split(command)):
+            logging.debug("there is no command to resolve")
+            return undos
+
+        for include_dir in self.include_dirs:
+            for name, entries in self.__indices[include_dir].get(argv[0], list()):
+                registry = self.__registries[include_dir][name]
+
+                if not registry.is_shell_supported(shell):
+                    continue
+
+                resolution = registry.resolve(command, allow_imprecise, entries)
+
+                if resolution:
+                    undos += resolution
+
+                    if not search_all:
+                        return undos
+
+        return undos
+
+    def close(self):
+        """Stop watching the include directories."""
+        self.__watcher.close()
@@ -0,0 +1,213 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import time
+import typing
+
+# see inotify(7)
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+               | _IN_DELETE_SELF | _IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class WatcherError(OSError):
+    """A watcher could not be created."""
+
+
+class Watcher:
+    """Report changes to the files directly inside a set of directories.
+
+    The base watcher never reports any changes, for processes which do not expect the undo files to change while they
+    run.
+    """
+
+    def __init__(self, dirs: list[str]):
+        self.dirs = list(dirs)
+
+    def poll(self) -> set[str]:
+        """Get the paths changed since the last poll without blocking.
+
+        :return: the paths of the files which were created, modified, or removed, or the path of a directory when the
+            directory itself was created or removed, or all of its files may have changed.
+        """
+        return set()
+
+    def close(self):
+        """Release any resources held by the watcher."""
+
+
+class InotifyWatcher(Watcher):
+    def __init__(self, dirs: list[str]):
+        """Watch directories with Linux inotify, so that polling for changes is a single non-blocking read.
+
+        A directory which does not exist (or is removed) is watched again as soon as it is found while polling.
+
+        :param dirs: the directories to watch.
+        :raise WatcherError: if inotify is not available.
+        """
+        super().__init__(dirs)
+
+        try:
+            self.__libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            inotify_init1 = self.__libc.inotify_init1
+        except (OSError, AttributeError) as err:
+            raise WatcherError(f"inotify is not available: {err}")
+
+        self.__fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+        if self.__fd < 0:
+            raise WatcherError(f"inotify_init1: {os.strerror(ctypes.get_errno())}")
+
+        self.__watches: dict[int, str] = dict()
+
+        self.__add_missing_watches()
+
+    def __add_missing_watches(self) -> set[str]:
+        """Try to watch every directory which is not yet watched, returning those which are now watched."""
+        added = set()
+
+        for path in set(self.dirs).difference(self.__watches.values()):
+            wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(path), _WATCH_MASK)
+
+            if wd < 0:
+                logging.debug(f"could not watch '{path}': {os.strerror(ctypes.get_errno())}")
+            else:
+                self.__watches[wd] = path
+                added.add(path)
+
+        return added
+
+    def __read_events(self) -> typing.Iterator[tuple[int, int, str]]:
+        while True:
+            try:
+                data = os.read(self.__fd, 64 * 1024)
+            except BlockingIOError:
+                return
+
+            offset = 0
+
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+
+                yield wd, mask, name
+
+    def poll(self) -> set[str]:
+        changed = set()
+
+        for wd, mask, name in self.__read_events():
+            if mask & _IN_Q_OVERFLOW:
+                logging.warning("inotify queue overflowed, treating every directory as changed")
+                changed.update(self.__watches.values())
+            elif (path := self.__watches.get(wd)) is None:
+                continue
+            elif mask & (_IN_IGNORED | _IN_DELETE_SELF | _IN_MOVE_SELF):
+                # the watch is removed along with the directory, so it will be watched again once it is recreated
+                if mask & _IN_IGNORED:
+                    del self.__watches[wd]
+                elif mask & _IN_MOVE_SELF:
+                    # a moved directory is still watched at its new path, so its watch is removed as if it were deleted
+                    # rather than reporting its later changes against a path it is no longer at
+                    self.__libc.inotify_rm_watch(self.__fd, wd)
+                    del self.__watches[wd]
+
+                changed.add(path)
+            elif name:
+                changed.add(os.path.join(path, name))
+
+        changed.update(self.__add_missing_watches())
+
+        return changed
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+
+
+class PollingWatcher(Watcher):
+    def __init__(self, dirs: list[str], interval: float = 1.0):
+        """Watch directories by comparing the signature of every file with its signature from the last scan.
+
+        :param dirs: the directories to watch.
+        :param interval: the minimum amount of seconds between two scans, polling more often reports no changes.
+        """
+        super().__init__(dirs)
+
+        self.interval = interval
+
+        self.__last_scan = time.monotonic()
+        self.__snapshots = {path: self.__scan(path) for path in self.dirs}
+
+    @staticmethod
+    def __scan(path: str) -> typing.Optional[dict[str, tuple]]:
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return None
+
+        snapshot = dict()
+
+        for name in names:
+            try:
+                st = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+
+            snapshot[name] = st.st_mtime_ns, st.st_size, st.st_ino
+
+        return snapshot
+
+    def poll(self) -> set[str]:
+        if time.monotonic() - self.__last_scan < self.interval:
+            return set()
+
+        self.__last_scan = time.monotonic()
+        changed = set()
+
+        for path in self.dirs:
+            old, new = self.__snapshots[path], self.__scan(path)
+            self.__snapshots[path] = new
+
+            if old is None or new is None:
+                if old is not new:
+                    changed.add(path)
+
+                continue
+
+            changed.update(os.path.join(path, name) for name in old.keys() | new.keys()
+                           if old.get(name) != new.get(name))
+
+        return changed
+
+
+def create_watcher(dirs: list[str]) -> Watcher:
+    """Create an InotifyWatcher, or a PollingWatcher if inotify is not available.
+
+    :param dirs: the directories to watch.
+    :return: the created watcher.
+    """
+    try:
+        return InotifyWatcher(dirs)
+    except WatcherError as err:
+        logging.info(f"falling back to polling for changes: {err}")
+
+        return PollingWatcher(dirs)